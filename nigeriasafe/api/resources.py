@@ -1,22 +1,83 @@
-from django.db import models
 from tastypie.resources import ModelResource
 from tastypie import fields
 from tastypie.authorization import Authorization
+from tastypie.exceptions import BadRequest
 from base.models import Patient, SOSAlert
+from base.routers import read_replica
 
-class PatientResource(ModelResource):
+
+class SparseFieldsetMixin:
+    """Let clients ask for a subset of fields with ``?fields=id,latitude,longitude``.
+
+    Columns and relations that were not asked for are neither loaded from the
+    database nor dehydrated. The parameter only applies to the resource named
+    in the URL, so a nested full resource is always returned whole.
+    """
+
+    def requested_fields(self, request):
+        if request is None or 'fields' not in getattr(request, 'GET', {}):
+            return None
+        match = getattr(request, 'resolver_match', None)
+        if match is None or match.kwargs.get('resource_name') != self._meta.resource_name:
+            return None
+        requested = {name.strip() for name in request.GET['fields'].split(',') if name.strip()}
+        unknown = requested - set(self.fields)
+        if unknown:
+            raise BadRequest(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return requested
+
+    def get_object_list(self, request):
+        queryset = super().get_object_list(request)
+        requested = self.requested_fields(request)
+        if not requested:
+            return queryset
+        columns, relations = ['pk'], []
+        for name in requested:
+            field = self.fields[name]
+            if isinstance(field.attribute, str):
+                (relations if field.is_related else columns).append(field.attribute)
+        # Only follow the joins for relations the client asked for
+        return queryset.select_related(None).select_related(*relations).only(*columns, *relations)
+
+    def full_dehydrate(self, bundle, for_list=False):
+        requested = self.requested_fields(bundle.request)
+        if not requested:
+            return super().full_dehydrate(bundle, for_list=for_list)
+        for name in self.fields:
+            if name not in requested:
+                continue
+            field = self.fields[name]
+            if field.dehydrated_type == 'related':
+                field.api_name = self._meta.api_name
+                field.resource_name = self._meta.resource_name
+            bundle.data[name] = field.dehydrate(bundle, for_list=for_list)
+            method = getattr(self, f'dehydrate_{name}', None)
+            if method:
+                bundle.data[name] = method(bundle)
+        return self.dehydrate(bundle)
+
+
+class ReadReplicaMixin:
+    """Serve GET requests from the read replica when one is configured."""
+
+    def wrap_view(self, view):
+        return read_replica(super().wrap_view(view))
+
+
+class PatientResource(ReadReplicaMixin, SparseFieldsetMixin, ModelResource):
     class Meta:
         queryset = Patient.objects.all()
         resource_name = 'patient'
         authorization = Authorization()
         excludes = ['created_at', 'updated_at']
 
-class SOSAlertResource(ModelResource):
+class SOSAlertResource(ReadReplicaMixin, SparseFieldsetMixin, ModelResource):
     patient = fields.ForeignKey(PatientResource, 'patient', null=True, blank=True, full=True)
 
     class Meta:
-        queryset = SOSAlert.objects.all()
+        # Patients are joined in the list query instead of fetched one per alert
+        queryset = SOSAlert.objects.select_related('patient')
         resource_name = 'sos_alert'
         authorization = Authorization()
         always_return_data = True
-        allowed_methods = ['get', 'post']
\ No newline at end of file
+        allowed_methods = ['get', 'post']
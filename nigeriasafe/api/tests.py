@@ -1,3 +1,86 @@
+import datetime
+import json
+
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from base.models import Patient, SOSAlert
+from base.tests import PerformanceBudgetMixin, seed_volumes
+
+
+def make_alerts(count, start=0):
+    for i in range(start, start + count):
+        user = User.objects.create_user(username=f'patient{i}')
+        patient = Patient.objects.create(
+            user=user, full_name=f'Patient {i}', date_of_birth=datetime.date(1990, 1, 1),
+            weight=70, height=175, address='1 Marina, Lagos', phone_number='08000000000',
+            emergency_contact_name='Kin', emergency_contact_phone='08000000001',
+            emergency_contact_relationship='Sibling',
+        )
+        SOSAlert.objects.create(patient=patient, latitude='6.524400', longitude='3.379200')
+
+
+class SOSAlertResourceTests(TestCase):
+    url = '/api/v1/sos_alert/'
+
+    def get_json(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content)
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        make_alerts(5)
+        # One COUNT for the paginator, one SELECT joining the patients
+        with self.assertNumQueries(2):
+            data = self.get_json(f'{self.url}?limit=5')
+        self.assertEqual(len(data['objects']), 5)
+        self.assertEqual(data['objects'][0]['patient']['full_name'], 'Patient 4')
+
+        make_alerts(25, start=5)
+        with self.assertNumQueries(2):
+            data = self.get_json(f'{self.url}?limit=30')
+        self.assertEqual(len(data['objects']), 30)
+
+    def test_sparse_fieldset(self):
+        make_alerts(3)
+        with self.assertNumQueries(2):
+            data = self.get_json(f'{self.url}?fields=id,latitude,longitude,status')
+        self.assertEqual(len(data['objects']), 3)
+        for alert in data['objects']:
+            self.assertEqual(set(alert), {'id', 'latitude', 'longitude', 'status'})
+
+        detail = self.get_json(f"{self.url}{data['objects'][0]['id']}/?fields=status,patient")
+        self.assertEqual(set(detail), {'status', 'patient'})
+        self.assertIn('medical_record_number', detail['patient'])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(f'{self.url}?fields=id,password')
+        self.assertEqual(response.status_code, 400)
+
+
+class PatientResourceTests(TestCase):
+    def test_sparse_fieldset(self):
+        make_alerts(2)
+        response = self.client.get('/api/v1/patient/?fields=full_name,medical_record_number')
+        self.assertEqual(response.status_code, 200)
+        for patient in json.loads(response.content)['objects']:
+            self.assertEqual(set(patient), {'full_name', 'medical_record_number'})
+
+
+class ResourceBudgetTests(PerformanceBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_volumes()
+
+    def test_list_and_detail_budgets(self):
+        alert = SOSAlert.objects.order_by('pk').first()
+        patient = Patient.objects.order_by('pk').first()
+        for url, queries in (
+            ('/api/v1/sos_alert/?limit=100', 2),
+            ('/api/v1/sos_alert/?limit=100&fields=id,latitude,longitude,status', 2),
+            (f'/api/v1/sos_alert/{alert.id}/', 1),
+            ('/api/v1/patient/?limit=100', 2),
+            (f'/api/v1/patient/{patient.id}/', 1),
+        ):
+            with self.subTest(url=url):
+                self.assertBudget(url, queries=queries)
@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Patient, SOSAlert, Task, Volunteer
+from . import outbox
+from .models import Notification, Patient, SOSAlert, SOSAlertArchive, Task, Volunteer
 admin.site.register(Patient)
 admin.site.register(Volunteer)
 
@@ -12,8 +13,26 @@ class SOSAlertAdmin(admin.ModelAdmin):
 	list_filter = ('status', 'created_at')
 	search_fields = ('patient__full_name', 'message')
 
+@admin.register(SOSAlertArchive)
+class SOSAlertArchiveAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'patient', 'resolved_at', 'archived_at')
+    list_filter = ('archived_at',)
+    search_fields = ('patient__full_name', 'message')
+
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
     list_display = ('title', 'urgency', 'location', 'created_by', 'isActive', 'created_at')
     list_filter = ('urgency', 'isActive', 'created_at')
     search_fields = ('title', 'description', 'location')
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'recipients', 'last_error')
+    actions = ['requeue']
+
+    @admin.action(description='Send again (dead letters and pending emails)')
+    def requeue(self, request, queryset):
+        count = outbox.requeue(queryset)
+        self.message_user(request, f'{count} emails queued again.')
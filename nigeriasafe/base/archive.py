@@ -0,0 +1,105 @@
+"""Move long-resolved SOS alerts out of the hot table.
+
+``base_sosalert`` holds the alerts that dispatchers work with. Alerts that
+have been resolved for more than ``SOS_ARCHIVE_AFTER_DAYS`` are moved to
+``SOSAlertArchive`` by ``archive_chunk``, which the ``archive_alerts``
+command runs on a schedule. The archive row keeps the alert's id and
+columns.
+
+Each chunk is a single transaction: copy the rows, then delete them from the
+hot table. An interrupted run therefore leaves every alert in exactly one of
+the two tables, and the next run carries on with whatever is still due.
+Between chunks the write lock is released, so SOS writes are not blocked.
+
+Live views (dashboard, monitor, dispatch) query ``SOSAlert`` and only see
+hot rows. The dashboard counters describe the hot table too. Reports that
+need everything call ``all_alerts``, which is a UNION ALL of both tables.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import stats
+from .models import SOSAlert, SOSAlertArchive
+
+
+# Columns copied as they are; archived_at is filled in on insert
+COPIED_FIELDS = [
+    field.attname for field in SOSAlertArchive._meta.concrete_fields if field.name != 'archived_at'
+]
+
+
+def due(days=None, now=None):
+    """Hot alerts resolved more than ``days`` ago, longest-resolved first.
+
+    The order matches the (status, resolved_at) index, so each chunk reads
+    the front of the index and no sort is needed.
+    """
+    days = settings.SOS_ARCHIVE_AFTER_DAYS if days is None else days
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=days)
+    return (
+        SOSAlert.objects
+        .filter(status=SOSAlert.STATUS_RESOLVED, resolved_at__lt=cutoff)
+        .order_by('resolved_at', 'id')
+    )
+
+
+def archive_chunk(days=None, chunk_size=None, now=None):
+    """Move up to ``chunk_size`` due alerts in one transaction; return how many moved."""
+    chunk_size = chunk_size or settings.SOS_ARCHIVE_CHUNK_SIZE
+    with transaction.atomic():
+        rows = list(due(days, now).values(*COPIED_FIELDS)[:chunk_size])
+        if not rows:
+            return 0
+        SOSAlertArchive.objects.bulk_create([SOSAlertArchive(**row) for row in rows], ignore_conflicts=True)
+        ids = [row['id'] for row in rows]
+        # An explicit raw DELETE that skips the delete signals on purpose:
+        # per-row post_delete handlers would cost several queries per alert,
+        # a resolved alert has no open work to update, and the counters are
+        # adjusted below. Nothing else references an alert row.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {connection.ops.quote_name(SOSAlert._meta.db_table)} WHERE id IN '
+                f'({", ".join(["%s"] * len(ids))})',
+                ids,
+            )
+        stats.adjust({
+            SOSAlert._meta.model_name: -len(ids),
+            f'{SOSAlert._meta.model_name}.status.{SOSAlert.STATUS_RESOLVED}': -len(ids),
+        })
+    return len(ids)
+
+
+def run(days=None, chunk_size=None, limit=None, pause=0, progress=None):
+    """Archive due alerts chunk by chunk until none are left or ``limit`` have moved."""
+    now = timezone.now()
+    moved = 0
+    while limit is None or moved < limit:
+        size = chunk_size or settings.SOS_ARCHIVE_CHUNK_SIZE
+        if limit is not None:
+            size = min(size, limit - moved)
+        count = archive_chunk(days, size, now)
+        if not count:
+            break
+        moved += count
+        if progress:
+            progress(moved)
+        if pause:
+            time.sleep(pause)
+    return moved
+
+
+def all_alerts(*columns, **filters):
+    """Value tuples of ``columns`` from hot and archived alerts matching ``filters``.
+
+    Both tables share column names, so the filters and columns may be any
+    lookups the two models have in common. The result can be ordered and
+    sliced, but not filtered further.
+    """
+    # Meta.ordering is cleared: SQLite allows ORDER BY only on the whole union
+    hot = SOSAlert.objects.filter(**filters).order_by().values_list(*columns)
+    cold = SOSAlertArchive.objects.filter(**filters).order_by().values_list(*columns)
+    return hot.union(cold, all=True)
@@ -0,0 +1,36 @@
+"""Sign in with an email address instead of a username.
+
+Addresses are compared case-insensitively on ``LOWER(email)``, which the
+``auth_user_email_lower_idx`` expression index (migration 0011) serves. Finding
+the user and checking the password therefore costs one indexed query.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.functions import Lower
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def users_with_email(email):
+    UserModel = get_user_model()
+    return UserModel._default_manager.annotate(email_lower=Lower('email')).filter(
+        email_lower=normalize_email(email)
+    )
+
+
+class EmailBackend(ModelBackend):
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if not email or password is None:
+            return None
+        # Emails are not unique in auth_user, so try each account that has it
+        candidates = list(users_with_email(email).order_by('pk')[:5])
+        if not candidates:
+            # Run the hasher anyway so a missing account takes as long as a wrong password
+            get_user_model()().set_password(password)
+            return None
+        for user in candidates:
+            if user.check_password(password) and self.user_can_authenticate(user):
+                return user
+        return None
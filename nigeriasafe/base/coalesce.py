@@ -0,0 +1,165 @@
+"""Fold repeated SOS presses into the open alert they repeat.
+
+A panicked user presses SOS again and again. Before ``sos_alert`` creates
+an alert it calls ``find``, which looks for an open (pending or acknowledged)
+alert that meets three conditions:
+- it comes from the same source: the signed-in patient, else the device id
+  that sos.js sends, else the session
+- it was last pressed within ``SOS_COALESCE_WINDOW`` seconds
+- it is within ``SOS_COALESCE_RADIUS_M`` metres of the new position
+If one exists, ``bump`` adds one to its ``repeat_count``, moves it to the
+new position and appends the press's message, and no new row is written.
+
+``source_key`` stores a keyed hash of the source, never the raw session
+key or device id, so reading the alert tables gives nobody a session.
+
+Each process keeps an LRU of the alerts it created or bumped recently, keyed
+by source. A repeat press that reaches the same worker therefore costs one
+conditional UPDATE. A miss costs one query on the (source_key, last_seen_at)
+index, which also finds alerts that other workers created. Two presses that
+arrive at the same moment can still both create an alert: this is a noise
+filter, not a uniqueness guarantee.
+"""
+import datetime
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db.models import Case, F, Q, TextField, Value, When
+from django.db.models.functions import Concat
+from django.utils.crypto import salted_hmac
+
+from . import live
+from .geo import encode_geohash, haversine_km
+from .models import SOSAlert
+
+
+OPEN_STATUSES = (SOSAlert.STATUS_PENDING, SOSAlert.STATUS_ACK)
+MAX_DEVICE_ID_LENGTH = 48
+
+Recent = namedtuple('Recent', 'alert_id latitude longitude last_seen_at')
+
+
+class RecentAlerts:
+    """Per-process LRU of source key -> the latest alert from that source."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+recent = RecentAlerts(settings.SOS_COALESCE_INDEX_SIZE)
+
+
+def hash_source(kind, value):
+    """The stored form of a source: its kind, then a keyed hash of the value."""
+    return f"{kind}:{salted_hmac('sos-source', f'{kind}:{value}').hexdigest()}"
+
+
+def source_key(request, data):
+    """Who pressed: the patient, else the device id in the payload, else the session."""
+    patient = request.profiles.patient
+    if patient is not None:
+        return hash_source('patient', patient.pk)
+    device = data.get('device_id')
+    if isinstance(device, str) and device.strip():
+        return hash_source('device', device.strip()[:MAX_DEVICE_ID_LENGTH])
+    if request.session.session_key:
+        return hash_source('session', request.session.session_key)
+    return ''
+
+
+def _matches(entry, lat, lon, cutoff):
+    if entry.last_seen_at is None or entry.last_seen_at < cutoff:
+        return False
+    return haversine_km(entry.latitude, entry.longitude, lat, lon) * 1000 <= settings.SOS_COALESCE_RADIUS_M
+
+
+def find(key, lat, lon, now):
+    """Return the id of the open alert a press at (lat, lon) repeats, or None."""
+    if not key or settings.SOS_COALESCE_WINDOW <= 0:
+        return None
+    cutoff = now - datetime.timedelta(seconds=settings.SOS_COALESCE_WINDOW)
+    entry = recent.get(key)
+    if entry is not None and _matches(entry, lat, lon, cutoff):
+        return entry.alert_id
+    row = (
+        SOSAlert.objects
+        .filter(source_key=key, last_seen_at__gte=cutoff, status__in=OPEN_STATUSES)
+        .order_by('-last_seen_at')
+        .values_list('id', 'latitude', 'longitude', 'last_seen_at')
+        .first()
+    )
+    if row is not None and _matches(Recent(*row), lat, lon, cutoff):
+        return row[0]
+    return None
+
+
+def appended_message(message):
+    """Expression for the alert's message with ``message`` added as a new line.
+
+    A message the alert already ends with, as a resent press carries, is not repeated.
+    """
+    return Case(
+        When(Q(message__isnull=True) | Q(message=''), then=Value(message)),
+        When(message__endswith=message, then=F('message')),
+        default=Concat(F('message'), Value('\n'), Value(message), output_field=TextField()),
+        output_field=TextField(),
+    )
+
+
+def bump(alert_id, key, lat, lon, now, message=None):
+    """Record a repeat press on an open alert, keeping any message it carried.
+
+    Returns the updated alert, or None if it was resolved in the meantime.
+    """
+    changes = {
+        'repeat_count': F('repeat_count') + 1,
+        'latitude': lat,
+        'longitude': lon,
+        'geohash': encode_geohash(lat, lon),
+        'last_seen_at': now,
+    }
+    if message:
+        changes['message'] = appended_message(str(message))
+    updated = SOSAlert.objects.filter(pk=alert_id, status__in=OPEN_STATUSES).update(**changes)
+    if not updated:
+        recent.discard(key)
+        return None
+    recent.put(key, Recent(alert_id, lat, lon, now))
+    # update() sends no post_save, so tell the monitors here
+    alert = SOSAlert.objects.select_related('patient').get(pk=alert_id)
+    live.record([alert], 'updated')
+    return alert
+
+
+def remember(alert):
+    """Note a newly created alert so its source's next press finds it."""
+    if alert.source_key:
+        recent.put(alert.source_key, Recent(alert.id, alert.latitude, alert.longitude, alert.last_seen_at))
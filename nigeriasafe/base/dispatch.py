@@ -0,0 +1,237 @@
+"""Volunteer dispatch matching for SOS alerts.
+
+``VolunteerIndex`` keeps one NumPy array per scoring input (position,
+availability tier, medical training, open work) for every volunteer, so
+ranking candidates for an alert is a single vectorized pass instead of a
+table scan. The arrays are loaded once per process and then patched in place
+from the Volunteer and SOSAlert signal handlers in ``base.signals``. Other
+worker processes pick up changes when their copy reaches
+``DISPATCH_INDEX_MAX_AGE`` seconds and is reloaded.
+
+Scores are costs in kilometre-equivalents (lower is better): the distance to
+the alert plus fixed penalties for a slower availability tier, no medical
+training and each open assignment.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .geo import EARTH_RADIUS_KM
+from .models import SOSAlert, Volunteer
+
+
+# Penalty per availability tier, in km.
+AVAILABILITY_PENALTY_KM = {
+    'Immediate (within 30 mins)': 0.0,
+    'Within 1 hour': 10.0,
+    'Scheduled / On-call': 30.0,
+    'Weekends': 100.0,
+}
+NO_MEDICAL_TRAINING_PENALTY_KM = 5.0
+OPEN_WORK_PENALTY_KM = 15.0
+# Volunteers without coordinates still rank, but behind anyone nearby.
+UNKNOWN_LOCATION_KM = 500.0
+
+OPEN_ALERT_STATUSES = (SOSAlert.STATUS_PENDING, SOSAlert.STATUS_ACK)
+
+
+class AlreadyAssigned(Exception):
+    """The alert already has a different responder."""
+
+
+class VolunteerIndex:
+    """Column arrays of volunteer scoring inputs, one row per volunteer."""
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.RLock()
+        self._rows = {}
+        self._free = []
+        self._size = 0
+        self.loaded_at = 0.0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.lat = np.zeros(capacity, dtype=np.float64)  # radians
+        self.lon = np.zeros(capacity, dtype=np.float64)  # radians
+        self.has_location = np.zeros(capacity, dtype=bool)
+        self.penalty = np.zeros(capacity, dtype=np.float64)
+        self.medical = np.zeros(capacity, dtype=bool)
+        self.open_work = np.zeros(capacity, dtype=np.int32)
+
+    def _grow(self):
+        old = {name: getattr(self, name) for name in
+               ('ids', 'active', 'lat', 'lon', 'has_location', 'penalty', 'medical', 'open_work')}
+        self._allocate(len(self.ids) * 2)
+        for name, array in old.items():
+            getattr(self, name)[:len(array)] = array
+
+    def __len__(self):
+        return len(self._rows)
+
+    def load(self):
+        """Rebuild the arrays from the database."""
+        open_work = dict(
+            SOSAlert.objects.filter(responder__isnull=False, status__in=OPEN_ALERT_STATUSES)
+            .values('responder_id').annotate(n=Count('id')).values_list('responder_id', 'n')
+        )
+        rows = Volunteer.objects.values_list(
+            'id', 'latitude', 'longitude', 'isAvailable', 'medical_training',
+        )
+        with self._lock:
+            self._rows = {}
+            self._free = []
+            self._size = 0
+            self._allocate(max(1024, Volunteer.objects.count() * 2))
+            for pk, lat, lon, available, medical in rows.iterator(chunk_size=5000):
+                self._set(pk, lat, lon, available, medical, open_work.get(pk, 0))
+            self.loaded_at = time.monotonic()
+
+    def _set(self, pk, lat, lon, available, medical, open_work=None):
+        row = self._rows.get(pk)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._size == len(self.ids):
+                    self._grow()
+                row = self._size
+                self._size += 1
+            self._rows[pk] = row
+            self.open_work[row] = 0
+        self.ids[row] = pk
+        self.active[row] = True
+        self.has_location[row] = lat is not None and lon is not None
+        self.lat[row] = np.radians(float(lat)) if self.has_location[row] else 0.0
+        self.lon[row] = np.radians(float(lon)) if self.has_location[row] else 0.0
+        self.penalty[row] = AVAILABILITY_PENALTY_KM.get(available, max(AVAILABILITY_PENALTY_KM.values()))
+        self.medical[row] = bool(medical)
+        if open_work is not None:
+            self.open_work[row] = open_work
+
+    def upsert(self, volunteer):
+        with self._lock:
+            self._set(
+                volunteer.pk, volunteer.latitude, volunteer.longitude,
+                volunteer.isAvailable, volunteer.medical_training,
+            )
+
+    def remove(self, pk):
+        with self._lock:
+            row = self._rows.pop(pk, None)
+            if row is not None:
+                self.active[row] = False
+                self._free.append(row)
+
+    def set_open_work(self, pk, count):
+        with self._lock:
+            row = self._rows.get(pk)
+            if row is not None:
+                self.open_work[row] = count
+
+    def rank(self, lat, lon, k=5, require_medical=False):
+        """Return up to k (volunteer_id, score, distance_km) tuples, best first.
+
+        ``distance_km`` is None for volunteers without coordinates.
+        """
+        with self._lock:
+            n = self._size
+            lat1, lon1 = np.radians(float(lat)), np.radians(float(lon))
+            lat2, lon2 = self.lat[:n], self.lon[:n]
+            a = (np.sin((lat2 - lat1) / 2) ** 2
+                 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+            distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+            distance = np.where(self.has_location[:n], distance, UNKNOWN_LOCATION_KM)
+
+            score = (distance
+                     + self.penalty[:n]
+                     + np.where(self.medical[:n], 0.0, NO_MEDICAL_TRAINING_PENALTY_KM)
+                     + OPEN_WORK_PENALTY_KM * self.open_work[:n])
+            eligible = self.active[:n].copy()
+            if require_medical:
+                eligible &= self.medical[:n]
+            score = np.where(eligible, score, np.inf)
+
+            k = min(k, int(eligible.sum()))
+            if k <= 0:
+                return []
+            top = np.argpartition(score, k - 1)[:k]
+            top = top[np.argsort(score[top], kind='stable')]
+            return [
+                (int(self.ids[i]), float(score[i]),
+                 float(distance[i]) if self.has_location[i] else None)
+                for i in top
+            ]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return this process's VolunteerIndex, loading or refreshing it as needed.
+
+    Changes made in this process show up at once. Volunteer edits and
+    assignments made by other worker processes can be missing from it for up
+    to DISPATCH_INDEX_MAX_AGE seconds (300 by default).
+    """
+    global _index
+    max_age = getattr(settings, 'DISPATCH_INDEX_MAX_AGE', 300)
+    with _index_lock:
+        if _index is None:
+            index = VolunteerIndex()
+            index.load()
+            _index = index
+        elif time.monotonic() - _index.loaded_at > max_age:
+            _index.load()
+    return _index
+
+
+def loaded_index():
+    """Return the index if this process has built one, without loading it."""
+    return _index
+
+
+def refresh_open_work(volunteer_id):
+    index = loaded_index()
+    if index is None or volunteer_id is None:
+        return
+    count = SOSAlert.objects.filter(responder_id=volunteer_id, status__in=OPEN_ALERT_STATUSES).count()
+    index.set_open_work(volunteer_id, count)
+
+
+def candidates_for(alert, k=5, require_medical=False):
+    """Rank volunteers for an SOSAlert and return [(Volunteer, score, distance_km)].
+
+    The ranking comes from ``get_index``, so it can be up to
+    DISPATCH_INDEX_MAX_AGE seconds behind changes made in other processes.
+    """
+    ranked = get_index().rank(alert.latitude, alert.longitude, k=k, require_medical=require_medical)
+    volunteers = Volunteer.objects.select_related('user').in_bulk([pk for pk, _, _ in ranked])
+    return [
+        (volunteers[pk], score, distance)
+        for pk, score, distance in ranked
+        if pk in volunteers
+    ]
+
+
+def assign(alert, volunteer):
+    """Make ``volunteer`` the responder for ``alert`` and keep open-work counts current.
+
+    Raises AlreadyAssigned if someone else is already responding to the alert.
+    """
+    with transaction.atomic():
+        # Locked, so two staff dispatching at once cannot both succeed
+        current = SOSAlert.objects.select_for_update().filter(pk=alert.pk).values_list('responder_id', flat=True)
+        current = current.first()
+        if current is not None and current != volunteer.pk:
+            raise AlreadyAssigned(f'SOS Alert #{alert.pk} already has a responder')
+        alert.responder = volunteer
+        if alert.status == SOSAlert.STATUS_PENDING:
+            alert.status = SOSAlert.STATUS_ACK
+        alert.save()
@@ -0,0 +1,133 @@
+"""Streaming bulk exports of alerts, patients and tasks as NDJSON or CSV.
+
+Rows are read with ``values_list`` and ``QuerySet.iterator`` and encoded one
+at a time. Memory use therefore stays flat however many rows match, and
+neither the ``export_data`` management command nor the staff download view
+holds more than one chunk in memory.
+"""
+import csv
+import datetime
+import decimal
+import json
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import archive
+from .models import Patient, SOSAlert, Task
+
+
+# dataset -> (model, exported columns, whether it has a status field)
+DATASETS = {
+    'sos_alerts': (SOSAlert, (
+        'id', 'created_at', 'client_created_at', 'status', 'latitude', 'longitude',
+        'phone', 'message', 'patient__medical_record_number', 'patient__full_name',
+        'responder_id', 'repeat_count', 'last_seen_at',
+    ), True),
+    'patients': (Patient, (
+        'id', 'medical_record_number', 'full_name', 'date_of_birth', 'blood_type',
+        'weight', 'height', 'medical_conditions', 'allergies', 'medications',
+        'address', 'phone_number', 'emergency_contact_name', 'emergency_contact_phone',
+        'emergency_contact_email', 'emergency_contact_relationship', 'created_at',
+    ), False),
+    'tasks': (Task, (
+        'id', 'created_at', 'title', 'location', 'urgency', 'status', 'isActive',
+        'description', 'created_by__username',
+    ), True),
+}
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def parse_bound(value, end=False):
+    """Parse an ISO date or datetime filter value into an aware datetime.
+
+    A bare date as the end of a range includes that whole day.
+    Raises ValueError for anything else.
+    """
+    # Dates first: parse_datetime also reads a bare date, as midnight
+    day = parse_date(value)
+    if day is not None:
+        moment = datetime.datetime.combine(day + datetime.timedelta(days=1 if end else 0), datetime.time())
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f'Not an ISO date or datetime: {value!r}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, datetime.timezone.utc)
+    return moment
+
+
+def export_rows(dataset, since=None, until=None, status=None, include_archived=False):
+    """Return (columns, queryset of value tuples) for a dataset and filters.
+
+    ``since`` and ``until`` are strings as accepted by ``parse_bound``.
+    ``include_archived`` adds alerts moved out by base.archive. Raises
+    ValueError for an unknown dataset or a filter the dataset does not
+    support.
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f'Unknown dataset: {dataset!r}')
+    model, columns, has_status = DATASETS[dataset]
+    filters = {}
+    if since:
+        filters['created_at__gte'] = parse_bound(since)
+    if until:
+        # A bare date includes that day; a datetime is an exclusive bound
+        filters['created_at__lt'] = parse_bound(until, end=True)
+    if status:
+        if not has_status:
+            raise ValueError(f'{dataset} cannot be filtered by status')
+        valid = {value for value, _ in model._meta.get_field('status').choices}
+        if status not in valid:
+            raise ValueError(f"Unknown status {status!r}; expected one of {', '.join(sorted(valid))}")
+        filters['status'] = status
+    if include_archived:
+        if model is not SOSAlert:
+            raise ValueError(f'{dataset} has no archive')
+        rows = archive.all_alerts(*columns, **filters)
+    else:
+        rows = model.objects.filter(**filters).values_list(*columns)
+    return columns, rows.order_by('created_at', 'id')
+
+
+def _plain(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def stream(dataset, fmt='ndjson', since=None, until=None, status=None, chunk_size=None, include_archived=False):
+    """Yield the encoded export as text lines.
+
+    Filters are validated before the first line is produced, so a bad request
+    fails up front and not halfway through a download.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format: {fmt!r}')
+    columns, rows = export_rows(dataset, since=since, until=until, status=status, include_archived=include_archived)
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    return _lines(columns, rows, fmt, chunk_size)
+
+
+def _lines(columns, rows, fmt, chunk_size):
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield writer.writerow([_plain(value) for value in row])
+    else:
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield json.dumps(dict(zip(columns, map(_plain, row)))) + '\n'
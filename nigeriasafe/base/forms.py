@@ -1,5 +1,6 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from .backends import users_with_email
 from .models import Patient
 
 
@@ -17,6 +18,12 @@ class CustomUserCreationForm(UserCreationForm):
         if 'password2' in self.fields:
             self.fields['password2'].widget.attrs.update({'placeholder': 'Confirm password'})
 
+    def clean_email(self):
+        email = self.cleaned_data['email']
+        if users_with_email(email).exists():
+            raise forms.ValidationError('An account with this email already exists.')
+        return email
+
     def save(self, commit=True):
         user = super().save(commit=False)
         user.email = self.cleaned_data['email']
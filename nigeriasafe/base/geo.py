@@ -0,0 +1,186 @@
+"""Geohash-based spatial lookups for SOSAlert that work on plain SQLite.
+
+Every alert stores the geohash of its position in an indexed column. A
+bounding box is covered by a handful of geohash cells, and each cell becomes
+an index range scan (``geohash >= cell AND geohash < cell + '{'``), so radius
+and nearest-neighbour queries only read rows near the point of interest.
+Exact great-circle distances are then computed in SQL on that small candidate
+set.
+
+The grid does not wrap across the antimeridian, which is fine for Nigeria.
+"""
+import math
+
+from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~4.8 m x 4.8 m cells
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+# Upper bound on the number of index range scans a single lookup issues.
+MAX_COVER_CELLS = 16
+
+
+def encode_geohash(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    lat, lon = float(lat), float(lon)
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return (height, width) in degrees of a geohash cell."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(min_lat, min_lon, max_lat, max_lon, max_cells=MAX_COVER_CELLS):
+    """Return the geohash cells that together cover a bounding box.
+
+    Picks the finest precision at which the box needs at most ``max_cells``
+    cells, so larger boxes get coarser (and fewer) cells.
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+    precision = 1
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(p)
+        rows = math.floor(max_lat / height) - math.floor(min_lat / height) + 1
+        cols = math.floor(max_lon / width) - math.floor(min_lon / width) + 1
+        if rows * cols <= max_cells:
+            precision = p
+            break
+
+    height, width = cell_size(precision)
+    rows = math.ceil((max_lat - min_lat) / height) + 1
+    cols = math.ceil((max_lon - min_lon) / width) + 1
+    cells = set()
+    for i in range(rows):
+        lat = min(min_lat + i * height, max_lat)
+        for j in range(cols):
+            lon = min(min_lon + j * width, max_lon)
+            cells.add(encode_geohash(lat, lon, precision))
+    return sorted(cells)
+
+
+def bbox_around(lat, lon, radius_km):
+    """Return (min_lat, min_lon, max_lat, max_lon) enclosing a circle."""
+    lat, lon = float(lat), float(lon)
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(lat))
+    dlon = 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (KM_PER_DEGREE_LAT * cos_lat))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(float(lat1)), math.radians(float(lat2))
+    dphi = phi2 - phi1
+    dlmb = math.radians(float(lon2) - float(lon1))
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeohashField(models.CharField):
+    """Read-only geohash of the model's latitude/longitude, refreshed on every save.
+
+    Computed in ``pre_save`` so that ``bulk_create`` fills it in as well.
+    """
+
+    def __init__(self, *args, lat_field='latitude', lon_field='longitude', **kwargs):
+        self.lat_field = lat_field
+        self.lon_field = lon_field
+        kwargs.setdefault('max_length', 12)
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('blank', True)
+        kwargs.setdefault('db_index', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.lat_field != 'latitude':
+            kwargs['lat_field'] = self.lat_field
+        if self.lon_field != 'longitude':
+            kwargs['lon_field'] = self.lon_field
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        lat = getattr(model_instance, self.lat_field)
+        lon = getattr(model_instance, self.lon_field)
+        value = '' if lat is None or lon is None else encode_geohash(lat, lon)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class GeoQuerySet(models.QuerySet):
+    """Spatial lookups for models with latitude, longitude and geohash fields."""
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        cells = Q()
+        for cell in covering_cells(min_lat, min_lon, max_lat, max_lon):
+            cells |= Q(geohash__gte=cell, geohash__lt=cell + '{')
+        return self.filter(
+            cells,
+            latitude__gte=min_lat, latitude__lte=max_lat,
+            longitude__gte=min_lon, longitude__lte=max_lon,
+        )
+
+    def with_distance(self, lat, lon):
+        """Annotate ``distance_km``, the great-circle distance to (lat, lon)."""
+        lat, lon = float(lat), float(lon)
+        half_dlat = (Radians(F('latitude')) - math.radians(lat)) / 2
+        half_dlon = (Radians(F('longitude')) - math.radians(lon)) / 2
+        a = (
+            Power(Sin(half_dlat), 2)
+            + math.cos(math.radians(lat)) * Cos(Radians(F('latitude'))) * Power(Sin(half_dlon), 2)
+        )
+        return self.annotate(
+            distance_km=models.ExpressionWrapper(
+                2 * EARTH_RADIUS_KM * ASin(Sqrt(a)),
+                output_field=models.FloatField(),
+            )
+        )
+
+    def within_radius(self, lat, lon, radius_km):
+        return (
+            self.within_bbox(*bbox_around(lat, lon, radius_km))
+            .with_distance(lat, lon)
+            .filter(distance_km__lte=radius_km)
+        )
+
+    def nearest(self, lat, lon, k=10, start_km=1.0, max_km=2 * math.pi * EARTH_RADIUS_KM):
+        """Return the k rows closest to (lat, lon), nearest first.
+
+        Searches a radius that doubles until it holds at least k rows. Every
+        row outside that radius is farther than every row inside it, so the
+        result is exact.
+        """
+        radius = start_km
+        while True:
+            candidates = self.within_radius(lat, lon, radius)
+            if radius >= max_km or candidates.count() >= k:
+                return candidates.order_by('distance_km')[:k]
+            radius *= 2
@@ -0,0 +1,168 @@
+"""Let clients retry SOS requests without creating duplicates.
+
+On a bad network a POST can reach the server even though the client never
+sees the response. The client then sends the same request again. To make
+that safe, sos.js sends an ``Idempotency-Key`` header with a random key per
+SOS press and reuses it on every retry. Views wrapped in ``idempotent``
+handle a key like this:
+- First request: it claims the key by inserting an ``IdempotencyKey`` row,
+  runs the view, and then stores the response on that row.
+- Retry after the response was stored: gets the stored response again, with
+  an ``Idempotent-Replayed: true`` header.
+- Retry while the first request is still running: gets 409 and
+  ``Retry-After``.
+- Same key with a different body or user: gets 422.
+
+The unique (scope, key) constraint decides which of two concurrent requests
+claims a key, so they cannot both run the view. 5xx responses are not
+stored: the claim is released, and the retry runs the view again.
+
+The claim commits on its own, so a concurrent retry sees it at once. The
+view's writes and the stored response then commit together in one
+transaction: a crash between the two leaves neither, and the retry runs the
+view afresh. Views can pass ``atomic`` to opt out. sos_alert does so in the
+buffered ingest mode, where another thread writes the alert and must not
+wait on the request's transaction; there the alert may commit without its
+stored response, and coalescing folds the retry into it.
+
+Keys expire after ``IDEMPOTENCY_KEY_TTL`` seconds. An expired key counts as
+unused, and ``purge`` (``manage.py purge_idempotency_keys``) deletes the
+expired rows. A claim left by a crashed worker is taken over after
+``IDEMPOTENCY_LOCK_SECONDS``. If the worker died after the view's writes
+but before the response was stored, the retry then runs the view again. For
+sos_alert, coalescing folds that second run into the alert from the first.
+"""
+import contextlib
+import datetime
+import functools
+import hashlib
+import re
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+VALID_KEY = re.compile(r'[A-Za-z0-9_.:-]{8,64}')
+PURGE_CHUNK_SIZE = 1000
+
+
+def fingerprint(request):
+    """Hash of the method, path, user and body, which a retry repeats exactly."""
+    digest = hashlib.sha256(f'{request.method} {request.path} {request.user.pk or ""}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def claim(scope, key, request_fingerprint, now=None):
+    """Return (record, created) for ``key``, inserting it if it is unused.
+
+    Exactly one of several concurrent callers gets ``created=True``. An
+    expired key, or a claim abandoned for longer than the lock timeout, is
+    deleted and claimed afresh.
+    """
+    now = now or timezone.now()
+    expired = now - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    abandoned = now - datetime.timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+    record = None
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(scope=scope, key=key, fingerprint=request_fingerprint), True
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+        if record is None:
+            # Purged between the insert and the read
+            continue
+        if record.created_at >= expired and (record.status_code is not None or record.created_at >= abandoned):
+            return record, False
+        # Filtered on created_at, so only one of several racing callers deletes it
+        IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+    return record, False
+
+
+def replay(record, request_fingerprint):
+    """The response for a retry of an already claimed key."""
+    if record.fingerprint != request_fingerprint:
+        return JsonResponse({
+            'status': 'error', 'message': 'This Idempotency-Key was already used for a different request',
+        }, status=422)
+    if record.status_code is None:
+        response = JsonResponse({
+            'status': 'error', 'message': 'The first request with this Idempotency-Key is still being processed',
+        }, status=409)
+        response['Retry-After'] = '1'
+        return response
+    response = HttpResponse(bytes(record.body), status=record.status_code, content_type=record.content_type)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def store(record, response):
+    """Save the response on the claim; return False for one that is not stored."""
+    if response.status_code >= 500 or response.streaming:
+        return False
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        status_code=response.status_code,
+        content_type=response.get('Content-Type', ''),
+        body=response.content,
+    )
+    return True
+
+
+def idempotent(view=None, *, atomic=True):
+    """Replay the stored response when a request repeats an Idempotency-Key.
+
+    Requests without the header run the view as before. ``atomic`` (a bool,
+    or a callable asked on each request) runs the view and the stored
+    response in one transaction.
+    """
+    if view is None:
+        return functools.partial(idempotent, atomic=atomic)
+    scope = view.__name__
+
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        key = key.strip()
+        if not VALID_KEY.fullmatch(key):
+            return JsonResponse({'status': 'error', 'message': 'Invalid Idempotency-Key'}, status=400)
+        request_fingerprint = fingerprint(request)
+        record, created = claim(scope, key, request_fingerprint)
+        if not created:
+            return replay(record, request_fingerprint)
+        in_transaction = atomic() if callable(atomic) else atomic
+        try:
+            with transaction.atomic() if in_transaction else contextlib.nullcontext():
+                response = view(request, *args, **kwargs)
+                stored = store(record, response)
+        except BaseException:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            raise
+        if not stored:
+            # Released, so the retry runs the view again
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+        return response
+
+    return wrapped
+
+
+def purge(now=None, chunk_size=PURGE_CHUNK_SIZE):
+    """Delete expired keys in chunks, oldest first; return how many went."""
+    cutoff = (now or timezone.now()) - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    deleted = 0
+    while True:
+        expired = IdempotencyKey.objects.filter(created_at__lt=cutoff).order_by('created_at')
+        ids = list(expired.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        # Keys have no relations or delete signals, so this is a single DELETE
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,183 @@
+"""Width-stepped JPEG and WebP variants of the large static photos.
+
+The hero photos behind the home page are several megabytes at full camera
+resolution, which is far more than a phone on mobile data needs. The
+``build_image_variants`` management command resizes each source listed in
+``RESPONSIVE_IMAGE_SOURCES`` to every width in ``RESPONSIVE_IMAGE_WIDTHS``
+(never upscaling) and re-encodes it as JPEG and WebP. Files are named by
+content hash and go into ``RESPONSIVE_IMAGES_DIR`` with a manifest.
+
+A source is skipped when its hash and the encoder settings match the
+manifest and every variant file is still on disk, so the command is cheap to
+run on every deploy. The ``responsive_image`` template tag reads the manifest
+to emit ``srcset``/``sizes``. The ``responsive_image`` view serves the files
+with far-future cache headers, which is safe because a changed image always
+gets a new name.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from PIL import Image, ImageOps
+
+
+MANIFEST_NAME = 'manifest.json'
+FORMATS = {
+    'webp': {'ext': 'webp', 'mime': 'image/webp'},
+    'jpeg': {'ext': 'jpg', 'mime': 'image/jpeg'},
+}
+
+
+def output_dir():
+    return settings.RESPONSIVE_IMAGES_DIR
+
+
+def _encoder_signature():
+    """Settings that change the output; a change here forces a rebuild."""
+    return {
+        'widths': sorted(settings.RESPONSIVE_IMAGE_WIDTHS),
+        'jpeg_quality': settings.RESPONSIVE_IMAGE_JPEG_QUALITY,
+        'webp_quality': settings.RESPONSIVE_IMAGE_WEBP_QUALITY,
+    }
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image.save(buffer, 'JPEG', quality=settings.RESPONSIVE_IMAGE_JPEG_QUALITY,
+                   optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'WEBP', quality=settings.RESPONSIVE_IMAGE_WEBP_QUALITY, method=6)
+    return buffer.getvalue()
+
+
+def _is_current(entry, source_hash, signature, out):
+    if not entry or entry.get('source_hash') != source_hash or entry.get('encoder') != signature:
+        return False
+    return all(
+        os.path.exists(os.path.join(out, variant['file']))
+        for variants in entry['formats'].values()
+        for variant in variants
+    )
+
+
+def build(sources=None, force=False):
+    """Generate variants for the given static paths (all configured by default).
+
+    Returns (manifest, results) where ``results`` maps each source to
+    'built', 'unchanged' or an error message.
+    """
+    out = output_dir()
+    os.makedirs(out, exist_ok=True)
+    manifest = load_manifest_file()
+    signature = _encoder_signature()
+    results = {}
+    for path in sources or settings.RESPONSIVE_IMAGE_SOURCES:
+        source_file = finders.find(path)
+        if not source_file:
+            results[path] = 'source not found'
+            manifest.pop(path, None)
+            continue
+        with open(source_file, 'rb') as fh:
+            data = fh.read()
+        source_hash = hashlib.sha256(data).hexdigest()
+        if not force and _is_current(manifest.get(path), source_hash, signature, out):
+            results[path] = 'unchanged'
+            continue
+
+        with Image.open(io.BytesIO(data)) as original:
+            # Apply the camera rotation, then drop EXIF and other metadata
+            image = ImageOps.exif_transpose(original).convert('RGB')
+        widths = [w for w in sorted(settings.RESPONSIVE_IMAGE_WIDTHS) if w < image.width]
+        widths.append(min(image.width, max(settings.RESPONSIVE_IMAGE_WIDTHS)))
+        widths = sorted(set(widths))
+
+        stem = os.path.splitext(os.path.basename(path))[0]
+        formats = {fmt: [] for fmt in FORMATS}
+        for width in widths:
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+            for fmt, info in FORMATS.items():
+                body = _encode(resized, fmt)
+                digest = hashlib.sha256(body).hexdigest()[:12]
+                filename = f"{stem}.{width}w.{digest}.{info['ext']}"
+                with open(os.path.join(out, filename), 'wb') as fh:
+                    fh.write(body)
+                formats[fmt].append({'width': width, 'height': height, 'file': filename, 'size': len(body)})
+        manifest[path] = {
+            'source_hash': source_hash,
+            'encoder': signature,
+            'width': image.width,
+            'height': image.height,
+            'formats': formats,
+        }
+        results[path] = 'built'
+
+    tmp = os.path.join(out, MANIFEST_NAME + '.tmp')
+    with open(tmp, 'w') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(out, MANIFEST_NAME))
+    _remove_stale_files(out, manifest)
+    return manifest, results
+
+
+def load_manifest_file():
+    try:
+        with open(os.path.join(output_dir(), MANIFEST_NAME)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _remove_stale_files(out, manifest):
+    keep = {MANIFEST_NAME}
+    for entry in manifest.values():
+        for variants in entry['formats'].values():
+            keep.update(variant['file'] for variant in variants)
+    extensions = tuple(f".{info['ext']}" for info in FORMATS.values())
+    for filename in os.listdir(out):
+        if filename.endswith(extensions) and filename not in keep:
+            os.remove(os.path.join(out, filename))
+
+
+class ImageManifest:
+    """The variant manifest held in memory, reloaded when the file changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._entries = {}
+        self._files = frozenset()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(os.path.join(output_dir(), MANIFEST_NAME)).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._entries = load_manifest_file() if mtime is not None else {}
+                    self._files = frozenset(
+                        variant['file']
+                        for entry in self._entries.values()
+                        for variants in entry['formats'].values()
+                        for variant in variants
+                    )
+                    self._mtime = mtime
+
+    def get(self, path):
+        self._refresh()
+        return self._entries.get(path)
+
+    def is_variant(self, filename):
+        """True if ``filename`` is a file listed in the current manifest."""
+        self._refresh()
+        return filename in self._files
+
+
+manifest = ImageManifest()
@@ -0,0 +1,231 @@
+"""Group-commit write buffer for SOS alert ingestion.
+
+With ``SOS_INGEST_MODE = 'buffered'`` the ``sos_alert`` view no longer runs its
+own INSERT. Validated alerts are handed to a single writer thread per process,
+which collects them for up to ``SOS_INGEST_FLUSH_INTERVAL`` seconds (or until
+``SOS_INGEST_BATCH_SIZE`` alerts are waiting) and writes the whole batch with
+one ``bulk_create`` in one transaction. Each request blocks until its batch has
+committed, so the id it returns is durable. ``bulk_create`` skips post_save,
+so the writer sends ``base.signals.bulk_created`` for each batch instead.
+
+A request that waits longer than ``SOS_INGEST_ACK_TIMEOUT`` takes its alert
+back out of the queue and gets ``TimeoutError``; the alert is then never
+written, so the client can safely retry. If the writer has already taken the
+alert, the request waits for that batch instead and reports its outcome.
+"""
+import datetime
+import queue
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import SOSAlert
+from .signals import bulk_created
+
+
+MODE_DIRECT = 'direct'
+MODE_BUFFERED = 'buffered'
+
+
+COORDINATE_PLACES = Decimal('0.000001')
+
+
+def clean_coordinates(lat, lon):
+    """Return (lat, lon) as Decimals rounded to the model's 6 decimal places.
+
+    Browsers report positions with more precision than SOSAlert stores, so
+    values are rounded rather than rejected. Non-numeric or out-of-range
+    coordinates raise ValidationError.
+    """
+    cleaned = []
+    for name, value, limit in (('latitude', lat, 90), ('longitude', lon, 180)):
+        try:
+            number = Decimal(str(value)).quantize(COORDINATE_PLACES)
+        except (InvalidOperation, ValueError):
+            raise ValidationError(f'Invalid {name}: {value!r}')
+        if not number.is_finite():
+            raise ValidationError(f'Invalid {name}: {value!r}')
+        if not -limit <= number <= limit:
+            raise ValidationError(f'{name.capitalize()} out of range: {value!r}')
+        cleaned.append(number)
+    return tuple(cleaned)
+
+
+def clean_client_timestamp(value):
+    """Parse a client timestamp: an ISO 8601 string or Unix epoch milliseconds.
+
+    Returns an aware datetime, or None when no timestamp was sent. Naive
+    values are taken to be UTC.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValidationError(f'Invalid client_timestamp: {value!r}')
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.datetime.fromtimestamp(value / 1000, tz=datetime.timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ValidationError(f'Invalid client_timestamp: {value!r}')
+    try:
+        parsed = parse_datetime(str(value))
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError(f'Invalid client_timestamp: {value!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    return parsed
+
+
+class PendingAlert:
+    """An alert waiting in the buffer, plus the event that signals its commit."""
+    QUEUED, TAKEN, CANCELLED = 'queued', 'taken', 'cancelled'
+
+    def __init__(self, alert):
+        self.alert = alert
+        self.error = None
+        self.state = self.QUEUED
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def take(self):
+        """Called by the writer; False if the request already gave up on the alert."""
+        with self._lock:
+            if self.state == self.CANCELLED:
+                return False
+            self.state = self.TAKEN
+            return True
+
+    def cancel(self):
+        """Withdraw the alert unless the writer has taken it; True if withdrawn."""
+        with self._lock:
+            if self.state == self.QUEUED:
+                self.state = self.CANCELLED
+            return self.state == self.CANCELLED
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            if self.cancel():
+                raise TimeoutError('SOS alert was not committed in time')
+            # Already in a batch being written: its outcome is the answer
+            self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.alert
+
+    def resolve(self, error=None):
+        self.error = error
+        self._done.set()
+
+
+class SOSWriteBuffer:
+    def __init__(self, batch_size=100, flush_interval=0.005):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, alert):
+        """Queue an unsaved SOSAlert and return its PendingAlert."""
+        self._ensure_started()
+        pending = PendingAlert(alert)
+        self._queue.put(pending)
+        return pending
+
+    def stop(self):
+        """Flush whatever is queued and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sos-write-buffer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    return
+                batch = [first]
+                stopping = False
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                batch = [p for p in batch if p.take()]
+                if batch:
+                    self._flush(batch)
+                if stopping:
+                    return
+        finally:
+            connection.close()
+
+    def _flush(self, batch):
+        try:
+            with transaction.atomic():
+                alerts = SOSAlert.objects.bulk_create([p.alert for p in batch])
+                bulk_created.send(sender=SOSAlert, instances=alerts)
+        except Exception as e:
+            for p in batch:
+                p.resolve(e)
+        else:
+            for p in batch:
+                p.resolve()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = SOSWriteBuffer(
+                    batch_size=getattr(settings, 'SOS_INGEST_BATCH_SIZE', 100),
+                    flush_interval=getattr(settings, 'SOS_INGEST_FLUSH_INTERVAL', 0.005),
+                )
+    return _buffer
+
+
+def is_direct():
+    """True unless SOS_INGEST_MODE hands alerts to the write buffer."""
+    return getattr(settings, 'SOS_INGEST_MODE', MODE_DIRECT) != MODE_BUFFERED
+
+
+def save_alert(alert):
+    """Persist a validated SOSAlert using the configured ingestion mode.
+
+    Returns the saved alert. In buffered mode this blocks until the batch
+    containing the alert has committed.
+    """
+    if is_direct():
+        alert.save()
+        return alert
+    pending = get_buffer().submit(alert)
+    return pending.wait(getattr(settings, 'SOS_INGEST_ACK_TIMEOUT', 10))
@@ -0,0 +1,230 @@
+"""Fan-out hub for the live SOS feed, backed by the AlertEvent table.
+
+Every alert write adds an ``AlertEvent`` row in its own transaction
+(``record``), so the feed does not depend on which process took the write.
+In each process that serves the feed, ``hub`` runs one poller per event loop.
+The poller reads the rows after the last id it has seen, and hands them to
+every connected monitor's ``asyncio.Queue``. A process pays one indexed
+query per ``SOS_STREAM_POLL_INTERVAL``, however many monitors are open. When
+a write commits in the same process, ``notify`` wakes the poller at once.
+
+The event id is the row id, so a client reconnecting with Last-Event-ID gets
+what it missed (``replay``), even from another worker or after a restart.
+Rows older than ``SOS_STREAM_EVENT_TTL`` are purged by the poller; a client
+that is further behind is told to reload. On PostgreSQL, two writes can
+commit out of id order, and a poll between them skips the lower id; that
+change shows up on the monitor's next page load.
+
+The stream needs the ASGI application (nigeriasafe.asgi). Under WSGI,
+Django would read the endless stream to the end before sending anything,
+so ``stream_available`` is False and the pages leave the feed out.
+"""
+import asyncio
+import datetime
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import AlertEvent
+
+
+# Events a slow client may fall behind before it is told to reload
+SUBSCRIBER_QUEUE_SIZE = 200
+# Most events read by one poll or one replay
+BATCH_SIZE = 500
+# Seconds between purges of old events
+PURGE_INTERVAL = 60
+
+
+def alert_event(alert, kind):
+    """Build the small delta sent to monitors for a created or updated alert."""
+    patient = alert.patient if alert.patient_id else None
+    return {
+        'type': kind,
+        'id': alert.id,
+        'status': alert.status,
+        'status_display': alert.get_status_display(),
+        'latitude': str(alert.latitude),
+        'longitude': str(alert.longitude),
+        'message': alert.message or '',
+        'repeat_count': alert.repeat_count,
+        'patient': patient.full_name if patient else None,
+        'mrn': patient.medical_record_number if patient else None,
+        'created_at': alert.created_at.isoformat() if alert.created_at else None,
+    }
+
+
+def record(alerts, kind):
+    """Store an event for each alert, in the caller's transaction."""
+    events = [AlertEvent(alert_id=alert.id, payload=alert_event(alert, kind)) for alert in alerts]
+    AlertEvent.objects.bulk_create(events)
+    transaction.on_commit(hub.notify)
+
+
+def latest_id():
+    return AlertEvent.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+
+def events_after(last_id, limit=BATCH_SIZE):
+    """[(id, event), ...] stored after ``last_id``, oldest first."""
+    return list(AlertEvent.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'payload')[:limit])
+
+
+def replay(last_event_id):
+    """Events a client reconnecting with Last-Event-ID has missed.
+
+    Returns (missed, newest): ``missed`` is None if the id is too old to
+    replay or from another database, and ``newest`` is the id the client
+    is then up to date with.
+    """
+    bounds = AlertEvent.objects.aggregate(oldest=Min('id'), newest=Max('id'))
+    newest = bounds['newest'] or 0
+    if last_event_id is None:
+        return [], newest
+    # Without purged events, ids run on from the last one the client saw
+    if last_event_id > newest or (bounds['oldest'] or newest + 1) > last_event_id + 1:
+        return None, newest
+    missed = events_after(last_event_id)
+    if len(missed) == BATCH_SIZE:
+        return None, newest
+    return missed, missed[-1][0] if missed else last_event_id
+
+
+def purge(now=None):
+    """Delete events older than SOS_STREAM_EVENT_TTL; return how many went."""
+    cutoff = (now or timezone.now()) - datetime.timedelta(seconds=settings.SOS_STREAM_EVENT_TTL)
+    return AlertEvent.objects.filter(created_at__lt=cutoff).delete()[0]
+
+
+def stream_available(request):
+    """True if this request can hold an open event stream (ASGI only)."""
+    return isinstance(request, ASGIRequest)
+
+
+class _Feed:
+    """The subscribers and poller on one event loop."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queues = set()
+        self.cursor = 0
+        self.ready = asyncio.Event()
+        self.wake = asyncio.Event()
+        self.purged_at = 0
+
+
+class AlertHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._feeds = {}
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(feed.queues) for feed in self._feeds.values())
+
+    async def subscribe(self):
+        """Register a queue for the events stored from now on.
+
+        Events already stored may also arrive; callers skip ids they have sent.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                feed = self._feeds.get(loop)
+                starting = feed is None
+                if starting:
+                    feed = self._feeds[loop] = _Feed(loop)
+            if starting:
+                try:
+                    feed.cursor = await sync_to_async(latest_id)()
+                except BaseException:
+                    with self._lock:
+                        self._feeds.pop(loop, None)
+                    # Let anyone waiting on this feed start a new one
+                    feed.ready.set()
+                    raise
+                loop.create_task(self._poll(feed))
+                feed.ready.set()
+            else:
+                await feed.ready.wait()
+            with self._lock:
+                # The poller stops when its last subscriber leaves
+                if self._feeds.get(loop) is feed:
+                    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+                    feed.queues.add(queue)
+                    return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            for feed in self._feeds.values():
+                feed.queues.discard(queue)
+
+    def notify(self):
+        """Wake every poller in this process. Safe to call from any thread."""
+        with self._lock:
+            feeds = list(self._feeds.values())
+        for feed in feeds:
+            try:
+                feed.loop.call_soon_threadsafe(feed.wake.set)
+            except RuntimeError:
+                # The loop has shut down
+                with self._lock:
+                    self._feeds.pop(feed.loop, None)
+
+    async def _poll(self, feed):
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(feed.wake.wait(), settings.SOS_STREAM_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                feed.wake.clear()
+                with self._lock:
+                    if not feed.queues:
+                        self._feeds.pop(feed.loop, None)
+                        return
+                try:
+                    rows = await sync_to_async(events_after)(feed.cursor)
+                    if time.monotonic() - feed.purged_at > PURGE_INTERVAL:
+                        feed.purged_at = time.monotonic()
+                        await sync_to_async(purge)()
+                except Exception:
+                    # Try again on the next poll; monitors keep their keepalives meanwhile
+                    continue
+                if rows:
+                    feed.cursor = rows[-1][0]
+                    if len(rows) == BATCH_SIZE:
+                        feed.wake.set()
+                with self._lock:
+                    queues = list(feed.queues)
+                for seq, event in rows:
+                    for queue in queues:
+                        self._deliver(queue, seq, event)
+        finally:
+            with self._lock:
+                if self._feeds.get(feed.loop) is feed:
+                    self._feeds.pop(feed.loop)
+
+    @staticmethod
+    def _deliver(queue, seq, event):
+        try:
+            queue.put_nowait((seq, event))
+        except asyncio.QueueFull:
+            # Drop the backlog and make the client reload instead
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait((seq, {'type': 'reset'}))
+
+
+hub = AlertHub()
+
+
+def format_sse(seq, event):
+    return f"id: {seq}\nevent: sos\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from base import archive
+
+
+class Command(BaseCommand):
+    help = 'Move SOS alerts resolved more than N days ago into the archive table, in chunked transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SOS_ARCHIVE_AFTER_DAYS,
+                            help='Archive alerts resolved more than this many days ago')
+        parser.add_argument('--chunk-size', type=int, default=settings.SOS_ARCHIVE_CHUNK_SIZE,
+                            help='Alerts moved per transaction')
+        parser.add_argument('--limit', type=int, help='Stop after moving this many alerts')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between chunks, leaving room for live writes')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the alerts that are due')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['chunk_size'] < 1:
+            raise CommandError('--days must not be negative and --chunk-size must be positive.')
+        if options['dry_run']:
+            count = archive.due(options['days']).count()
+            self.stdout.write(f"{count} alerts resolved more than {options['days']} days ago are due.")
+            return
+
+        def progress(moved):
+            self.stdout.write(f'{moved} alerts archived', ending='\r')
+            self.stdout.flush()
+
+        moved = archive.run(
+            days=options['days'], chunk_size=options['chunk_size'], limit=options['limit'],
+            pause=options['pause'], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} alerts.'))
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from base import images
+
+
+class Command(BaseCommand):
+    help = 'Generate width-stepped JPEG and WebP variants of the large static images, skipping unchanged sources.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='*', help='Static paths to build (default: RESPONSIVE_IMAGE_SOURCES)')
+        parser.add_argument('--force', action='store_true', help='Rebuild even if the source has not changed')
+
+    def handle(self, *args, **options):
+        manifest, results = images.build(options['sources'] or None, force=options['force'])
+        failed = False
+        for path, result in results.items():
+            if result == 'unchanged':
+                self.stdout.write(f'{path}: unchanged')
+            elif result == 'built':
+                entry = manifest[path]
+                total = sum(v['size'] for variants in entry['formats'].values() for v in variants)
+                widths = ', '.join(str(v['width']) for v in entry['formats']['jpeg'])
+                self.stdout.write(f'{path}: built widths {widths} ({total} B across all variants)')
+            else:
+                failed = True
+                self.stderr.write(self.style.WARNING(f'{path}: skipped ({result})'))
+        self.stdout.write(self.style.SUCCESS(f'Image variants written to {settings.RESPONSIVE_IMAGES_DIR}'))
+        if failed and options['sources']:
+            raise CommandError('Some images could not be built.')
@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base import export
+
+
+class Command(BaseCommand):
+    help = 'Stream alerts, patients or tasks as NDJSON or CSV without loading them all into memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(export.DATASETS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(export.FORMATS), default='ndjson')
+        parser.add_argument('--since', help='Only rows created at or after this ISO date/datetime')
+        parser.add_argument('--until', help='Only rows created before this ISO datetime, or up to the end of this date')
+        parser.add_argument('--status', help='Only rows with this status (alerts and tasks)')
+        parser.add_argument('--include-archived', action='store_true',
+                            help='Also export alerts moved to the archive (sos_alerts only)')
+        parser.add_argument('--chunk-size', type=int, help='Rows per database fetch (default: EXPORT_CHUNK_SIZE)')
+        parser.add_argument('-o', '--output', help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            lines = export.stream(
+                options['dataset'], options['fmt'],
+                since=options['since'], until=options['until'], status=options['status'],
+                chunk_size=options['chunk_size'], include_archived=options['include_archived'],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        out = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        count = -1 if options['fmt'] == 'csv' else 0
+        try:
+            for line in lines:
+                out.write(line)
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        if options['output']:
+            self.stderr.write(self.style.SUCCESS(f"Exported {count} rows to {options['output']}"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from base import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with deterministic synthetic volunteers, patients, tasks and SOS alerts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alerts', type=int, default=0)
+        parser.add_argument('--patients', type=int, default=0)
+        parser.add_argument('--volunteers', type=int, default=0)
+        parser.add_argument('--tasks', type=int, default=0)
+        parser.add_argument('--seed', type=int, default=42, help='Same seed, same data (volunteer usernames include it)')
+        parser.add_argument('--days', type=int, default=365, help='Spread created_at over this many past days')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per bulk_create transaction')
+        parser.add_argument('--workers', type=int, default=1, help='Processes building rows in parallel')
+
+    def handle(self, *args, **options):
+        counts = {kind: options[kind] for kind in ('volunteers', 'patients', 'tasks', 'alerts')}
+        if not any(counts.values()):
+            raise CommandError('Nothing to generate; pass --alerts, --patients, --volunteers and/or --tasks.')
+        if any(count < 0 for count in counts.values()) or options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('Counts must not be negative; chunk size and workers must be positive.')
+
+        def progress(kind, done, total, elapsed):
+            rate = done / elapsed if elapsed else 0
+            self.stdout.write(f'{kind}: {done}/{total} ({rate:,.0f} rows/s)', ending='\r' if done < total else '\n')
+            self.stdout.flush()
+
+        try:
+            synthetic.generate(
+                **counts, seed=options['seed'], days=options['days'], chunk_size=options['chunk_size'],
+                workers=options['workers'], progress=progress,
+            )
+        except IntegrityError as e:
+            raise CommandError(f'{e}. Volunteers for seed {options["seed"]} may already exist; try another --seed.')
+        self.stdout.write(self.style.SUCCESS('Synthetic data generated; dashboard counters rebuilt.'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base import prerender
+
+
+class Command(BaseCommand):
+    help = 'Pre-render the static guidance pages to identity, gzip and brotli files with content hashes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pages', nargs='*', help='URL names to build (default: all pre-renderable pages)')
+
+    def handle(self, *args, **options):
+        unknown = set(options['pages']) - set(prerender.PAGES)
+        if unknown:
+            raise CommandError(f"Unknown pages: {', '.join(sorted(unknown))}")
+        if prerender.brotli is None:
+            self.stderr.write(self.style.WARNING('brotli is not installed; skipping .br files.'))
+
+        manifest, skipped = prerender.build(options['pages'] or None)
+        for name, reason in skipped.items():
+            self.stderr.write(self.style.WARNING(f'{name}: skipped ({reason})'))
+        for name in options['pages'] or prerender.PAGES:
+            if name in manifest:
+                files = manifest[name]['files']
+                sizes = ', '.join(f"{enc} {info['size']} B" for enc, info in files.items())
+                self.stdout.write(f"{name}: {manifest[name]['hash']} ({sizes})")
+        self.stdout.write(self.style.SUCCESS(f'Pre-rendered pages written to {prerender.output_dir()}'))
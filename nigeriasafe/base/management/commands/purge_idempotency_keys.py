@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from base import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL.'
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from base import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the admin dashboard counters from the Patient, Volunteer, SOSAlert and Task tables.'
+
+    def handle(self, *args, **options):
+        counts = stats.rebuild()
+        for key in sorted(counts):
+            if key != stats.READY_KEY:
+                self.stdout.write(f'{key}: {counts[key]}')
+        self.stdout.write(self.style.SUCCESS('Dashboard counters rebuilt.'))
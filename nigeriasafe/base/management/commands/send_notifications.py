@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from base import outbox
+
+
+class Command(BaseCommand):
+    help = 'Send queued SOS emails from the notification outbox over one long-lived SMTP connection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send what is due, then exit instead of polling')
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATION_BATCH_SIZE,
+                            help='Emails claimed per batch')
+        parser.add_argument('--poll', type=float, default=settings.NOTIFICATION_POLL_INTERVAL,
+                            help='Seconds to wait before looking again when nothing is due')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['poll'] <= 0:
+            raise CommandError('--batch-size and --poll must be positive.')
+
+        def progress(result):
+            self.stdout.write(f'Sent {result.sent}, retrying {result.retried}, dead {result.dead}')
+
+        try:
+            totals = outbox.run(
+                once=options['once'], poll=options['poll'], batch_size=options['batch_size'], progress=progress,
+            )
+        except KeyboardInterrupt:
+            # Emails claimed but not sent become due again when their lease runs out
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {totals.sent} emails; {totals.retried} will be retried, {totals.dead} dead-lettered.'
+        ))
@@ -0,0 +1,40 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from base.routers import REPLICA_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database onto the replica file (a local stand-in for a real replica).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep syncing every N seconds instead of once')
+
+    def handle(self, *args, **options):
+        if REPLICA_DB_ALIAS not in settings.DATABASES:
+            raise CommandError('No replica database configured; set NIGERIASAFE_READ_REPLICA.')
+        for alias in (DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS):
+            if settings.DATABASES[alias]['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError(f'{alias} is not SQLite; use the database server\'s own replication.')
+
+        while True:
+            started = time.monotonic()
+            self.sync()
+            self.stdout.write(f'Replica synced in {time.monotonic() - started:.2f}s')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self):
+        source = connections[DEFAULT_DB_ALIAS]
+        source.ensure_connection()
+        target = sqlite3.connect(settings.DATABASES[REPLICA_DB_ALIAS]['NAME'], timeout=20)
+        try:
+            # The online backup API copies a consistent snapshot while writers carry on
+            source.connection.backup(target)
+        finally:
+            target.close()
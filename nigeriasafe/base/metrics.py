@@ -0,0 +1,328 @@
+"""Per-view request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and labels it with the resolved
+URL name, such as ``base:sos_alert``. It also records the SQL queries the
+request ran and their time, the time spent rendering templates, and the
+response size. Template time needs the ``TimedDjangoTemplates`` backend in
+``TEMPLATES``.
+
+Each process keeps its totals in plain dicts behind one lock, so a request
+costs one lock acquisition and a few list updates. Histograms have fixed
+buckets, and labels come from URL names and status classes. Memory therefore
+stays bounded however many requests are served. Every
+``METRICS_FLUSH_SECONDS`` a process writes its totals to its own file in
+``METRICS_DIR``. The staff-only ``metrics`` view adds up the files of all
+worker processes on the host. It folds the files of exited workers into one
+``retired.json``, so counters never go backwards and the directory holds
+one file per live worker plus that one. Clear the directory on deploy.
+With ``METRICS_DIR`` unset, each process reports only its own totals.
+
+Streaming responses (exports, the SSE feed) are timed until the view
+returns, and their size is not recorded.
+"""
+import atexit
+import fcntl
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+
+PREFIX = 'nigeriasafe'
+# Totals of exited workers, in METRICS_DIR
+RETIRED_FILE = 'retired.json'
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'requests_total': ('counter', 'Requests served, by view, method and status class.', None),
+    'request_duration_seconds': (
+        'histogram', 'Time from the first middleware to the response.',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ),
+    'db_queries': ('histogram', 'SQL queries run per request.', (0, 1, 2, 3, 5, 8, 13, 20, 50, 100)),
+    'db_query_duration_seconds_total': ('counter', 'Time spent executing SQL.', None),
+    'template_render_seconds_total': ('counter', 'Time spent rendering templates.', None),
+    'response_size_bytes': (
+        'histogram', 'Size of non-streaming response bodies.',
+        (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+    ),
+}
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+_current = ContextVar('metrics_sample', default=None)
+
+
+class Sample:
+    """What one request did, filled in while it runs."""
+
+    __slots__ = ('queries', 'query_seconds', 'template_seconds', 'rendering')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - started
+
+
+def _labels(**labels):
+    return ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for key, value in labels.items()
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _series(view, method, status):
+    """Label strings for one request, cached: the label values come from a small set."""
+    return _labels(view=view), _labels(view=view, method=method, status=status)
+
+
+class Registry:
+    def __init__(self):
+        self._reset()
+        # A forked worker starts from zero rather than repeating its parent's totals
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        # A fresh name per process, so a reused pid cannot overwrite a dead worker's file
+        self.filename = f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+        self._flushed_at = time.monotonic()
+
+    def _count(self, name, labels, value):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        counts = self.histograms.get(key)
+        if counts is None:
+            # One slot per bucket, one for +Inf, then the sum
+            counts = self.histograms[key] = [0] * (len(buckets) + 1) + [0]
+        counts[bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+    def record(self, view, method, status, duration, sample, size):
+        labels, request_labels = _series(view, method, status)
+        with self._lock:
+            self._count('requests_total', request_labels, 1)
+            self._observe('request_duration_seconds', labels, duration)
+            self._observe('db_queries', labels, sample.queries)
+            self._count('db_query_duration_seconds_total', labels, sample.query_seconds)
+            self._count('template_render_seconds_total', labels, sample.template_seconds)
+            if size is not None:
+                self._observe('response_size_bytes', labels, size)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(counts)] for (name, labels), counts in self.histograms.items()],
+            }
+
+    def flush(self):
+        directory = settings.METRICS_DIR
+        self._flushed_at = time.monotonic()
+        if not directory or not self.counters:
+            return
+        os.makedirs(directory, exist_ok=True)
+        _write(Path(directory) / self.filename, self.snapshot())
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= settings.METRICS_FLUSH_SECONDS:
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+
+registry = Registry()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        registry.flush()
+    except OSError:
+        pass
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _add(total, snapshot):
+    counters, histograms = total
+    for name, labels, value in snapshot['counters']:
+        counters[name, labels] = counters.get((name, labels), 0) + value
+    for name, labels, counts in snapshot['histograms']:
+        running = histograms.setdefault((name, labels), [0] * len(counts))
+        for i, n in enumerate(counts):
+            running[i] += n
+
+
+def _write(path, snapshot):
+    # Readers see the old file or the new one, never half of it
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(snapshot, fh)
+    os.replace(tmp, path)
+
+
+def retire_dead_workers(directory):
+    """Fold the files of exited workers into RETIRED_FILE and delete them."""
+    directory = Path(directory)
+    with open(directory / '.retire.lock', 'w') as lock:
+        # One process at a time, so no file is added twice
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = []
+        for path in directory.glob('*-*.json'):
+            pid = path.name.split('-', 1)[0]
+            if pid.isdigit() and not _is_running(int(pid)):
+                dead.append(path)
+        if not dead:
+            return 0
+        retired = directory / RETIRED_FILE
+        counters, histograms = {}, {}
+        for path in [retired] + dead:
+            try:
+                _add((counters, histograms), json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        _write(retired, {
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, counts] for (name, labels), counts in histograms.items()],
+        })
+        for path in dead:
+            path.unlink(missing_ok=True)
+        return len(dead)
+
+
+def collect():
+    """Add up this process's live totals and every other worker's last flush."""
+    snapshots = [registry.snapshot()]
+    directory = settings.METRICS_DIR
+    if directory and os.path.isdir(directory):
+        try:
+            retire_dead_workers(directory)
+        except OSError:
+            pass
+        for path in Path(directory).glob('*.json'):
+            if path.name == registry.filename:
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        _add((counters, histograms), snapshot)
+    return counters, histograms
+
+
+def render_text(counters, histograms):
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        full = f'{PREFIX}_{name}'
+        lines += [f'# HELP {full} {help_text}', f'# TYPE {full} {kind}']
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{full}{{{labels}}} {value}')
+            continue
+        for (metric, labels), counts in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += n
+                lines.append(f'{full}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{full}_sum{{{labels}}} {counts[-1]}')
+            lines.append(f'{full}_count{{{labels}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def view_label(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    resource = match.kwargs.get('resource_name')
+    # Tastypie serves every resource through the same few URL names
+    return f'{match.view_name}:{resource}' if resource else match.view_name
+
+
+class MetricsMiddleware:
+    """Records each request in ``registry``; keep it first in MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample = Sample()
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(sample))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - started
+        method = request.method if request.method in METHODS else 'OTHER'
+        size = None if response.streaming else len(response.content)
+        registry.record(view_label(request), method, f'{response.status_code // 100}xx', duration, sample, size)
+        registry.maybe_flush()
+        return response
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        sample = _current.get()
+        if sample is None or sample.rendering:
+            return super().render(context, request)
+        # Only the outermost render is timed; render_to_string inside a tag is part of it
+        sample.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            sample.template_seconds += time.perf_counter() - started
+            sample.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time added to the request's metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_alter_patient_allergies_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sosalert',
+            name='client_created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 09:44
+
+import base.geo
+from django.db import migrations
+
+
+def populate_geohash(apps, schema_editor):
+    SOSAlert = apps.get_model('base', 'SOSAlert')
+    alerts = SOSAlert.objects.filter(geohash='').only('id', 'latitude', 'longitude')
+    batch = []
+    for alert in alerts.iterator(chunk_size=2000):
+        alert.geohash = base.geo.encode_geohash(alert.latitude, alert.longitude)
+        batch.append(alert)
+        if len(batch) >= 2000:
+            SOSAlert.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    SOSAlert.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_sosalert_client_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sosalert',
+            name='geohash',
+            field=base.geo.GeohashField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(populate_geohash, migrations.RunPython.noop),
+    ]
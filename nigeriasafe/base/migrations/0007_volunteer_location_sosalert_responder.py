@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 10:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_sosalert_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sosalert',
+            name='responder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assigned_alerts', to='base.volunteer'),
+        ),
+        migrations.AddField(
+            model_name='volunteer',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='volunteer',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=10, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 11:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0008_dashboardcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sosalert',
+            index=models.Index(fields=['created_at', 'id'], name='base_sosale_created_9ea54e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sosalert',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='base_sosale_status_6bc281_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['created_at', 'id'], name='base_task_created_465d30_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['urgency', 'created_at', 'id'], name='base_task_urgency_108d76_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='volunteer',
+            index=models.Index(fields=['created_at', 'id'], name='base_volunt_created_e97a6d_idx'),
+        ),
+    ]
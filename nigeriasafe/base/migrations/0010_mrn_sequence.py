@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 10:02
+
+import re
+
+from django.db import migrations, models
+
+
+def normalize_mrns(apps, schema_editor):
+    Patient = apps.get_model('base', 'Patient')
+    for pk, mrn in list(Patient.objects.values_list('pk', 'medical_record_number')):
+        normalized = re.sub(r'[\s\-_.]+', '', mrn).upper()
+        if normalized != mrn:
+            Patient.objects.filter(pk=pk).update(medical_record_number=normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0009_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='medical_record_number',
+            field=models.CharField(editable=False, max_length=20, unique=True),
+        ),
+        migrations.RunPython(normalize_mrns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-10-18 10:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('base', '0010_mrn_sequence'),
+    ]
+
+    operations = [
+        # auth_user belongs to django.contrib.auth, so the index for
+        # base.backends.EmailBackend is created here with plain SQL
+        migrations.RunSQL(
+            'CREATE INDEX auth_user_email_lower_idx ON auth_user (LOWER(email));',
+            'DROP INDEX auth_user_email_lower_idx;',
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0011_auth_user_email_lower_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sosalert',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sosalert',
+            name='repeat_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sosalert',
+            name='source_key',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='sosalert',
+            index=models.Index(fields=['source_key', 'last_seen_at'], name='base_sosale_source__f55210_idx'),
+        ),
+    ]
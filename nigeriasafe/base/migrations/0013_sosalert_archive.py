@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-18 17:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_resolved_at(apps, schema_editor):
+    # The real resolve time was never stored; the last press is the best guess
+    SOSAlert = apps.get_model('base', 'SOSAlert')
+    SOSAlert.objects.filter(status='resolved', resolved_at__isnull=True).update(
+        resolved_at=Coalesce('last_seen_at', 'created_at'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_sosalert_coalescing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SOSAlertArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('latitude', models.DecimalField(decimal_places=6, max_digits=10)),
+                ('longitude', models.DecimalField(decimal_places=6, max_digits=10)),
+                ('message', models.TextField(blank=True, null=True)),
+                ('phone', models.CharField(blank=True, max_length=30, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('acknowledged', 'Acknowledged'), ('resolved', 'Resolved')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('client_created_at', models.DateTimeField(blank=True, null=True)),
+                ('geohash', models.CharField(blank=True, max_length=12)),
+                ('source_key', models.CharField(blank=True, default='', max_length=64)),
+                ('repeat_count', models.PositiveIntegerField(default=0)),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='sosalert',
+            name='resolved_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='sosalert',
+            index=models.Index(fields=['status', 'resolved_at'], name='base_sosale_status_3e5550_idx'),
+        ),
+        migrations.AddField(
+            model_name='sosalertarchive',
+            name='patient',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_sos_alerts', to='base.patient'),
+        ),
+        migrations.AddField(
+            model_name='sosalertarchive',
+            name='responder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_alerts', to='base.volunteer'),
+        ),
+        migrations.AddIndex(
+            model_name='sosalertarchive',
+            index=models.Index(fields=['created_at', 'id'], name='base_sosale_created_4ce2f7_idx'),
+        ),
+        migrations.RunPython(backfill_resolved_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 18:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0013_sosalert_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='urgency_rank',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(then=models.Value(0), urgency='low'), models.When(then=models.Value(1), urgency='medium'), models.When(then=models.Value(2), urgency='high'), models.When(then=models.Value(3), urgency='critical'), default=models.Value(1)), output_field=models.SmallIntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('isActive', True)), fields=['urgency_rank', 'created_at', 'id'], name='base_task_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('isActive', True)), fields=['urgency', 'updated_at', 'isActive'], name='base_task_feed_version_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-18 21:15
+
+from django.db import migrations
+from django.utils.crypto import salted_hmac
+
+
+def hash_source_keys(apps, schema_editor):
+    # Raw session keys and device ids become the keyed hashes base.coalesce stores now
+    for name in ('SOSAlert', 'SOSAlertArchive'):
+        model = apps.get_model('base', name)
+        rows = model.objects.exclude(source_key='').values_list('pk', 'source_key')
+        for pk, key in list(rows):
+            kind, _, value = key.partition(':')
+            hashed = f"{kind}:{salted_hmac('sos-source', f'{kind}:{value}').hexdigest()}"
+            model.objects.filter(pk=pk).update(source_key=hashed)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0016_notification'),
+    ]
+
+    operations = [
+        migrations.RunPython(hash_source_keys, migrations.RunPython.noop),
+    ]
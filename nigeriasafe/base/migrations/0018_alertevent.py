@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0017_hash_sosalert_source_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alert_id', models.BigIntegerField()),
+                ('payload', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='base_alerte_created_3389ab_idx')],
+            },
+        ),
+    ]
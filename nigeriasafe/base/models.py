@@ -2,13 +2,26 @@ from django.db import models
 from django.conf import settings
 
 from django.contrib.auth.models import User
+from django.utils import timezone
 
-import uuid
+from .geo import GeohashField, GeoQuerySet
 
 def generate_medical_record_number():
-    """Generate a short, unique medical record number.
-    """ 
-    return f"MRN{uuid.uuid4().hex[:4].upper()}"
+    """Allocate the next medical record number from the MRN sequence.
+    """
+    from .mrn import allocator
+    return allocator.next()
+
+
+class LoadedValuesMixin:
+    """Keeps the column values a row was loaded with, so a save can tell what changed (see base.signals)."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
 
 # Create your models here.
 class Patient(models.Model):
@@ -45,14 +58,23 @@ class Patient(models.Model):
     emergency_contact_relationship = models.CharField(max_length=30)
     updated_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    medical_record_number = models.CharField(max_length=20, unique=True, default=generate_medical_record_number, editable=False)
+    # Stored normalized (see base.mrn) so lookups are an exact match on the unique index
+    medical_record_number = models.CharField(max_length=20, unique=True, editable=False)
 
     def __str__(self):
         name = self.user.get_full_name() if self.user else "Unknown"
         return f"{name} - MRN: {self.medical_record_number}"
 
+    def save(self, *args, **kwargs):
+        from .mrn import normalize
+        if self.medical_record_number:
+            self.medical_record_number = normalize(self.medical_record_number)
+        else:
+            self.medical_record_number = generate_medical_record_number()
+        super().save(*args, **kwargs)
+
 
-class SOSAlert(models.Model):
+class SOSAlert(LoadedValuesMixin, models.Model):
     STATUS_PENDING = 'pending'
     STATUS_ACK = 'acknowledged'
     STATUS_RESOLVED = 'resolved'
@@ -75,19 +97,102 @@ class SOSAlert(models.Model):
     phone = models.CharField(max_length=30, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
+    # When the device raised the alert; differs from created_at for alerts
+    # queued offline and uploaded later through the batch endpoint.
+    client_created_at = models.DateTimeField(null=True, blank=True)
+    geohash = GeohashField()
+    # Repeat presses folded into this alert by base.coalesce: who pressed
+    # (patient, device or session, as a keyed hash), how many extra times and the latest press
+    source_key = models.CharField(max_length=64, blank=True, default='')
+    repeat_count = models.PositiveIntegerField(default=0)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    # Set when the status becomes resolved; base.archive moves old ones out
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    responder = models.ForeignKey(
+        'Volunteer',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='assigned_alerts'
+    )
+
+    objects = GeoQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination on the dashboard and SOS monitor
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['status', 'created_at', 'id']),
+            # Recent open alert from the same source (base.coalesce)
+            models.Index(fields=['source_key', 'last_seen_at']),
+            # Alerts due for archiving (base.archive)
+            models.Index(fields=['status', 'resolved_at']),
+        ]
 
     def __str__(self):
         user_display = self.patient.full_name if self.patient else 'Anonymous'
         return f"SOS from {user_display} @ {self.created_at:%Y-%m-%d %H:%M}"
-    
 
+    def save(self, *args, **kwargs):
+        if self.status == self.STATUS_RESOLVED:
+            if self.resolved_at is None:
+                self.resolved_at = timezone.now()
+        else:
+            self.resolved_at = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'resolved_at'}
+        super().save(*args, **kwargs)
+
+
+class SOSAlertArchive(models.Model):
+    """A resolved SOSAlert moved out of the hot table by base.archive.
+
+    Keeps the alert's id and columns, so a union with SOSAlert reads as one table.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(
+        Patient,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='archived_sos_alerts'
+    )
+    latitude = models.DecimalField(max_digits=10, decimal_places=6)
+    longitude = models.DecimalField(max_digits=10, decimal_places=6)
+    message = models.TextField(null=True, blank=True)
+    phone = models.CharField(max_length=30, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=SOSAlert.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    client_created_at = models.DateTimeField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True)
+    source_key = models.CharField(max_length=64, blank=True, default='')
+    repeat_count = models.PositiveIntegerField(default=0)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    responder = models.ForeignKey(
+        'Volunteer',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='archived_alerts'
+    )
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f"Archived SOS #{self.id} @ {self.created_at:%Y-%m-%d %H:%M}"
 
 
 
-class Task(models.Model):
+
+class Task(LoadedValuesMixin, models.Model):
     URGENCY_CHOICES = [
         ('low', 'Low'),
         ('medium', 'Medium'),
@@ -111,6 +216,30 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     isActive = models.BooleanField(default=True)
+    # Higher is more urgent. Computed by the database, so bulk writes keep it right
+    URGENCY_RANKS = {'low': 0, 'medium': 1, 'high': 2, 'critical': 3}
+    urgency_rank = models.GeneratedField(
+        expression=models.Case(
+            *[models.When(urgency=urgency, then=models.Value(rank)) for urgency, rank in URGENCY_RANKS.items()],
+            default=models.Value(URGENCY_RANKS['medium']),
+        ),
+        output_field=models.SmallIntegerField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['urgency', 'created_at', 'id']),
+            # The volunteer task feed (base.taskfeed) shows active tasks only:
+            # its order, and its validator read from the index alone. Partial,
+            # since SQLite cannot seek on a bare boolean column in WHERE, and
+            # SQLite only counts an index as covering if it holds isActive too
+            models.Index(fields=['urgency_rank', 'created_at', 'id'], condition=models.Q(isActive=True),
+                         name='base_task_feed_idx'),
+            models.Index(fields=['urgency', 'updated_at', 'isActive'], condition=models.Q(isActive=True),
+                         name='base_task_feed_version_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -127,11 +256,113 @@ class Volunteer(models.Model):
     medical_training = models.BooleanField(default=False)
     isAvailable = models.CharField(max_length=200, choices=AVAILABLESTATUS_CHOICES, default='Immediate (within 30 mins)')
     location = models.CharField(max_length=200, null=True, blank=True)
+    latitude = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=10, decimal_places=6, null=True, blank=True)
     vehicleDetails = models.TextField(null=True, blank=True)
     equipment = models.TextField(null=True, blank=True)
     notes = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
+
     def __str__(self):
         return self.user.username
-     
+
+
+class DashboardCounter(models.Model):
+    """A single row count shown on the admin dashboard, kept current by base.stats."""
+    key = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+class Sequence(models.Model):
+    """A named counter for identifiers that must never repeat, such as MRNs."""
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+class IdempotencyKey(models.Model):
+    """A client's Idempotency-Key for one endpoint, and the response it got (see base.idempotency)."""
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=64)
+    # Hash of who sent the request and its body; a reused key must match it
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    body = models.BinaryField(blank=True, default=b'')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='base_idempotencykey_unique'),
+        ]
+        indexes = [
+            # Expired keys, oldest first (base.idempotency.purge)
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key}"
+
+
+class Notification(models.Model):
+    """An email waiting in the outbox, sent by the send_notifications worker (see base.outbox)."""
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_DEAD, 'Dead letter'),
+    ]
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # When a pending email is next due; a worker pushes it ahead while it holds the claim
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Due emails, oldest first (base.outbox.claim)
+            models.Index(fields=['next_attempt_at', 'id'], condition=models.Q(status='pending'),
+                         name='base_notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)}"
+
+
+class AlertEvent(models.Model):
+    """A change to an SOS alert, as sent to the live monitors (see base.live).
+
+    Written in the same transaction as the change, so every worker process's
+    feed sees it; the id doubles as the SSE event id.
+    """
+    alert_id = models.BigIntegerField()
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Old events, oldest first (base.live.purge)
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.payload.get('type')} alert {self.alert_id}"
@@ -0,0 +1,106 @@
+"""Medical record numbers: allocation, check digits and normalization.
+
+New MRNs look like ``MRN00001234X``, where ``X`` is a Luhn check digit over
+the sequence number. Numbers come from a ``Sequence`` row rather than random
+characters, so two patients can never be given the same MRN. Each process
+reserves ``MRN_BLOCK_SIZE`` numbers per database round trip and hands them out
+from memory. A restart can leave gaps, but never repeats a number.
+
+MRNs are stored in normalized form (upper case, no spaces or dashes). A typed
+lookup goes through ``normalize`` and is then a plain equality match on the
+unique index. Older four-character MRNs such as ``MRN1A2B`` stay valid.
+"""
+import re
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import Sequence
+
+
+PREFIX = 'MRN'
+SEQUENCE_NAME = 'mrn'
+NUMBER_WIDTH = 7
+
+_SEPARATORS = re.compile(r'[\s\-_.]+')
+_SEQUENCED = re.compile(rf'^{PREFIX}(\d{{{NUMBER_WIDTH + 1},}})$')
+
+
+def luhn_check_digit(number):
+    total = 0
+    for i, digit in enumerate(reversed(str(number))):
+        digit = int(digit)
+        if i % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return (10 - total % 10) % 10
+
+
+def format_mrn(number):
+    digits = f'{number:0{NUMBER_WIDTH}d}'
+    return f'{PREFIX}{digits}{luhn_check_digit(digits)}'
+
+
+def normalize(value):
+    """Canonical stored form of a typed MRN: upper case, separators removed.
+
+    A bare sequence number with check digit gets the prefix added back.
+    """
+    value = _SEPARATORS.sub('', value or '').upper()
+    if value.isdigit() and len(value) > NUMBER_WIDTH:
+        value = PREFIX + value
+    return value
+
+
+def has_valid_check_digit(value):
+    """False only for sequence-style MRNs whose check digit does not match.
+
+    Legacy random MRNs carry no check digit and always pass.
+    """
+    match = _SEQUENCED.match(value)
+    if not match:
+        return True
+    digits = match.group(1)
+    return luhn_check_digit(digits[:-1]) == int(digits[-1])
+
+
+def reserve(count):
+    """Atomically take ``count`` numbers from the sequence; returns a range."""
+    with transaction.atomic():
+        updated = Sequence.objects.filter(name=SEQUENCE_NAME).update(next_value=F('next_value') + count)
+        if not updated:
+            Sequence.objects.get_or_create(name=SEQUENCE_NAME)
+            Sequence.objects.filter(name=SEQUENCE_NAME).update(next_value=F('next_value') + count)
+        end = Sequence.objects.get(name=SEQUENCE_NAME).next_value
+    return range(end - count, end)
+
+
+class MRNAllocator:
+    """Hands out MRNs from a block of numbers reserved in the database."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._block = iter(())
+
+    def next(self):
+        if transaction.get_connection().in_atomic_block:
+            # A rollback would hand the reserved block back to the sequence
+            # while this process kept using it, so take a single number
+            return format_mrn(reserve(1)[0])
+        with self._lock:
+            number = next(self._block, None)
+            if number is None:
+                self._block = iter(reserve(settings.MRN_BLOCK_SIZE))
+                number = next(self._block)
+        return format_mrn(number)
+
+    def many(self, count):
+        """Return ``count`` fresh MRNs, for bulk inserts."""
+        return [format_mrn(number) for number in reserve(count)]
+
+
+allocator = MRNAllocator()
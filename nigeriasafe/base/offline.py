@@ -0,0 +1,122 @@
+"""Offline support: the service worker and what it precaches.
+
+The worker's source is ``static/js/sw.js``. A worker only controls pages at
+or below its own URL, so ``service_worker`` serves it at ``/sw.js`` rather
+than under STATIC_URL. The view puts a config object in front of the source:
+- ``version``: a hash of everything below. The worker names its cache
+  after it and deletes older caches when it activates, so a deploy that
+  changes any page or asset replaces the whole offline copy.
+- ``precache``: the guidance pages in ``prerender.PAGES`` and the home page,
+  plus the CSS and JS files they link to.
+- ``pages``: the guidance pages. The worker serves these from its cache
+  without touching the network.
+
+The version includes the ``prerender_pages`` build hashes, so run that
+command before the worker is fetched after a deploy. Pages that have not
+been built count as unchanged until they are. Generated image variants are
+not precached, since the largest ones are big. The worker caches each one
+the first time a page uses it.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+
+from django.contrib.staticfiles import finders
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.templatetags.static import static
+from django.urls import reverse
+
+from . import prerender
+
+
+SERVICE_WORKER = 'js/sw.js'
+# Assets every page uses; found in the page HTML too, but listed in case no page is built
+CORE_ASSETS = [
+    'styles/styles.css', 'js/sos.js', 'js/sos-queue.js', 'js/nav-hide.js', 'js/manifest.json', 'images/icon.svg',
+]
+ASSET_URL = re.compile(r'(?:src|href)="(' + re.escape(static('')) + r'[^"?#]+)"')
+
+
+def _file_digest(path):
+    with open(path, 'rb') as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+def _page_names():
+    """Pre-renderable pages whose template exists."""
+    names = []
+    for name, template in prerender.PAGES.items():
+        try:
+            get_template(template)
+        except TemplateDoesNotExist:
+            continue
+        names.append(name)
+    return names
+
+
+def _linked_assets(names):
+    """Static files linked from the built pages, as URLs."""
+    urls = set()
+    for name in names:
+        page = prerender.pages.get(name)
+        if page is not None:
+            urls.update(ASSET_URL.findall(page['bodies']['identity'].decode()))
+    return urls
+
+
+def build_config():
+    names = _page_names()
+    pages = [reverse(f'base:{name}') for name in names]
+    assets = sorted({static(path) for path in CORE_ASSETS} | _linked_assets(names))
+    digest = hashlib.sha256()
+    digest.update(json.dumps(pages + assets).encode())
+    for path in [SERVICE_WORKER] + [url.removeprefix(static('')) for url in assets]:
+        found = finders.find(path)
+        if found:
+            digest.update(_file_digest(found).encode())
+    manifest = prerender.load_manifest_file()
+    digest.update(json.dumps({name: manifest[name]['hash'] for name in names if name in manifest}).encode())
+    return {
+        'version': digest.hexdigest()[:12],
+        'precache': [reverse('base:home')] + pages + assets,
+        'pages': pages,
+        'fallback': reverse('base:home'),
+        'queueScript': static('js/sos-queue.js'),
+        'staticUrl': static(''),
+    }
+
+
+class ServiceWorkerScript:
+    """The served worker script, rebuilt when its source or the page build changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._script = None
+
+    def _current_stamp(self):
+        stamp = []
+        for path in (finders.find(SERVICE_WORKER), os.path.join(prerender.output_dir(), prerender.MANIFEST_NAME)):
+            try:
+                stamp.append(os.stat(path).st_mtime_ns)
+            except (OSError, TypeError):
+                stamp.append(None)
+        return tuple(stamp)
+
+    def get(self):
+        """Return (script, version)."""
+        stamp = self._current_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                config = build_config()
+                with open(finders.find(SERVICE_WORKER)) as fh:
+                    source = fh.read()
+                self._script = (f'const OFFLINE_CONFIG = {json.dumps(config)};\n{source}', config['version'])
+                self._stamp = stamp
+            return self._script
+
+
+script = ServiceWorkerScript()
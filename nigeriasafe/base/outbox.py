@@ -0,0 +1,220 @@
+"""Outbox for SOS emails, drained by a separate worker process.
+
+Views never talk to the SMTP server. ``enqueue`` inserts a ``Notification``
+row, which costs one INSERT, and the request returns. ``manage.py
+send_notifications`` runs ``run``, and the worker sends the rows:
+- ``claim`` takes up to ``NOTIFICATION_BATCH_SIZE`` due rows. It counts an
+  attempt for each, and pushes ``next_attempt_at`` forward by
+  ``NOTIFICATION_LEASE_SECONDS``, so no other worker picks them up. If the
+  worker dies mid-batch, the rows become due again when the lease runs out.
+- ``Sender`` keeps one connection from the email backend open across
+  batches. It closes the connection after ``NOTIFICATION_CONNECTION_IDLE``
+  seconds without work, or after a connection error.
+- Each email is sent with its own ``send_messages`` call on that connection.
+  One rejected address then fails only its own email, and the worker knows
+  exactly which emails went out.
+- A failed email is retried after ``NOTIFICATION_RETRY_BASE`` seconds. The
+  delay doubles with each attempt, up to ``NOTIFICATION_RETRY_MAX``. After
+  ``NOTIFICATION_MAX_ATTEMPTS`` attempts, or on a permanent SMTP error (5xx,
+  refused recipients), the email becomes a dead letter. Dead letters can be
+  requeued from the admin.
+
+Delivery is at least once. An email that was sent, but whose row could not
+be marked sent, goes out again when the lease expires.
+"""
+import datetime
+import smtplib
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Notification
+
+
+BatchResult = namedtuple('BatchResult', 'claimed sent retried dead')
+
+
+def enqueue(subject, body, recipients, from_email=None):
+    """Queue an email for the worker; returns the Notification."""
+    recipients = [address for address in recipients if address]
+    if not recipients:
+        raise ValueError('An email needs at least one recipient')
+    return Notification.objects.create(
+        subject=subject, body=body, recipients=recipients, from_email=from_email or settings.EMAIL_HOST_USER,
+    )
+
+
+def sos_email(latitude, longitude, message=None, name=None):
+    """Subject and body of the email an emergency contact gets."""
+    maps_link = f"https://www.google.com/maps?q={latitude},{longitude}"
+    lines = ["Emergency Alert!", ""]
+    if name:
+        lines += [f"{name} has raised an SOS alert.", ""]
+    if message:
+        lines += [f"Message: {message}", ""]
+    lines += [
+        "Coordinates received:",
+        f"Latitude: {latitude}",
+        f"Longitude: {longitude}",
+        "",
+        f"View on Google Maps: {maps_link}",
+    ]
+    return "SOS: Emergency Location Alert", '\n'.join(lines)
+
+
+def due(now=None):
+    """Pending emails whose next attempt is due, in the order of their index."""
+    return Notification.objects.filter(
+        status=Notification.STATUS_PENDING, next_attempt_at__lte=now or timezone.now(),
+    ).order_by('next_attempt_at', 'id')
+
+
+def claim(limit, now=None):
+    """Take up to ``limit`` due emails for this worker, counting an attempt for each."""
+    now = now or timezone.now()
+    lease = now + datetime.timedelta(seconds=settings.NOTIFICATION_LEASE_SECONDS)
+    with transaction.atomic():
+        # SKIP LOCKED lets workers on PostgreSQL claim side by side; SQLite's
+        # IMMEDIATE transactions already run one claim at a time
+        ids = list(due(now).select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        Notification.objects.filter(pk__in=ids).update(next_attempt_at=lease, attempts=F('attempts') + 1)
+        return list(Notification.objects.filter(pk__in=ids).order_by('id'))
+
+
+def backoff(attempts):
+    """Seconds to wait after the given number of failed attempts."""
+    return min(settings.NOTIFICATION_RETRY_MAX, settings.NOTIFICATION_RETRY_BASE * 2 ** (attempts - 1))
+
+
+def is_permanent(exc):
+    """True for SMTP errors that another attempt cannot fix."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(exc, smtplib.SMTPResponseException) and exc.smtp_code >= 500
+
+
+def breaks_connection(exc):
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    # Socket errors and timeouts; SMTPException is an OSError too, but the server answered
+    return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
+
+
+def record(sent, failed, now=None):
+    """Mark emails sent, and schedule a retry or dead-letter the failed ones."""
+    now = now or timezone.now()
+    for notification, exc in failed:
+        notification.last_error = f'{type(exc).__name__}: {exc}'[:1000]
+        if is_permanent(exc) or notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+            notification.status = Notification.STATUS_DEAD
+        else:
+            notification.next_attempt_at = now + datetime.timedelta(seconds=backoff(notification.attempts))
+    with transaction.atomic():
+        if sent:
+            Notification.objects.filter(pk__in=[n.pk for n in sent]).update(
+                status=Notification.STATUS_SENT, sent_at=now, last_error='',
+            )
+        if failed:
+            Notification.objects.bulk_update(
+                [notification for notification, _ in failed], ['status', 'next_attempt_at', 'last_error'],
+            )
+
+
+class Sender:
+    """Sends claimed emails over one connection, kept open between batches."""
+
+    def __init__(self, connection=None):
+        self.connection = connection or get_connection()
+        self.is_open = False
+        self.last_used = 0
+
+    def open(self):
+        if not self.is_open:
+            self.connection.open()
+            self.is_open = True
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+
+    def close_if_idle(self):
+        if self.is_open and time.monotonic() - self.last_used > settings.NOTIFICATION_CONNECTION_IDLE:
+            self.close()
+
+    def send(self, notifications):
+        """Send each email; returns (sent, [(notification, exception), ...])."""
+        sent, failed = [], []
+        for i, notification in enumerate(notifications):
+            try:
+                self.open()
+            except Exception as exc:
+                # Server unreachable: the rest of the batch would fail the same way
+                failed.extend((n, exc) for n in notifications[i:])
+                break
+            message = EmailMessage(
+                notification.subject, notification.body, notification.from_email, notification.recipients,
+                connection=self.connection,
+            )
+            try:
+                self.connection.send_messages([message])
+            except Exception as exc:
+                failed.append((notification, exc))
+                if breaks_connection(exc):
+                    self.close()
+            else:
+                sent.append(notification)
+            self.last_used = time.monotonic()
+        return sent, failed
+
+    def send_batch(self, limit=None):
+        """Claim, send and record one batch."""
+        batch = claim(limit or settings.NOTIFICATION_BATCH_SIZE)
+        if not batch:
+            return BatchResult(0, 0, 0, 0)
+        sent, failed = self.send(batch)
+        record(sent, failed)
+        dead = sum(1 for notification, _ in failed if notification.status == Notification.STATUS_DEAD)
+        return BatchResult(len(batch), len(sent), len(failed) - dead, dead)
+
+
+def run(once=False, poll=None, batch_size=None, connection=None, progress=None):
+    """Send due emails batch by batch. Unless ``once``, poll for more until interrupted.
+
+    Returns the totals as a BatchResult.
+    """
+    poll = settings.NOTIFICATION_POLL_INTERVAL if poll is None else poll
+    sender = Sender(connection)
+    totals = BatchResult(0, 0, 0, 0)
+    try:
+        while True:
+            result = sender.send_batch(batch_size)
+            if result.claimed:
+                totals = BatchResult(*(a + b for a, b in zip(totals, result)))
+                if progress:
+                    progress(result)
+                continue
+            if once:
+                break
+            sender.close_if_idle()
+            time.sleep(poll)
+    finally:
+        sender.close()
+    return totals
+
+
+def requeue(queryset):
+    """Make dead letters (or any emails) due again with a fresh attempt count."""
+    return queryset.exclude(status=Notification.STATUS_SENT).update(
+        status=Notification.STATUS_PENDING, attempts=0, next_attempt_at=timezone.now(),
+    )
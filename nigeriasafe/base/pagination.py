@@ -0,0 +1,169 @@
+"""Keyset (cursor) pagination over ``(created_at, id)``, newest first.
+
+Instead of OFFSET, each page starts strictly after (or before) the row a
+cursor points at, so fetching page 500 costs the same as page 1 and rows
+inserted while a dispatcher scrolls do not shift the pages. Cursors are
+opaque URL-safe strings; an unreadable cursor falls back to the first page.
+
+``ranked_page`` does the same over any tuple of fields, all descending,
+for feeds ordered by something other than recency alone.
+"""
+import base64
+import binascii
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(obj):
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, pk) for a cursor, or None if it cannot be read."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    if created_at is None:
+        return None
+    return created_at, pk
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def keyset_page(queryset, after=None, before=None, per_page=25):
+    """Return a KeysetPage of ``queryset`` ordered by (-created_at, -id).
+
+    ``after`` continues to older rows, ``before`` goes back to newer ones.
+    Any filters already applied to the queryset are kept.
+    """
+    after = decode_cursor(after) if after else None
+    before = decode_cursor(before) if before else None
+
+    if before:
+        created_at, pk = before
+        rows = list(
+            queryset.filter(created_at__gte=created_at)
+            .filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+            .order_by('created_at', 'pk')[:per_page + 1]
+        )
+        more_newer = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1]) if rows else None,
+            prev_cursor=encode_cursor(rows[0]) if rows and more_newer else None,
+        )
+
+    if after:
+        created_at, pk = after
+        # The plain range filter lets SQLite seek the (created_at, id) index
+        queryset = (
+            queryset.filter(created_at__lte=created_at)
+            .filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        )
+    rows = list(queryset.order_by('-created_at', '-pk')[:per_page + 1])
+    more_older = len(rows) > per_page
+    rows = rows[:per_page]
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1]) if rows and more_older else None,
+        prev_cursor=encode_cursor(rows[0]) if rows and after else None,
+    )
+
+
+def encode_keys(obj, fields):
+    raw = '|'.join(
+        value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        for value in (getattr(obj, field) for field in fields)
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_keys(cursor, model, fields):
+    """Return the field values a cursor holds, or None if it cannot be read."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        parts = raw.split('|')
+        if len(parts) != len(fields):
+            return None
+        values = []
+        for field, part in zip(fields, parts):
+            model_field = model._meta.pk if field == 'pk' else model._meta.get_field(field)
+            values.append(model_field.to_python(part))
+    except (ValueError, ValidationError, binascii.Error, UnicodeDecodeError):
+        return None
+    if any(value is None for value in values):
+        return None
+    return values
+
+
+def _beyond(fields, values, direction):
+    """Rows strictly past ``values`` in tuple order: 'lt' for later pages, 'gt' for earlier ones."""
+    condition = Q()
+    for i, field in enumerate(fields):
+        equal = {f: v for f, v in zip(fields[:i], values[:i])}
+        condition |= Q(**equal, **{f'{field}__{direction}': values[i]})
+    # The plain bound on the first field lets SQLite seek the index
+    return Q(**{f'{fields[0]}__{direction}e': values[0]}) & condition
+
+
+def ranked_page(queryset, fields, after=None, before=None, per_page=25):
+    """Return a KeysetPage of ``queryset`` ordered by ``fields``, each descending.
+
+    The last field must be unique (normally ``pk``) so that every row has
+    one place in the order.
+    """
+    model = queryset.model
+    descending = [f'-{field}' for field in fields]
+    before = decode_keys(before, model, fields) if before else None
+    after = decode_keys(after, model, fields) if after else None
+
+    if before:
+        rows = list(queryset.filter(_beyond(fields, before, 'gt')).order_by(*fields)[:per_page + 1])
+        more_newer = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_keys(rows[-1], fields) if rows else None,
+            prev_cursor=encode_keys(rows[0], fields) if rows and more_newer else None,
+        )
+
+    if after:
+        queryset = queryset.filter(_beyond(fields, after, 'lt'))
+    rows = list(queryset.order_by(*descending)[:per_page + 1])
+    more_older = len(rows) > per_page
+    rows = rows[:per_page]
+    return KeysetPage(
+        rows,
+        next_cursor=encode_keys(rows[-1], fields) if rows and more_older else None,
+        prev_cursor=encode_keys(rows[0], fields) if rows and after else None,
+    )
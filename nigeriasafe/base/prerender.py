@@ -0,0 +1,199 @@
+"""Pre-rendered, precompressed copies of the static guidance pages.
+
+The safety guides, emergency numbers, about and resources pages only change
+on deploy, yet every hit used to go through the template engine. The
+``prerender_pages`` management command renders each one once, as an
+anonymous visitor would see it. It writes identity, gzip and brotli files
+named by content hash into ``PRERENDERED_PAGES_DIR``, plus a manifest.
+
+Views wrapped in ``serve_prerendered`` return those bytes directly to
+anonymous visitors, with a strong ETag and 304 for matching If-None-Match.
+Signed-in users still get a live render because the navigation bar depends on
+who they are, and so does any page that has not been built yet.
+"""
+import functools
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse, HttpResponseNotModified
+from django.template import TemplateDoesNotExist
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# URL name -> template for every page that can be pre-rendered
+PAGES = {
+    'about': 'base/about.html',
+    'resources': 'base/resources.html',
+    'fire_safety': 'base/fire-safety.html',
+    'first_aid': 'base/first-aid.html',
+    'flooding_safety': 'base/flooding-safety.html',
+    'landslides_safety': 'base/landslides-safety.html',
+    'extreme_heat': 'base/extreme-heat.html',
+    'water_safety': 'base/water-safety.html',
+    'emergency_numbers': 'base/emergency-numbers.html',
+}
+
+MANIFEST_NAME = 'manifest.json'
+# Preferred order when the client accepts several encodings
+ENCODINGS = ('br', 'gzip')
+SUFFIXES = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+
+
+def output_dir():
+    return settings.PRERENDERED_PAGES_DIR
+
+
+def build(names=None):
+    """Render, compress and write the given pages (all by default).
+
+    Returns (manifest, skipped) where ``skipped`` maps page names to the
+    reason they could not be rendered.
+    """
+    out = output_dir()
+    os.makedirs(out, exist_ok=True)
+    manifest = load_manifest_file()
+    skipped = {}
+    for name in names or PAGES:
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        try:
+            html = render_to_string(PAGES[name], request=request).encode()
+        except TemplateDoesNotExist as e:
+            skipped[name] = f'template not found: {e}'
+            manifest.pop(name, None)
+            continue
+
+        digest = hashlib.sha256(html).hexdigest()[:16]
+        variants = {'identity': html, 'gzip': gzip.compress(html, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(html, quality=11)
+        files = {}
+        for encoding, body in variants.items():
+            filename = f'{name}.{digest}.html{SUFFIXES[encoding]}'
+            with open(os.path.join(out, filename), 'wb') as fh:
+                fh.write(body)
+            files[encoding] = {'file': filename, 'size': len(body)}
+        manifest[name] = {'hash': digest, 'files': files}
+
+    tmp = os.path.join(out, MANIFEST_NAME + '.tmp')
+    with open(tmp, 'w') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(out, MANIFEST_NAME))
+    _remove_stale_files(out, manifest)
+    return manifest, skipped
+
+
+def load_manifest_file():
+    try:
+        with open(os.path.join(output_dir(), MANIFEST_NAME)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _remove_stale_files(out, manifest):
+    keep = {MANIFEST_NAME}
+    for entry in manifest.values():
+        keep.update(f['file'] for f in entry['files'].values())
+    for filename in os.listdir(out):
+        if filename.endswith(('.html', '.html.gz', '.html.br')) and filename not in keep:
+            os.remove(os.path.join(out, filename))
+
+
+class PrerenderedPages:
+    """Page bytes held in memory, reloaded when the manifest file changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._pages = {}
+
+    def get(self, name):
+        path = os.path.join(output_dir(), MANIFEST_NAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._pages = self._load()
+                    self._mtime = mtime
+        return self._pages.get(name)
+
+    def _load(self):
+        pages = {}
+        for name, entry in load_manifest_file().items():
+            bodies = {}
+            for encoding, info in entry['files'].items():
+                try:
+                    with open(os.path.join(output_dir(), info['file']), 'rb') as fh:
+                        bodies[encoding] = fh.read()
+                except OSError:
+                    pass
+            if 'identity' in bodies:
+                pages[name] = {'hash': entry['hash'], 'bodies': bodies}
+        return pages
+
+
+pages = PrerenderedPages()
+
+
+def etag_for(digest, encoding):
+    return f'"{digest}"' if encoding == 'identity' else f'"{digest}-{encoding}"'
+
+
+def _pick_encoding(request, bodies):
+    accepted = {
+        part.split(';')[0].strip().lower()
+        for part in request.headers.get('Accept-Encoding', '').split(',')
+    }
+    for encoding in ENCODINGS:
+        if encoding in accepted and encoding in bodies:
+            return encoding
+    return 'identity'
+
+
+def serve_prerendered(name):
+    """Serve the pre-built copy of page ``name`` to anonymous GET requests."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            page = pages.get(name)
+            if page is None:
+                return view(request, *args, **kwargs)
+
+            digest = page['hash']
+            encoding = _pick_encoding(request, page['bodies'])
+            etag = etag_for(digest, encoding)
+            if_none_match = request.headers.get('If-None-Match', '')
+            # Every encoding of the same build is the same page
+            known = {etag_for(digest, e) for e in page['bodies']}
+            if if_none_match.strip() == '*' or any(
+                tag.strip().removeprefix('W/') in known for tag in if_none_match.split(',')
+            ):
+                response = HttpResponseNotModified()
+            else:
+                response = HttpResponse(page['bodies'][encoding], content_type='text/html; charset=utf-8')
+                if encoding != 'identity':
+                    response['Content-Encoding'] = encoding
+            response['ETag'] = etag
+            response['Cache-Control'] = f'public, max-age={settings.PRERENDERED_PAGES_MAX_AGE}'
+            patch_vary_headers(response, ('Accept-Encoding',))
+            return response
+        return wrapper
+    return decorator
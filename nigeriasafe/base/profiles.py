@@ -0,0 +1,67 @@
+"""The signed-in user's patient and volunteer profiles, resolved together.
+
+``ProfileMiddleware`` gives every request a lazy ``request.profiles`` with
+``patient`` and ``volunteer`` attributes. Either may be None. The first access
+loads both profiles with one joined query and caches them under the user's
+id for ``PROFILE_CACHE_TIMEOUT`` seconds. Later requests from the same user
+then cost no queries at all.
+
+The signal handlers in ``base.signals`` drop the cached entry whenever
+either profile is saved or deleted. With the default per-process cache only
+the saving process sees the change immediately, and other workers catch up
+within the timeout. A shared cache backend makes the invalidation global.
+
+The SOS views email the patient's emergency contact, so they must not act on
+a contact changed in another worker. They call ``get_profiles(user,
+fresh=True)``, which reads the database and refreshes the cached entry.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+
+Profiles = namedtuple('Profiles', 'patient volunteer')
+NO_PROFILES = Profiles(None, None)
+
+
+def cache_key(user_id):
+    return f'base:profiles:{user_id}'
+
+
+def load(user_id):
+    user = (
+        get_user_model().objects.select_related('patient_profile', 'volunteer_profile')
+        .filter(pk=user_id).first()
+    )
+    if user is None:
+        return NO_PROFILES
+    return Profiles(getattr(user, 'patient_profile', None), getattr(user, 'volunteer_profile', None))
+
+
+def get_profiles(user, fresh=False):
+    """The user's profiles, from the cache unless ``fresh``."""
+    if not user.is_authenticated:
+        return NO_PROFILES
+    key = cache_key(user.pk)
+    profiles = None if fresh else cache.get(key)
+    if profiles is None:
+        profiles = load(user.pk)
+        cache.set(key, profiles, settings.PROFILE_CACHE_TIMEOUT)
+    return profiles
+
+
+def invalidate(user_id):
+    if user_id is not None:
+        cache.delete(cache_key(user_id))
+
+
+class ProfileMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profiles = SimpleLazyObject(lambda: get_profiles(request.user))
+        return self.get_response(request)
@@ -0,0 +1,87 @@
+"""Send reads from the read-heavy pages to a replica database.
+
+Views marked with ``read_replica`` (the admin dashboard, SOS monitor,
+volunteer task list and the Tastypie resources) read the app's models from
+the ``replica`` alias when handling GET or HEAD. Everything else, including
+every write, goes to ``default``.
+
+Three rules stop a dispatcher from reading data older than their own change:
+- After any POST, ``ReadReplicaMiddleware`` sets a short-lived cookie. Reads
+  for that browser stay on the primary for ``READ_REPLICA_PIN_SECONDS``.
+- Reads inside a transaction stay on the primary.
+- Sessions and users (django.contrib) are always read from the primary.
+
+Without a ``replica`` entry in ``DATABASES``, everything uses ``default``.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_COOKIE = 'db_pin'
+SAFE_METHODS = ('GET', 'HEAD')
+# Apps whose models may be read from the replica
+REPLICA_APP_LABELS = {'base'}
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def read_replica(view):
+    """Mark a view as safe to serve from the read replica on GET/HEAD."""
+    view.use_read_replica = True
+    return view
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            _use_replica.get()
+            and model._meta.app_label in REPLICA_APP_LABELS
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or Django would save a replica-loaded instance back to the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary, never migrated on its own
+        return db != REPLICA_DB_ALIAS
+
+
+class ReadReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        if request.method not in SAFE_METHODS and replica_configured():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.READ_REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            getattr(view_func, 'use_read_replica', False)
+            and request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES
+            and replica_configured()
+        ):
+            _use_replica.set(True)
@@ -0,0 +1,98 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import dispatch, live, profiles, stats
+from .models import Patient, SOSAlert, Task, Volunteer
+
+
+# Sent with instances=[...] after a bulk_create, which skips post_save
+bulk_created = Signal()
+
+
+@receiver(post_save, sender=Volunteer)
+def volunteer_saved(sender, instance, **kwargs):
+    index = dispatch.loaded_index()
+    if index is not None:
+        index.upsert(instance)
+
+
+@receiver(post_delete, sender=Volunteer)
+def volunteer_deleted(sender, instance, **kwargs):
+    index = dispatch.loaded_index()
+    if index is not None:
+        index.remove(instance.pk)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+@receiver(post_save, sender=Volunteer)
+@receiver(post_delete, sender=Volunteer)
+def profile_changed(sender, instance, **kwargs):
+    profiles.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=SOSAlert)
+@receiver(post_delete, sender=SOSAlert)
+def sos_alert_changed(sender, instance, **kwargs):
+    dispatch.refresh_open_work(instance.responder_id)
+
+
+@receiver(pre_save, sender=SOSAlert)
+@receiver(pre_save, sender=Task)
+def remember_counted_fields(sender, instance, update_fields=None, **kwargs):
+    # Keep the stored values of broken-down fields so post_save can move counts
+    instance._stats_old_values = None
+    # update_fields makes even a freshly built instance an UPDATE
+    if instance.pk is None or (instance._state.adding and update_fields is None):
+        return
+    fields = stats.TRACKED[sender]
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if all(field in loaded for field in fields):
+        # The values the row was loaded with (LoadedValuesMixin): no query
+        instance._stats_old_values = {field: loaded[field] for field in fields}
+    else:
+        # Built by hand or loaded with these fields deferred, so ask the database
+        instance._stats_old_values = sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=Volunteer)
+@receiver(post_save, sender=SOSAlert)
+@receiver(post_save, sender=Task)
+def count_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        stats.record_created(sender, [instance])
+    elif getattr(instance, '_stats_old_values', None):
+        stats.record_changed(instance, instance._stats_old_values)
+    fields = stats.TRACKED[sender]
+    if fields and hasattr(instance, '_loaded_values'):
+        # What the row holds now, for the instance's next save
+        written = fields if update_fields is None else [field for field in fields if field in update_fields]
+        instance._loaded_values.update({field: getattr(instance, field) for field in written})
+    elif fields and created:
+        instance._loaded_values = {field: getattr(instance, field) for field in fields}
+
+
+@receiver(post_delete, sender=Patient)
+@receiver(post_delete, sender=Volunteer)
+@receiver(post_delete, sender=SOSAlert)
+@receiver(post_delete, sender=Task)
+def count_deleted(sender, instance, **kwargs):
+    stats.record_deleted(instance)
+
+
+@receiver(bulk_created, sender=SOSAlert)
+def count_bulk_created(sender, instances, **kwargs):
+    stats.record_created(sender, instances)
+
+
+@receiver(post_save, sender=SOSAlert)
+def publish_alert_saved(sender, instance, created, **kwargs):
+    live.record([instance], 'created' if created else 'updated')
+
+
+@receiver(bulk_created, sender=SOSAlert)
+def publish_alerts_created(sender, instances, **kwargs):
+    live.record(instances, 'created')
@@ -0,0 +1,142 @@
+"""Incrementally maintained row counts for the admin dashboard.
+
+Each count lives in a DashboardCounter row keyed by model name, for example
+``sosalert`` for all alerts or ``sosalert.status.pending`` for one status. The
+signal handlers in ``base.signals`` adjust the affected rows on every save and
+delete, so reading the overview is a single small query no matter how large
+the underlying tables get.
+
+Writes that bypass the model signals must adjust the counters themselves:
+- ``bulk_create``: send ``base.signals.bulk_created``, whose handler calls
+  ``record_created``. The SOS ingest paths and the batch view do this.
+- ``QuerySet.update`` or ``bulk_update`` that changes a field in ``TRACKED``,
+  and raw SQL that inserts or deletes rows: call ``adjust`` in the same
+  transaction, as ``base.archive`` does. Updates of other fields, such as
+  ``base.coalesce.bump``, need nothing.
+- ``QuerySet.delete`` is fine: it sends post_delete for every row.
+
+Anything missed makes the counters drift. ``get_counts`` therefore rebuilds
+them once they are older than ``DASHBOARD_STATS_MAX_AGE``, and the
+``rebuild_dashboard_stats`` management command rebuilds them on demand.
+"""
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import DashboardCounter, Patient, SOSAlert, Task, Volunteer
+
+
+# Models whose rows are counted, and the fields broken down per value.
+TRACKED = {
+    Patient: (),
+    Volunteer: (),
+    SOSAlert: ('status',),
+    Task: ('urgency', 'status'),
+}
+
+# Marks the table as populated, so increments are not applied to a partial set.
+# Its value is the Unix time of the last rebuild.
+READY_KEY = '_ready'
+
+# Whether this process has seen READY_KEY. Only True is remembered: once the
+# table is populated it stays so, since rebuild replaces it in one transaction.
+_ready = False
+
+
+def _keys(model, values):
+    name = model._meta.model_name
+    return [name] + [f'{name}.{field}.{value}' for field, value in values.items()]
+
+
+def _field_values(instance):
+    return {field: getattr(instance, field) for field in TRACKED[type(instance)]}
+
+
+def adjust(deltas):
+    """Apply {key: delta} to the counters, creating rows for new keys."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas or not is_ready():
+        return
+    with transaction.atomic():
+        for key, delta in deltas.items():
+            updated = DashboardCounter.objects.filter(key=key).update(value=F('value') + delta)
+            if not updated:
+                counter, _ = DashboardCounter.objects.get_or_create(key=key)
+                DashboardCounter.objects.filter(pk=counter.pk).update(value=F('value') + delta)
+
+
+def is_ready():
+    """True once the counters have been built; asks the database until then."""
+    global _ready
+    if not _ready:
+        _ready = DashboardCounter.objects.filter(key=READY_KEY).exists()
+    return _ready
+
+
+def record_created(model, instances):
+    deltas = {}
+    for instance in instances:
+        for key in _keys(model, _field_values(instance)):
+            deltas[key] = deltas.get(key, 0) + 1
+    adjust(deltas)
+
+
+def record_deleted(instance):
+    adjust({key: -1 for key in _keys(type(instance), _field_values(instance))})
+
+
+def record_changed(instance, old_values):
+    new_values = _field_values(instance)
+    deltas = {}
+    for field, old in old_values.items():
+        new = new_values[field]
+        if old != new:
+            name = type(instance)._meta.model_name
+            deltas[f'{name}.{field}.{old}'] = -1
+            deltas[f'{name}.{field}.{new}'] = 1
+    adjust(deltas)
+
+
+def rebuild():
+    """Recompute every counter from the tables themselves."""
+    global _ready
+    with transaction.atomic():
+        # Take the write lock before counting, so no save can commit between
+        # the counts and the new rows: the DELETE locks the counter rows on
+        # PostgreSQL, and is the write that takes SQLite's database lock
+        DashboardCounter.objects.all().delete()
+        counts = {}
+        for model, fields in TRACKED.items():
+            name = model._meta.model_name
+            counts[name] = model.objects.count()
+            for field in fields:
+                for value, _ in model._meta.get_field(field).choices:
+                    counts[f'{name}.{field}.{value}'] = 0
+                rows = model.objects.values(field).annotate(n=Count('pk')).values_list(field, 'n')
+                for value, n in rows:
+                    counts[f'{name}.{field}.{value}'] = n
+        counts[READY_KEY] = int(time.time())
+        DashboardCounter.objects.bulk_create([
+            DashboardCounter(key=key, value=value) for key, value in counts.items()
+        ])
+    _ready = True
+    return counts
+
+
+def get_counts():
+    """Return {key: count} for every counter, rebuilding it on first use and when it is too old."""
+    counts = dict(DashboardCounter.objects.values_list('key', 'value'))
+    if READY_KEY not in counts or time.time() - counts[READY_KEY] > settings.DASHBOARD_STATS_MAX_AGE:
+        counts = rebuild()
+    return counts
+
+
+def breakdown(counts, model, field):
+    """Return {value: count} for one broken-down field, in choice order."""
+    name = model._meta.model_name
+    return {
+        value: counts.get(f'{name}.{field}.{value}', 0)
+        for value, _ in model._meta.get_field(field).choices
+    }
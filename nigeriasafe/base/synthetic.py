@@ -0,0 +1,310 @@
+"""Deterministic synthetic data for scale testing.
+
+``generate`` fills the database with volunteers, patients, tasks and SOS
+alerts. Locations cluster around Nigerian cities in proportion to their
+population, with some rural scatter. Alerts follow a daily cycle, and older
+alerts are more likely to be resolved. Each chunk of rows is built from its
+own ``random.Random`` seeded with (seed, model, chunk). The rows therefore do
+not depend on how many worker processes built them or in what order. MRNs
+are reserved as one block up front and sliced per chunk, for the same reason.
+
+Worker processes build the rows. The parent process alone writes them, one
+``bulk_create`` transaction per chunk, because SQLite takes one writer at a
+time. ``bulk_create`` sends no post_save, so the dashboard counters are
+rebuilt at the end.
+"""
+import collections
+import contextlib
+import datetime
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import mrn, stats
+from .models import Patient, SOSAlert, Task, Volunteer
+
+
+# (city, latitude, longitude, population in millions)
+CITIES = [
+    ('Lagos', 6.5244, 3.3792, 15.4),
+    ('Kano', 12.0022, 8.5920, 4.1),
+    ('Ibadan', 7.3775, 3.9470, 3.6),
+    ('Abuja', 9.0765, 7.3986, 3.8),
+    ('Port Harcourt', 4.8156, 7.0498, 3.2),
+    ('Benin City', 6.3350, 5.6037, 1.8),
+    ('Kaduna', 10.5105, 7.4165, 1.2),
+    ('Maiduguri', 11.8311, 13.1510, 0.8),
+    ('Aba', 5.1066, 7.3667, 1.0),
+    ('Onitsha', 6.1413, 6.8029, 1.5),
+    ('Enugu', 6.4584, 7.5464, 0.8),
+    ('Jos', 9.8965, 8.8583, 0.9),
+    ('Ilorin', 8.4966, 4.5421, 1.0),
+    ('Abeokuta', 7.1475, 3.3619, 0.6),
+    ('Warri', 5.5167, 5.7500, 0.8),
+    ('Sokoto', 13.0059, 5.2476, 0.7),
+    ('Calabar', 4.9757, 8.3417, 0.6),
+    ('Uyo', 5.0377, 7.9128, 1.1),
+]
+CITY_WEIGHTS = [city[3] for city in CITIES]
+RURAL_SHARE = 0.12
+# Rough bounding box of Nigeria for rural scatter
+LAT_RANGE = (4.3, 13.9)
+LON_RANGE = (2.7, 14.7)
+CITY_SPREAD_DEG = 0.08
+
+# Relative alert volume per local hour of the day (evening peak); WAT is UTC+1
+WAT_OFFSET = datetime.timedelta(hours=1)
+HOURLY_WEIGHTS = [2, 1, 1, 1, 1, 2, 3, 5, 6, 6, 6, 6, 6, 6, 6, 7, 8, 9, 10, 10, 9, 7, 5, 3]
+BLOOD_TYPES = [('O+', 50), ('A+', 22), ('B+', 20), ('AB+', 3), ('O-', 2), ('A-', 1.5), ('B-', 1), ('AB-', 0.5)]
+AVAILABILITY = [
+    ('Immediate (within 30 mins)', 35), ('Within 1 hour', 30),
+    ('Scheduled / On-call', 20), ('Weekends', 15),
+]
+URGENCY = [('low', 30), ('medium', 40), ('high', 22), ('critical', 8)]
+TASK_STATUS = [('pending', 30), ('in_progress', 20), ('completed', 45), ('cancelled', 5)]
+RELATIONSHIPS = ['Parent', 'Sibling', 'Spouse', 'Child', 'Friend', 'Guardian']
+FIRST_NAMES = ['Chinedu', 'Aisha', 'Emeka', 'Fatima', 'Tunde', 'Ngozi', 'Ibrahim', 'Funmilayo', 'Yusuf',
+               'Chiamaka', 'Segun', 'Zainab', 'Obinna', 'Halima', 'Kelechi', 'Amina', 'Olumide', 'Blessing']
+LAST_NAMES = ['Okafor', 'Bello', 'Adeyemi', 'Abubakar', 'Eze', 'Ogunleye', 'Musa', 'Nwosu', 'Lawal',
+              'Okonkwo', 'Danjuma', 'Balogun', 'Umar', 'Obi', 'Adebayo', 'Ibekwe', 'Sani', 'Afolabi']
+MESSAGES = ['Need help', 'Car accident', 'Fire in building', 'Medical emergency', 'Flooding', 'Robbery', '']
+
+# Filled in each worker process by _init_worker
+_context = {}
+
+
+def _choice(rng, weighted):
+    return rng.choices([value for value, _ in weighted], [weight for _, weight in weighted])[0]
+
+
+def location(rng):
+    if rng.random() < RURAL_SHARE:
+        lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+    else:
+        _, lat, lon, _ = rng.choices(CITIES, CITY_WEIGHTS)[0]
+        lat, lon = rng.gauss(lat, CITY_SPREAD_DEG), rng.gauss(lon, CITY_SPREAD_DEG)
+    return round(lat, 6), round(lon, 6)
+
+
+def timestamp(rng, now, days):
+    day = now - datetime.timedelta(days=int(rng.triangular(0, days, 0)))
+    hour = rng.choices(range(24), HOURLY_WEIGHTS)[0]
+    local = day.replace(hour=hour, minute=rng.randrange(60), second=rng.randrange(60), microsecond=rng.randrange(10**6))
+    moment = local - WAT_OFFSET
+    # An hour later than now on the current day wraps back to yesterday
+    return moment if moment <= now else moment - datetime.timedelta(days=1)
+
+
+def _name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def _phone(rng):
+    return f"0{rng.choice('789')}{rng.choice('01')}{rng.randrange(10**7, 10**8)}"
+
+
+@contextlib.contextmanager
+def historical_timestamps(*models):
+    """Let bulk_create keep the generated created_at/updated_at values."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False) or getattr(field, 'auto_now', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def build_volunteers(rng, start, count, opts):
+    """Volunteers with unsaved users attached; ``save_volunteers`` writes both."""
+    tag = f"{opts['tag']}-{opts['seed']}"
+    rows = []
+    for i in range(start, start + count):
+        first, last = _name(rng).split(' ', 1)
+        lat, lon = location(rng)
+        volunteer = Volunteer(
+            latitude=lat, longitude=lon, medical_training=rng.random() < 0.3,
+            isAvailable=_choice(rng, AVAILABILITY), location='', skills='First aid',
+            created_at=timestamp(rng, opts['now'], opts['days']),
+        )
+        volunteer.user = User(username=f'{tag}-volunteer-{i}', first_name=first, last_name=last,
+                              email=f'{tag}-volunteer-{i}@example.com', password='!')
+        rows.append(volunteer)
+    return rows
+
+
+def save_volunteers(rows):
+    users = User.objects.bulk_create([row.user for row in rows])
+    if users[0].pk is None:
+        users = list(User.objects.filter(username__in=[u.username for u in users]).order_by('pk'))
+    for row, user in zip(rows, users):
+        row.user = user
+    Volunteer.objects.bulk_create(rows)
+
+
+def build_patients(rng, start, count, opts):
+    numbers = _context['mrn_numbers'][start:start + count]
+    today = opts['now'].date()
+    rows = []
+    for number in numbers:
+        # Nigeria's population is young: median age is under 20
+        age = min(95, int(rng.expovariate(1 / 22)))
+        rows.append(Patient(
+            full_name=_name(rng), medical_record_number=mrn.format_mrn(number),
+            date_of_birth=today - datetime.timedelta(days=age * 365 + rng.randrange(365)),
+            blood_type=_choice(rng, BLOOD_TYPES), weight=round(rng.gauss(68, 12), 1),
+            height=round(rng.gauss(167, 9), 1), address=rng.choice(CITIES)[0],
+            phone_number=_phone(rng), emergency_contact_name=_name(rng),
+            emergency_contact_phone=_phone(rng), emergency_contact_relationship=rng.choice(RELATIONSHIPS),
+            created_at=timestamp(rng, opts['now'], opts['days']),
+        ))
+    for row in rows:
+        row.updated_at = row.created_at
+    return rows
+
+
+def build_tasks(rng, start, count, opts):
+    rows = []
+    for i in range(count):
+        created = timestamp(rng, opts['now'], opts['days'])
+        status = _choice(rng, TASK_STATUS)
+        rows.append(Task(
+            title=f'{rng.choice(MESSAGES) or "Support"} #{start + i}', location=rng.choice(CITIES)[0],
+            urgency=_choice(rng, URGENCY), description='Synthetic task', status=status,
+            created_by_id=_context['staff_id'], created_at=created, updated_at=created,
+            isActive=status in ('pending', 'in_progress'),
+        ))
+    return rows
+
+
+def build_alerts(rng, start, count, opts):
+    patient_ids = _context['patient_ids']
+    volunteer_ids = _context['volunteer_ids']
+    rows = []
+    for _ in range(count):
+        created = timestamp(rng, opts['now'], opts['days'])
+        age_days = (opts['now'] - created).total_seconds() / 86400
+        # Alerts are resolved within days; only recent ones are likely to be open
+        open_chance = 0.6 * math.exp(-age_days / 2)
+        roll = rng.random()
+        if roll < open_chance / 2:
+            status = SOSAlert.STATUS_PENDING
+        elif roll < open_chance:
+            status = SOSAlert.STATUS_ACK
+        else:
+            status = SOSAlert.STATUS_RESOLVED
+        resolved_at = None
+        if status == SOSAlert.STATUS_RESOLVED:
+            # Most alerts are closed within a few hours
+            resolved_at = min(opts['now'], created + datetime.timedelta(minutes=rng.expovariate(1 / 90)))
+        lat, lon = location(rng)
+        rows.append(SOSAlert(
+            patient_id=rng.choice(patient_ids) if patient_ids and rng.random() < 0.4 else None,
+            responder_id=rng.choice(volunteer_ids) if volunteer_ids and status != SOSAlert.STATUS_PENDING else None,
+            latitude=lat, longitude=lon, message=rng.choice(MESSAGES), phone=_phone(rng),
+            status=status, created_at=created, last_seen_at=created, resolved_at=resolved_at,
+            client_created_at=created - datetime.timedelta(seconds=rng.randrange(30)),
+        ))
+    return rows
+
+
+BUILDERS = {
+    'volunteers': (Volunteer, build_volunteers),
+    'patients': (Patient, build_patients),
+    'tasks': (Task, build_tasks),
+    'alerts': (SOSAlert, build_alerts),
+}
+
+
+def _init_worker(context):
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    _context.clear()
+    _context.update(context)
+
+
+def _build_chunk(kind, chunk, start, count, opts):
+    _, build = BUILDERS[kind]
+    rng = random.Random(f"{opts['seed']}:{kind}:{chunk}")
+    return build(rng, start, count, opts)
+
+
+def _save_chunk(kind, rows):
+    model, _ = BUILDERS[kind]
+    with historical_timestamps(model), transaction.atomic():
+        if kind == 'volunteers':
+            save_volunteers(rows)
+        else:
+            model.objects.bulk_create(rows, batch_size=2000)
+
+
+def _chunks(total, size):
+    for chunk, start in enumerate(range(0, total, size)):
+        yield chunk, start, min(size, total - start)
+
+
+def _built_chunks(kind, chunks, opts, context, workers):
+    """Yield (count, rows) per chunk, in order, built by ``workers`` processes."""
+    if workers == 1 or len(chunks) == 1:
+        _init_worker(context)
+        for chunk, start, count in chunks:
+            yield count, _build_chunk(kind, chunk, start, count, opts)
+        return
+    # Children must not share the parent's database connections
+    connections.close_all()
+    methods = multiprocessing.get_all_start_methods()
+    mp_context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+    with ProcessPoolExecutor(workers, mp_context=mp_context, initializer=_init_worker,
+                             initargs=(context,)) as pool:
+        # Keep a few chunks built ahead of the writer, not the whole table in memory
+        pending = collections.deque()
+        for chunk, start, count in chunks:
+            pending.append((count, pool.submit(_build_chunk, kind, chunk, start, count, opts)))
+            if len(pending) >= workers * 2:
+                count, future = pending.popleft()
+                yield count, future.result()
+        while pending:
+            count, future = pending.popleft()
+            yield count, future.result()
+
+
+def generate(volunteers=0, patients=0, tasks=0, alerts=0, seed=42, days=365, chunk_size=10000,
+             workers=1, tag='synthetic', progress=None):
+    """Create the requested number of rows of each model.
+
+    ``progress(kind, done, total, elapsed)`` is called after every chunk.
+    """
+    opts = {'seed': seed, 'days': days, 'tag': tag, 'now': timezone.now()}
+    staff, _ = User.objects.get_or_create(username=f'{tag}-staff', defaults={'is_staff': True, 'password': '!'})
+    context = {'staff_id': staff.pk, 'mrn_numbers': mrn.reserve(patients) if patients else range(0)}
+
+    plan = [('volunteers', volunteers), ('patients', patients), ('tasks', tasks), ('alerts', alerts)]
+    for kind, total in plan:
+        if not total:
+            continue
+        if kind == 'alerts':
+            # Alerts refer to any patient and volunteer, old or new
+            context['patient_ids'] = list(Patient.objects.order_by('id').values_list('id', flat=True))
+            context['volunteer_ids'] = list(Volunteer.objects.order_by('id').values_list('id', flat=True))
+        started = time.monotonic()
+        done = 0
+        for count, rows in _built_chunks(kind, list(_chunks(total, chunk_size)), opts, context, workers):
+            _save_chunk(kind, rows)
+            done += count
+            if progress:
+                progress(kind, done, total, time.monotonic() - started)
+
+    stats.rebuild()
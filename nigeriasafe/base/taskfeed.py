@@ -0,0 +1,75 @@
+"""The volunteer task feed: ranked, paginated and cheap to poll.
+
+Active tasks are ordered by urgency (critical first), then newest first.
+Pages are keyset pages over ``(urgency_rank, created_at, id)``, which is
+exactly the order of the feed's index.
+
+Volunteers reload the feed constantly. Each response therefore carries an
+ETag built from the feed's ``version``: the row count and latest
+``updated_at`` of the filtered tasks. Both come from the partial
+(urgency, updated_at) index over active tasks, without reading any task rows. A poll whose
+If-None-Match still matches gets a 304 after that one query. Any created,
+edited, toggled or deleted task changes the count or the latest
+``updated_at``, and so the ETag.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import Task
+from .pagination import ranked_page
+
+
+ORDER = ('urgency_rank', 'created_at', 'pk')
+# Columns of the compact JSON rows, in order; created_at is Unix seconds
+JSON_FIELDS = ('id', 'title', 'location', 'urgency', 'status', 'created_at', 'description')
+# Change when the rendered feed changes shape, so cached copies are not reused
+FORMAT_VERSION = 1
+
+
+def clean_urgency(value):
+    return value if value in Task.URGENCY_RANKS else None
+
+
+def version(urgency=None):
+    """Return (count, latest updated_at) of the active tasks in the filter."""
+    tasks = Task.objects.filter(isActive=True)
+    if urgency:
+        tasks = tasks.filter(urgency=urgency)
+    totals = tasks.order_by().aggregate(count=Count('id'), latest=Max('updated_at'))
+    return totals['count'], totals['latest']
+
+
+def etag(user, urgency=None, fmt='html', after=None, before=None):
+    """Weak ETag for one page of the feed as seen by ``user``."""
+    count, latest = version(urgency)
+    parts = [
+        FORMAT_VERSION, count, latest.isoformat() if latest else '', fmt,
+        urgency or '', after or '', before or '', user.pk, user.is_staff,
+    ]
+    digest = hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()[:20]
+    return f'W/"tasks-{digest}"'
+
+
+def page(urgency=None, after=None, before=None, per_page=None, fields=None):
+    tasks = Task.objects.filter(isActive=True)
+    if urgency:
+        # Filtering on the rank keeps the feed index usable for the order
+        tasks = tasks.filter(urgency_rank=Task.URGENCY_RANKS[urgency])
+    if fields:
+        tasks = tasks.only(*fields, 'urgency_rank')
+    return ranked_page(tasks, ORDER, after=after, before=before, per_page=per_page or settings.TASK_FEED_PAGE_SIZE)
+
+
+def as_json(feed_page):
+    return {
+        'fields': JSON_FIELDS,
+        'rows': [
+            [task.id, task.title, task.location, task.urgency, task.status,
+             int(task.created_at.timestamp()), task.description]
+            for task in feed_page
+        ],
+        'next': feed_page.next_cursor,
+        'prev': feed_page.prev_cursor,
+    }
@@ -0,0 +1,41 @@
+from django import template
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+
+from base import images
+
+
+register = template.Library()
+
+
+def _srcset(variants):
+    return ', '.join(
+        f"{reverse('base:responsive_image', args=[v['file']])} {v['width']}w" for v in variants
+    )
+
+
+@register.simple_tag
+def responsive_image(path, alt='', sizes='100vw', css_class='', loading='lazy', fetchpriority=''):
+    """Render a <picture> for a static image using its generated variants.
+
+    Falls back to a plain <img> of the original file if ``build_image_variants``
+    has not been run for ``path``.
+    """
+    class_attr = format_html(' class="{}"', css_class) if css_class else ''
+    extra = format_html_join('', ' {}="{}"', [
+        (name, value) for name, value in (('loading', loading), ('fetchpriority', fetchpriority)) if value
+    ])
+    entry = images.manifest.get(path)
+    if entry is None:
+        return format_html('<img src="{}" alt="{}"{}{}>', static(path), alt, class_attr, extra)
+
+    jpeg = entry['formats']['jpeg']
+    largest = jpeg[-1]
+    return format_html(
+        '<picture{}><source type="{}" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" decoding="async"{}></picture>',
+        class_attr, images.FORMATS['webp']['mime'], _srcset(entry['formats']['webp']), sizes,
+        reverse('base:responsive_image', args=[largest['file']]), _srcset(jpeg), sizes,
+        largest['width'], largest['height'], alt, extra,
+    )
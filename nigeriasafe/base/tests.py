@@ -1,3 +1,1675 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import gzip
+import io
+import importlib
+import json
+import math
+import os
+import random
+import re
+import smtplib
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from . import (
+    archive, coalesce, dispatch, export, geo, idempotency, images, ingest, live, metrics, mrn, offline, outbox,
+    prerender, profiles, routers, stats, synthetic, wire,
+)
+from .forms import CustomUserCreationForm
+from .models import (
+    AlertEvent, DashboardCounter, IdempotencyKey, Notification, Patient, Sequence, SOSAlert, SOSAlertArchive, Task,
+    Volunteer,
+)
+from .mrn import allocator
+from .pagination import decode_cursor, decode_keys, encode_cursor, encode_keys, keyset_page, ranked_page
+from .signals import bulk_created
+
+
+PROJECT_DIR = str(Path(__file__).resolve().parent.parent)
+# Multiplies every wall-clock budget, for slow CI machines
+TIME_SCALE = float(os.environ.get('PERF_BUDGET_SCALE', '1'))
+
+
+class QueryRecorder:
+    """Database execute wrapper keeping each query's SQL and the project frames that ran it."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        frames = [
+            f"{os.path.relpath(frame.filename, PROJECT_DIR)}:{frame.lineno} in {frame.name}"
+            for frame in traceback.extract_stack()[:-1]
+            if frame.filename.startswith(PROJECT_DIR) and not frame.filename.endswith('tests.py')
+        ]
+        self.queries.append((sql, frames))
+        return execute(sql, params, many, context)
+
+    def repeated(self):
+        """Return [(count, sql, frames)] for statements run more than once, worst first."""
+        counts = Counter()
+        sources = defaultdict(set)
+        for sql, frames in self.queries:
+            if sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+                continue
+            # The same statement with different literals is still the same query
+            template = re.sub(r"\b\d+\b|'[^']*'", '?', sql)
+            template = re.sub(r'^SELECT .*? FROM', 'SELECT ... FROM', template)
+            counts[template] += 1
+            sources[template].add(frames[-1] if frames else '(outside the project)')
+        return [(n, sql, sorted(sources[sql])) for sql, n in counts.most_common() if n > 1]
+
+
+class PerformanceBudgetMixin:
+    """``assertBudget`` runs one request and checks its query count and duration.
+
+    The request is made twice and the second run is measured, so one-off work
+    such as template compilation or warming a cache does not count.
+    """
+
+    def assertBudget(self, url, queries, seconds=0.5, method='get', data=None, client=None,
+                     content_type=None, status=None):
+        client = client or self.client
+        kwargs = {'content_type': content_type} if content_type else {}
+
+        def request():
+            response = getattr(client, method)(url, data, **kwargs)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+            return response
+
+        request()
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            started = time.perf_counter()
+            response = request()
+            elapsed = time.perf_counter() - started
+
+        label = f"{method.upper()} {url}"
+        if status is not None:
+            self.assertEqual(response.status_code, status, f"{label} returned {response.status_code}")
+        else:
+            self.assertLess(response.status_code, 500, f"{label} returned {response.status_code}")
+        if len(recorder.queries) > queries:
+            lines = [f"{label} ran {len(recorder.queries)} queries (budget {queries})."]
+            repeated = recorder.repeated()
+            if repeated:
+                lines.append('Repeated queries:')
+                for n, sql, sources in repeated:
+                    lines.append(f"  {n}x {sql[:300]}")
+                    lines.extend(f"      from {source}" for source in sources)
+            self.fail('\n'.join(lines))
+        budget = seconds * TIME_SCALE
+        self.assertLessEqual(elapsed, budget, f"{label} took {elapsed * 1000:.0f} ms (budget {budget * 1000:.0f} ms)")
+        return response
+
+
+def seed_volumes(patients=60, volunteers=60, alerts=400, tasks=150):
+    """Populate the tables at a volume where per-row queries stand out."""
+    staff = [User.objects.create_user(f'staff{i}', is_staff=True) for i in range(3)]
+    User.objects.bulk_create(
+        [User(username=f'patient{i}', first_name='Patient', last_name=str(i)) for i in range(patients)]
+        + [User(username=f'volunteer{i}', first_name='Volunteer', last_name=str(i)) for i in range(volunteers)]
+    )
+    patient_users = list(User.objects.filter(username__startswith='patient').order_by('pk'))
+    volunteer_users = list(User.objects.filter(username__startswith='volunteer').order_by('pk'))
+    Patient.objects.bulk_create([
+        Patient(
+            user=user, full_name=user.get_full_name(), medical_record_number=mrn,
+            date_of_birth=datetime.date(1980, 1, 1), weight=70, height=170, address='Ikeja, Lagos',
+            phone_number='08000000000', emergency_contact_name='Kin', emergency_contact_phone='08000000001',
+            emergency_contact_relationship='Sibling',
+        )
+        for user, mrn in zip(patient_users, allocator.many(len(patient_users)))
+    ])
+    Volunteer.objects.bulk_create([
+        Volunteer(user=user, latitude=6 + i / 100, longitude=3 + i / 100, medical_training=i % 2 == 0)
+        for i, user in enumerate(volunteer_users)
+    ])
+    patient_rows = list(Patient.objects.order_by('pk'))
+    volunteer_rows = list(Volunteer.objects.order_by('pk'))
+    statuses = [choice for choice, _ in SOSAlert.STATUS_CHOICES]
+    SOSAlert.objects.bulk_create([
+        SOSAlert(
+            patient=patient_rows[i % len(patient_rows)], latitude=6.5 + i / 1000, longitude=3.3 + i / 1000,
+            status=statuses[i % len(statuses)], message='Help needed',
+            responder=volunteer_rows[i % len(volunteer_rows)] if i % 3 else None,
+        )
+        for i in range(alerts)
+    ])
+    urgencies = [choice for choice, _ in Task.URGENCY_CHOICES]
+    Task.objects.bulk_create([
+        Task(title=f'Task {i}', location='Lagos', description='Deliver supplies',
+             urgency=urgencies[i % len(urgencies)], created_by=staff[i % len(staff)])
+        for i in range(tasks)
+    ])
+    stats.rebuild()
+    return {
+        'staff': staff[0],
+        'patient': patient_users[0],
+        'volunteer': volunteer_users[0],
+        'alert': SOSAlert.objects.order_by('pk').first(),
+        'task': Task.objects.order_by('pk').first(),
+    }
+
+
+class ViewBudgetTests(PerformanceBudgetMixin, TestCase):
+    """Query and time budgets for every route in base/urls.py.
+
+    Per-row lookups make a page's query count grow with the number of rows it
+    shows. The seeded volume is large enough for that to blow any budget here.
+    Signed-in requests include two queries for the session and the user.
+    The test client is WSGI, so sos_stream only answers 204 here; LiveFeedTests
+    covers the stream itself.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.people = seed_volumes()
+
+    def login(self, role):
+        self.client.force_login(self.people[role])
+
+    def test_public_pages(self):
+        # power_outage is left out: its template, base/power-outage.html, does not exist yet
+        for name in ('home', 'about', 'contact', 'resources', 'fire_safety', 'first_aid', 'flooding_safety',
+                     'landslides_safety', 'extreme_heat', 'water_safety', 'emergency_numbers',
+                     'signin', 'registerform', 'service_worker'):
+            with self.subTest(name=name):
+                self.assertBudget(reverse(f'base:{name}'), queries=0)
+
+    def test_responsive_image_unknown_file(self):
+        self.assertBudget(reverse('base:responsive_image', args=['missing.480w.jpg']), queries=0, status=404)
+
+    def test_patient_pages(self):
+        self.login('patient')
+        self.assertBudget(reverse('base:home'), queries=2)
+        self.assertBudget(reverse('base:medical_id'), queries=2)
+        self.assertBudget(reverse('base:volunteer'), queries=2)
+
+    def test_sos_alert(self):
+        body = json.dumps({'latitude': 6.45, 'longitude': 3.39, 'message': 'Help'})
+        self.assertBudget(reverse('base:sos_alert'), queries=6, method='post', data=body,
+                          content_type='application/json')
+
+    def test_sos_alert_batch(self):
+        body = json.dumps([
+            {'latitude': 6.45 + i / 100, 'longitude': 3.39, 'client_id': f'c{i}'} for i in range(20)
+        ])
+        self.assertBudget(reverse('base:sos_alert_batch'), queries=8, method='post', data=body,
+                          content_type='application/json')
+
+    def test_send_sos_email(self):
+        self.login('patient')
+        body = json.dumps({'latitude': 6.45, 'longitude': 3.39})
+        # The profile is read fresh for the emergency contact, and the email is only queued: one INSERT
+        self.assertBudget(reverse('base:send_sos_email'), queries=4, method='post', data=body,
+                          content_type='application/json')
+
+    def test_volunteer_tasks(self):
+        self.login('volunteer')
+        # One query for the ETag validator, one for the page of tasks
+        self.assertBudget(reverse('base:volunteer_tasks'), queries=4)
+        self.assertBudget(reverse('base:volunteer_tasks') + '?urgency=high&format=json', queries=4)
+
+    def test_admin_dashboard_tabs(self):
+        self.login('staff')
+        url = reverse('base:admin_dashboard')
+        # The overview also lists the ten most recent alerts, tasks and patients
+        self.assertBudget(url, queries=6)
+        for query in ('?tab=sos', '?tab=sos&sos_status=pending', '?tab=tasks', '?tab=tasks&task_urgency=high',
+                      '?tab=volunteers', '?tab=patients'):
+            with self.subTest(query=query):
+                self.assertBudget(url + query, queries=4)
+
+    def test_admin_dashboard_search_and_dispatch(self):
+        self.login('staff')
+        mrn = Patient.objects.order_by('pk').first().medical_record_number
+        url = reverse('base:admin_dashboard')
+        self.assertBudget(f'{url}?search_mrn={mrn}', queries=7)
+        self.assertBudget(f"{url}?tab=sos&dispatch={self.people['alert'].id}", queries=6)
+        # Other tabs do not show the candidates, so they skip the lookup
+        self.assertBudget(f"{url}?tab=tasks&dispatch={self.people['alert'].id}", queries=4)
+
+    def test_metrics(self):
+        self.login('staff')
+        self.assertBudget(reverse('base:metrics'), queries=2)
+
+    def test_sos_monitor(self):
+        self.login('staff')
+        self.assertBudget(reverse('base:sos_monitor'), queries=4)
+
+    def test_sos_stream_needs_asgi(self):
+        self.login('staff')
+        self.assertBudget(reverse('base:sos_stream'), queries=2, status=204)
+
+    def test_dispatch_candidates(self):
+        self.login('staff')
+        self.assertBudget(reverse('base:dispatch_sos', args=[self.people['alert'].id]), queries=4)
+
+    def test_export(self):
+        self.login('staff')
+        for dataset in ('sos_alerts', 'patients', 'tasks'):
+            with self.subTest(dataset=dataset):
+                self.assertBudget(reverse('base:export_data', args=[dataset]) + '?format=csv', queries=3, seconds=1)
+
+    def test_staff_writes(self):
+        self.login('staff')
+        alert, task = self.people['alert'], self.people['task']
+        self.assertBudget(reverse('base:create_task'), queries=2)
+        self.assertBudget(reverse('base:create_task'), queries=9, method='post', data={
+            'title': 'Budget', 'location': 'Lagos', 'urgency': 'high', 'description': 'Check',
+        })
+        self.assertBudget(reverse('base:update_sos_status', args=[alert.id]), queries=6, method='post',
+                          data={'status': SOSAlert.STATUS_ACK})
+        self.assertBudget(reverse('base:update_task', args=[task.id]), queries=5, method='post',
+                          data={'status': 'in_progress', 'urgency': 'high'})
+        self.assertBudget(reverse('base:toggle_task_active', args=[task.id]), queries=5, method='post')
+        self.assertBudget(reverse('base:update_volunteer_task_status', args=[task.id]), queries=5,
+                          method='post', data={'status': 'completed'})
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('ops', is_staff=True)
+        # Flushes and other workers' files go to a scratch directory
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(METRICS_DIR=self.directory))
+
+    def write_worker(self, name, snapshot):
+        with open(os.path.join(self.directory, name), 'w') as fh:
+            json.dump(snapshot, fh)
+
+    def scrape(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('base:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def value(self, text, series):
+        for line in text.splitlines():
+            if line.startswith(series + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get(reverse('base:metrics')).status_code, 302)
+        self.client.force_login(User.objects.create_user('member'))
+        self.assertEqual(self.client.get(reverse('base:metrics')).status_code, 302)
+
+    def test_records_requests_queries_and_templates(self):
+        requests = 'nigeriasafe_requests_total{view="base:contact",method="GET",status="2xx"}'
+        rendering = 'nigeriasafe_template_render_seconds_total{view="base:contact"}'
+        before = self.scrape()
+        self.client.logout()
+        self.client.get(reverse('base:contact'))
+        self.client.get(reverse('base:contact'))
+        after = self.scrape()
+        self.assertEqual(self.value(after, requests) - self.value(before, requests), 2)
+        self.assertGreater(self.value(after, rendering), self.value(before, rendering))
+        # The previous scrape was signed in: a session and a user lookup
+        self.assertGreater(self.value(after, 'nigeriasafe_db_queries_bucket{view="base:metrics",le="2"}'), 0)
+        self.assertIn('nigeriasafe_request_duration_seconds_bucket{view="base:contact",le="+Inf"}', after)
+
+    def test_adds_up_other_workers(self):
+        self.write_worker('1-other.json', {
+            'counters': [['requests_total', 'view="elsewhere",method="GET",status="2xx"', 5]],
+            'histograms': [['db_queries', 'view="elsewhere"', [1, 0, 3, 0, 0, 0, 0, 0, 0, 0, 0, 4]]],
+        })
+        text = self.scrape()
+        self.assertEqual(self.value(text, 'nigeriasafe_requests_total{view="elsewhere",method="GET",status="2xx"}'), 5)
+        self.assertEqual(self.value(text, 'nigeriasafe_db_queries_bucket{view="elsewhere",le="2"}'), 4)
+        self.assertEqual(self.value(text, 'nigeriasafe_db_queries_count{view="elsewhere"}'), 4)
+
+    def test_exited_workers_are_folded_into_one_file(self):
+        exited = subprocess.Popen([sys.executable, '-c', ''])
+        exited.wait()
+        series = 'view="elsewhere",method="GET",status="2xx"'
+        for name, count in ((f'{exited.pid}-a.json', 2), (f'{exited.pid}-b.json', 3), (f'{os.getpid()}-c.json', 4)):
+            self.write_worker(name, {'counters': [['requests_total', series, count]], 'histograms': []})
+        first, second = self.scrape(), self.scrape()
+        files = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+        # Counted once, and still counted after the files are merged
+        for text in (first, second):
+            self.assertEqual(self.value(text, f'nigeriasafe_requests_total{{{series}}}'), 9)
+        self.assertEqual(files, [f'{os.getpid()}-c.json', metrics.RETIRED_FILE])
+
+
+class SOSCoalescingTests(TestCase):
+    def setUp(self):
+        coalesce.recent.clear()
+
+    def press(self, lat=6.4541, lon=3.3947, **extra):
+        body = {'latitude': lat, 'longitude': lon, 'device_id': 'phone-1', **extra}
+        response = self.client.post(reverse('base:sos_alert'), json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_repeat_press_updates_the_open_alert(self):
+        first = self.press()
+        second = self.press(lat=6.4550)
+        self.assertTrue(second['coalesced'])
+        self.assertEqual(second['id'], first['id'])
+        alert = SOSAlert.objects.get()
+        self.assertEqual(alert.repeat_count, 1)
+        self.assertEqual(str(alert.latitude), '6.455000')
+        self.assertEqual(alert.geohash, geo.encode_geohash(6.4550, 3.3947))
+
+    def test_repeat_press_served_from_memory(self):
+        self.press()
+        # One conditional UPDATE, then the alert is read back and stored as a live feed event
+        with self.assertNumQueries(3):
+            self.press()
+
+    def test_repeat_press_keeps_its_message(self):
+        self.press(message='Car crash')
+        self.press(message='Car crash')
+        alert_id = self.press(message='Driver is bleeding')['id']
+        self.press()
+        self.assertEqual(SOSAlert.objects.get(pk=alert_id).message, 'Car crash\nDriver is bleeding')
+
+    def test_source_key_hides_the_session(self):
+        self.client.get(reverse('base:home'))
+        self.client.session.save()
+        session_key = self.client.session.session_key
+        body = json.dumps({'latitude': 6.4541, 'longitude': 3.3947})
+        self.client.post(reverse('base:sos_alert'), body, content_type='application/json')
+        source = SOSAlert.objects.get().source_key
+        self.assertTrue(source.startswith('session:'))
+        self.assertNotIn(session_key, source)
+
+    def test_alert_from_another_worker_found_in_database(self):
+        first = self.press()
+        coalesce.recent.clear()
+        self.assertEqual(self.press()['id'], first['id'])
+
+    def test_new_alert_outside_radius_window_or_after_resolve(self):
+        first = self.press()
+        self.assertNotEqual(self.press(lat=6.50)['id'], first['id'])
+        SOSAlert.objects.update(status=SOSAlert.STATUS_RESOLVED)
+        self.assertNotIn('coalesced', self.press())
+        with override_settings(SOS_COALESCE_WINDOW=0):
+            self.assertNotIn('coalesced', self.press())
+        self.assertEqual(SOSAlert.objects.count(), 4)
+
+    def test_sources_are_kept_apart(self):
+        self.press()
+        self.assertNotIn('coalesced', self.press(device_id='phone-2'))
+        body = json.dumps({'latitude': 6.4541, 'longitude': 3.3947})
+        for _ in range(2):
+            self.client.post(reverse('base:sos_alert'), body, content_type='application/json')
+        self.assertEqual(SOSAlert.objects.count(), 4)
+
+
+class ArchiveTests(TestCase):
+    def make_alert(self, status, resolved_days_ago=None):
+        alert = SOSAlert.objects.create(latitude=6.45, longitude=3.39, status=status)
+        if resolved_days_ago is not None:
+            SOSAlert.objects.filter(pk=alert.pk).update(
+                resolved_at=timezone.now() - datetime.timedelta(days=resolved_days_ago),
+            )
+        return alert
+
+    def test_resolved_at_follows_status(self):
+        alert = self.make_alert(SOSAlert.STATUS_PENDING)
+        self.assertIsNone(alert.resolved_at)
+        alert.status = SOSAlert.STATUS_RESOLVED
+        alert.save(update_fields=['status'])
+        alert.refresh_from_db()
+        self.assertIsNotNone(alert.resolved_at)
+        alert.status = SOSAlert.STATUS_ACK
+        alert.save()
+        alert.refresh_from_db()
+        self.assertIsNone(alert.resolved_at)
+
+    def test_moves_only_long_resolved_alerts_in_chunks(self):
+        old = [self.make_alert(SOSAlert.STATUS_RESOLVED, resolved_days_ago=100) for _ in range(5)]
+        recent = self.make_alert(SOSAlert.STATUS_RESOLVED, resolved_days_ago=3)
+        pending = self.make_alert(SOSAlert.STATUS_PENDING)
+        stats.rebuild()
+
+        # An interrupted run leaves the rest for the next one
+        self.assertEqual(archive.run(days=90, chunk_size=2, limit=3), 3)
+        self.assertEqual(archive.run(days=90, chunk_size=2), 2)
+        self.assertEqual(archive.run(days=90), 0)
+
+        self.assertEqual(set(SOSAlert.objects.values_list('id', flat=True)), {recent.id, pending.id})
+        self.assertEqual(set(SOSAlertArchive.objects.values_list('id', flat=True)), {a.id for a in old})
+        counts = stats.get_counts()
+        self.assertEqual(counts['sosalert'], 2)
+        self.assertEqual(counts['sosalert.status.resolved'], 1)
+
+    def test_reads_across_both_tables_when_asked(self):
+        archived = self.make_alert(SOSAlert.STATUS_RESOLVED, resolved_days_ago=100)
+        hot = self.make_alert(SOSAlert.STATUS_RESOLVED, resolved_days_ago=1)
+        archive.run(days=90)
+        ids = [row[0] for row in archive.all_alerts('id', status=SOSAlert.STATUS_RESOLVED).order_by('id')]
+        self.assertEqual(ids, [archived.id, hot.id])
+        _, rows = export.export_rows('sos_alerts', status='resolved')
+        self.assertEqual([row[0] for row in rows], [hot.id])
+        _, rows = export.export_rows('sos_alerts', status='resolved', include_archived=True)
+        self.assertEqual(sorted(row[0] for row in rows), [archived.id, hot.id])
+
+
+class TaskFeedTests(TestCase):
+    def setUp(self):
+        staff = User.objects.create_user('feed-staff', is_staff=True)
+        self.user = User.objects.create_user('feed-volunteer')
+        Volunteer.objects.create(user=self.user, latitude=6.5, longitude=3.4)
+        self.client.force_login(self.user)
+        self.tasks = {
+            name: Task.objects.create(title=name, location='Lagos', description='x', urgency=urgency,
+                                      created_by=staff)
+            for name, urgency in [('low', 'low'), ('critical', 'critical'), ('high', 'high'),
+                                  ('critical-newer', 'critical')]
+        }
+        self.url = reverse('base:volunteer_tasks')
+
+    def test_most_urgent_first_then_newest(self):
+        response = self.client.get(self.url, {'format': 'json'})
+        titles = [row[1] for row in response.json()['rows']]
+        self.assertEqual(titles, ['critical-newer', 'critical', 'high', 'low'])
+
+    @override_settings(TASK_FEED_PAGE_SIZE=3)
+    def test_pages_and_filters(self):
+        first = self.client.get(self.url, {'format': 'json'}).json()
+        self.assertEqual(len(first['rows']), 3)
+        second = self.client.get(self.url, {'format': 'json', 'after': first['next']}).json()
+        self.assertEqual([row[1] for row in second['rows']], ['low'])
+        critical = self.client.get(self.url, {'format': 'json', 'urgency': 'critical'}).json()
+        self.assertEqual([row[1] for row in critical['rows']], ['critical-newer', 'critical'])
+        self.assertEqual(first['fields'][:2], ['id', 'title'])
+
+    def test_unchanged_poll_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        # The session, the user and the validator; no task rows are read
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        task = self.tasks['low']
+        task.status = 'in_progress'
+        task.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # Pages in other formats or filters are validated separately
+        self.assertNotEqual(self.client.get(self.url, {'format': 'json'})['ETag'], response['ETag'])
+
+
+class IdempotencyTests(TestCase):
+    def post(self, key, **payload):
+        body = json.dumps({'latitude': 6.45, 'longitude': 3.39, **payload})
+        return self.client.post(reverse('base:sos_alert'), body, content_type='application/json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.post('press-0001', message='Help')
+        retry = self.post('press-0001', message='Help')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(SOSAlert.objects.count(), 1)
+
+    def test_key_reused_for_another_request_is_rejected(self):
+        self.post('press-0002', message='Help')
+        self.assertEqual(self.post('press-0002', message='Fire').status_code, 422)
+        self.assertEqual(self.post('bad key!').status_code, 400)
+
+    def test_concurrent_retry_waits_for_the_first(self):
+        fingerprint = 'f' * 64
+        record, created = idempotency.claim('sos_alert', 'press-0003', fingerprint)
+        self.assertTrue(created)
+        again, created = idempotency.claim('sos_alert', 'press-0003', fingerprint)
+        self.assertFalse(created)
+        self.assertEqual(again.pk, record.pk)
+        response = idempotency.replay(again, fingerprint)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=60)
+    def test_expired_keys_are_reused_and_purged(self):
+        self.post('press-0004')
+        IdempotencyKey.objects.update(created_at=timezone.now() - datetime.timedelta(seconds=120))
+        retry = self.post('press-0004')
+        self.assertNotIn(idempotency.REPLAYED_HEADER, retry)
+        self.assertEqual(SOSAlert.objects.count(), 2)
+        self.assertEqual(idempotency.purge(), 0)
+        self.assertEqual(idempotency.purge(now=timezone.now() + datetime.timedelta(seconds=120)), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_server_errors_are_not_stored(self):
+        with self.settings(SOS_COALESCE_WINDOW=0):
+            with mock.patch.object(SOSAlert, 'save', side_effect=RuntimeError('db down')):
+                self.assertEqual(self.post('press-0005').status_code, 500)
+            self.assertFalse(IdempotencyKey.objects.exists())
+            self.assertEqual(self.post('press-0005').status_code, 200)
+        self.assertEqual(SOSAlert.objects.count(), 1)
+
+    @override_settings(SOS_COALESCE_WINDOW=0)
+    def test_crash_before_the_response_is_stored_leaves_nothing(self):
+        with mock.patch.object(idempotency, 'store', side_effect=RuntimeError('worker killed')):
+            with self.assertRaisesMessage(RuntimeError, 'worker killed'):
+                self.post('press-0006', message='Help')
+        # The alert was rolled back with the response, and the key released
+        self.assertFalse(SOSAlert.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+        retry = self.post('press-0006', message='Help')
+        self.assertEqual(retry.status_code, 200)
+        self.assertNotIn(idempotency.REPLAYED_HEADER, retry)
+        self.assertEqual(SOSAlert.objects.count(), 1)
+
+
+class SOSWriteBufferTests(TransactionTestCase):
+    def make_buffer(self, **kwargs):
+        buffer = ingest.SOSWriteBuffer(**kwargs)
+        self.addCleanup(buffer.stop)
+        return buffer
+
+    def test_concurrent_alerts_commit_in_one_batch(self):
+        buffer = self.make_buffer(batch_size=5, flush_interval=1)
+        with mock.patch.object(SOSAlert.objects, 'bulk_create', wraps=SOSAlert.objects.bulk_create) as bulk_create:
+            pending = [buffer.submit(SOSAlert(latitude=6.45, longitude=3.39 + i / 100)) for i in range(5)]
+            alerts = [p.wait(5) for p in pending]
+        # A full batch is written at once, without waiting out the flush interval
+        self.assertEqual(bulk_create.call_count, 1)
+        stored = SOSAlert.objects.order_by('pk').values_list('pk', flat=True)
+        self.assertEqual(sorted(a.pk for a in alerts), list(stored))
+
+    def test_failed_batch_raises_in_every_waiting_request(self):
+        buffer = self.make_buffer(batch_size=2, flush_interval=1)
+        with mock.patch.object(SOSAlert.objects, 'bulk_create', side_effect=RuntimeError('disk full')):
+            pending = [buffer.submit(SOSAlert(latitude=6.45, longitude=3.39)) for _ in range(2)]
+            for p in pending:
+                with self.assertRaisesMessage(RuntimeError, 'disk full'):
+                    p.wait(5)
+        self.assertFalse(SOSAlert.objects.exists())
+        # The writer thread survives a failed batch
+        self.assertIsNotNone(buffer.submit(SOSAlert(latitude=6.45, longitude=3.39)).wait(5).pk)
+
+    def stuck_buffer(self):
+        """A buffer whose writer holds each batch until the returned event is set."""
+        release = threading.Event()
+        taken = threading.Event()
+        buffer = self.make_buffer(batch_size=1, flush_interval=0)
+        flush = buffer._flush
+
+        def held_flush(batch):
+            taken.set()
+            release.wait(5)
+            flush(batch)
+        buffer._flush = held_flush
+        return buffer, taken, release
+
+    @override_settings(SOS_INGEST_MODE=ingest.MODE_BUFFERED, SOS_INGEST_ACK_TIMEOUT=0.05)
+    def test_timed_out_alert_is_withdrawn(self):
+        buffer, taken, release = self.stuck_buffer()
+        first = buffer.submit(SOSAlert(latitude=6.45, longitude=3.39, message='first'))
+        self.assertTrue(taken.wait(5))
+        with mock.patch.object(ingest, 'get_buffer', return_value=buffer):
+            with self.assertRaises(TimeoutError):
+                ingest.save_alert(SOSAlert(latitude=6.46, longitude=3.4, message='second'))
+        release.set()
+        first.wait(5)
+        buffer.stop()
+        # Only the alert the writer had taken is written, so a retry cannot duplicate the other
+        self.assertEqual(list(SOSAlert.objects.values_list('message', flat=True)), ['first'])
+
+    @override_settings(SOS_INGEST_MODE=ingest.MODE_BUFFERED, SOS_INGEST_ACK_TIMEOUT=0.05)
+    def test_alert_being_written_is_waited_for(self):
+        buffer, taken, release = self.stuck_buffer()
+        threading.Timer(0.2, release.set).start()
+        with mock.patch.object(ingest, 'get_buffer', return_value=buffer):
+            alert = ingest.save_alert(SOSAlert(latitude=6.45, longitude=3.39))
+        self.assertTrue(taken.is_set())
+        self.assertEqual(list(SOSAlert.objects.values_list('pk', flat=True)), [alert.pk])
+
+    @override_settings(SOS_INGEST_MODE=ingest.MODE_BUFFERED, SOS_INGEST_ACK_TIMEOUT=0.05)
+    def test_sos_alert_answers_503_on_timeout(self):
+        buffer, taken, release = self.stuck_buffer()
+        self.addCleanup(release.set)
+        buffer.submit(SOSAlert(latitude=6.45, longitude=3.39))
+        self.assertTrue(taken.wait(5))
+        with mock.patch.object(ingest, 'get_buffer', return_value=buffer):
+            response = self.client.post(reverse('base:sos_alert'), json.dumps({'latitude': 6.5, 'longitude': 3.5}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+@override_settings(SOS_INGEST_MODE=ingest.MODE_BUFFERED, SOS_INGEST_ACK_TIMEOUT=5, SOS_COALESCE_WINDOW=0)
+class BufferedIdempotencyTests(TransactionTestCase):
+    def tearDown(self):
+        ingest.get_buffer().stop()
+
+    def test_keyed_request_commits_through_the_write_buffer(self):
+        # The view must not hold a transaction while the writer thread commits
+        body = json.dumps({'latitude': 6.45, 'longitude': 3.39})
+        responses = [
+            self.client.post(reverse('base:sos_alert'), body, content_type='application/json',
+                             HTTP_IDEMPOTENCY_KEY='buffered-0001')
+            for _ in range(2)
+        ]
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(responses[1][idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(responses[1].json()['id'], responses[0].json()['id'])
+        self.assertEqual(SOSAlert.objects.count(), 1)
+
+
+class ServiceWorkerTests(TestCase):
+    def test_serves_worker_with_precache_list(self):
+        response = self.client.get(reverse('base:service_worker'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        script = response.content.decode()
+        config = json.loads(re.match(r'const OFFLINE_CONFIG = (.*);\n', script).group(1))
+        self.assertIn(reverse('base:first_aid'), config['pages'])
+        self.assertIn(reverse('base:emergency_numbers'), config['pages'])
+        # Not pre-rendered: its template does not exist
+        self.assertNotIn(reverse('base:power_outage'), config['pages'])
+        self.assertIn('/static/styles/styles.css', config['precache'])
+
+        repeat = self.client.get(reverse('base:service_worker'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+
+    def test_version_follows_the_page_build(self):
+        with tempfile.TemporaryDirectory() as out, self.settings(PRERENDERED_PAGES_DIR=out):
+            offline.script._stamp = None
+            before = offline.script.get()[1]
+            prerender.build(['first_aid'])
+            after = offline.script.get()[1]
+        offline.script._stamp = None
+        self.assertNotEqual(before, after)
+
+
+class CompactWireTests(TestCase):
+    def test_round_trip(self):
+        raised = timezone.now().replace(microsecond=0)
+        body = wire.encode(-6.524379, 3.379206, raised, 'mrn-0001-2344', 'phone-1', 'Fire * smoke')
+        # Base32 digits may arrive in either case, as SMS keyboards like
+        sent = wire.decode((body[:wire.HEAD_LENGTH].lower() + body[wire.HEAD_LENGTH:]).encode())
+        self.assertEqual((sent.latitude, sent.longitude), ingest.clean_coordinates(-6.524379, 3.379206))
+        self.assertEqual(sent.client_created_at, raised)
+        self.assertEqual((sent.mrn, sent.device_id, sent.message), ('MRN00012344', 'phone-1', 'Fire * smoke'))
+        self.assertIsNone(wire.decode(wire.encode(0, 0)).message)
+
+    def test_rejects_malformed_alerts(self):
+        for body in ['', '2' + '0' * 19, '1U' + '0' * 18, '1' + 'Z' * 19, '1 ' + '0' * 18,
+                     wire.encode(6.5, 3.4, mrn='MRN00012345')]:
+            with self.subTest(body=body), self.assertRaises(ValidationError):
+                wire.decode(body)
+
+    def test_sos_alert_accepts_compact_body(self):
+        user = User.objects.create_user('wire-patient')
+        patient = Patient.objects.create(
+            user=user, full_name='Ada Obi', date_of_birth=datetime.date(1990, 1, 1), weight=60, height=165,
+            address='Yaba, Lagos', phone_number='08000000002', emergency_contact_name='Kin',
+            emergency_contact_phone='08000000003', emergency_contact_relationship='Sibling',
+        )
+        body = wire.encode(6.45, 3.39, timezone.now(), patient.medical_record_number, 'phone-1', 'Help')
+        url = reverse('base:sos_alert')
+        response = self.client.post(url, body, content_type=wire.CONTENT_TYPE)
+        self.assertEqual(response.status_code, 200)
+        alert = SOSAlert.objects.get()
+        self.assertEqual(response.content.decode(), f'OK {alert.id}')
+        self.assertEqual((alert.patient, alert.message), (patient, 'Help'))
+        self.assertEqual(alert.source_key, coalesce.hash_source('device', 'phone-1'))
+        self.assertIsNotNone(alert.client_created_at)
+
+        # A repeat press from the same phone is folded in, and says so
+        response = self.client.post(url, body, content_type=wire.CONTENT_TYPE)
+        self.assertEqual(response.content.decode(), f'OK {alert.id} R1')
+
+        response = self.client.post(url, '1garbage', content_type=wire.CONTENT_TYPE)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.content.decode().startswith('ERR '))
+
+
+class FlakyConnection:
+    """An email backend connection that fails the sends listed in ``errors``, in order."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.opened = 0
+        self.sent = []
+
+    def open(self):
+        self.opened += 1
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        error = self.errors.pop(0) if self.errors else None
+        if error:
+            raise error
+        self.sent.extend(messages)
+        return len(messages)
+
+
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        coalesce.recent.clear()
+
+    def make_patient(self):
+        user = User.objects.create_user('outbox-patient')
+        Patient.objects.create(
+            user=user, full_name='Ada Obi', date_of_birth=datetime.date(1990, 1, 1), weight=60, height=165,
+            address='Yaba, Lagos', phone_number='08000000002', emergency_contact_name='Kin',
+            emergency_contact_phone='08000000003', emergency_contact_relationship='Sibling',
+            emergency_contact_email='kin@example.com',
+        )
+        self.client.force_login(user)
+
+    def test_views_queue_emails_for_the_worker(self):
+        self.make_patient()
+        body = json.dumps({'latitude': 6.45, 'longitude': 3.39, 'device_id': 'phone-1', 'message': 'Fire'})
+        for _ in range(2):
+            self.client.post(reverse('base:sos_alert'), body, content_type='application/json')
+        response = self.client.post(reverse('base:send_sos_email'), body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # The repeat press was folded into the first alert and sends nothing
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(mail.outbox, [])
+
+        totals = outbox.run(once=True)
+        self.assertEqual(totals, outbox.BatchResult(2, 2, 0, 0))
+        self.assertEqual([m.to for m in mail.outbox], [['kin@example.com'], ['kin@example.com']])
+        self.assertIn('Ada Obi has raised an SOS alert', mail.outbox[0].body)
+        self.assertIn('Message: Fire', mail.outbox[0].body)
+        self.assertFalse(Notification.objects.exclude(status=Notification.STATUS_SENT).exists())
+
+    @override_settings(NOTIFICATION_BATCH_SIZE=2, NOTIFICATION_RETRY_BASE=10, NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_retries_back_off_and_dead_letter(self):
+        for i in range(3):
+            outbox.enqueue(f'SOS {i}', 'Help', [f'kin{i}@example.com'])
+        connection = FlakyConnection([smtplib.SMTPServerDisconnected('gone'), None, None])
+        # Two batches over one connection; the disconnect forces one reopen
+        self.assertEqual(outbox.run(once=True, connection=connection), outbox.BatchResult(3, 2, 1, 0))
+        self.assertEqual(connection.opened, 2)
+        failed = Notification.objects.get(status=Notification.STATUS_PENDING)
+        self.assertEqual((failed.subject, failed.attempts), ('SOS 0', 1))
+        self.assertIn('SMTPServerDisconnected', failed.last_error)
+        self.assertGreater(failed.next_attempt_at, timezone.now() + datetime.timedelta(seconds=8))
+        self.assertEqual(outbox.claim(10), [])
+
+        Notification.objects.update(next_attempt_at=timezone.now())
+        connection.errors = [smtplib.SMTPServerDisconnected('gone again')]
+        self.assertEqual(outbox.run(once=True, connection=connection), outbox.BatchResult(1, 0, 0, 1))
+        self.assertEqual(Notification.objects.get(pk=failed.pk).status, Notification.STATUS_DEAD)
+
+        self.assertEqual(outbox.requeue(Notification.objects.all()), 1)
+        self.assertEqual(outbox.run(once=True, connection=connection).sent, 1)
+
+    def test_refused_recipient_is_dead_at_once(self):
+        outbox.enqueue('SOS', 'Help', ['nobody@example.com'])
+        refused = smtplib.SMTPRecipientsRefused({'nobody@example.com': (550, b'No such user')})
+        self.assertEqual(outbox.run(once=True, connection=FlakyConnection([refused])).dead, 1)
+        self.assertEqual(Notification.objects.get().attempts, 1)
+
+    @override_settings(NOTIFICATION_LEASE_SECONDS=60)
+    def test_claimed_emails_return_when_the_lease_expires(self):
+        outbox.enqueue('SOS', 'Help', ['kin@example.com'])
+        self.assertEqual(len(outbox.claim(10)), 1)
+        # A second worker finds nothing while the first holds the claim
+        self.assertEqual(outbox.claim(10), [])
+        later = timezone.now() + datetime.timedelta(seconds=61)
+        self.assertEqual([n.attempts for n in outbox.claim(10, now=later)], [2])
+
+
+class ReadReplicaTests(TransactionTestCase):
+    """Router choice and the after-POST pin, with a replica alias pretended into the settings."""
+
+    def setUp(self):
+        patcher = mock.patch.object(routers, 'replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = routers.ReadReplicaRouter()
+        self.seen = []
+
+    def request(self, method='get', cookies=None, view=None):
+        view = view or routers.read_replica(lambda request: None)
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            self.seen.append(self.router.db_for_read(SOSAlert))
+            return HttpResponse()
+
+        middleware = routers.ReadReplicaMiddleware(get_response)
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        return middleware(request)
+
+    def test_marked_reads_use_the_replica(self):
+        self.request()
+        self.request(view=lambda request: None)
+        self.request(method='head')
+        self.assertEqual(self.seen, ['replica', 'default', 'replica'])
+        # The flag does not outlive the request
+        self.assertEqual(self.router.db_for_read(SOSAlert), 'default')
+
+    def test_post_pins_the_browser_to_the_primary(self):
+        response = self.request(method='post')
+        cookie = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.READ_REPLICA_PIN_SECONDS)
+        self.request(cookies={routers.PIN_COOKIE: cookie.value})
+        self.assertEqual(self.seen, ['default', 'default'])
+        # Once the cookie has expired, reads go back to the replica
+        self.request()
+        self.assertEqual(self.seen[-1], 'replica')
+
+    def test_router_keeps_transactions_auth_and_writes_on_the_primary(self):
+        token = routers._use_replica.set(True)
+        try:
+            self.assertEqual(self.router.db_for_read(SOSAlert), 'replica')
+            self.assertEqual(self.router.db_for_read(User), 'default')
+            self.assertEqual(self.router.db_for_write(SOSAlert), 'default')
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(SOSAlert), 'default')
+        finally:
+            routers._use_replica.reset(token)
+        self.assertFalse(self.router.allow_migrate('replica', 'base'))
+        self.assertTrue(self.router.allow_migrate('default', 'base'))
+
+    def test_untouched_without_a_replica(self):
+        with mock.patch.object(routers, 'replica_configured', return_value=False):
+            response = self.request(method='post')
+            self.request()
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.seen, ['default', 'default'])
+
+
+class GeoLookupTests(TestCase):
+    """within_radius and nearest against a brute-force haversine over every row."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(7)
+        points = [(rng.uniform(6.3, 6.7), rng.uniform(3.2, 3.6)) for _ in range(300)]
+        # Points a hair either side of geohash cell edges, where a wrong cover would miss them
+        for precision in (5, 6):
+            height, width = geo.cell_size(precision)
+            edge_lat = math.floor(6.5 / height) * height
+            edge_lon = math.floor(3.4 / width) * width
+            for dlat in (-1e-6, 1e-6):
+                for dlon in (-1e-6, 1e-6):
+                    points.append((edge_lat + dlat, edge_lon + dlon))
+        SOSAlert.objects.bulk_create([SOSAlert(latitude=round(lat, 6), longitude=round(lon, 6)) for lat, lon in points])
+        cls.rows = list(SOSAlert.objects.values_list('pk', 'latitude', 'longitude'))
+        cls.edge = (edge_lat, edge_lon)
+
+    def distances(self, lat, lon):
+        return {pk: geo.haversine_km(lat, lon, row_lat, row_lon) for pk, row_lat, row_lon in self.rows}
+
+    def test_within_radius_matches_brute_force(self):
+        for lat, lon in [(6.5, 3.4), self.edge, (6.31, 3.21)]:
+            distances = self.distances(lat, lon)
+            for radius in (0.05, 0.5, 2, 10, 40):
+                with self.subTest(lat=lat, lon=lon, radius=radius):
+                    found = set(SOSAlert.objects.within_radius(lat, lon, radius).values_list('pk', flat=True))
+                    self.assertEqual(found, {pk for pk, d in distances.items() if d <= radius})
+
+    def test_radius_boundary(self):
+        lat, lon = 6.5, 3.4
+        pk, distance = sorted(self.distances(lat, lon).items(), key=lambda item: item[1])[10]
+        inside = SOSAlert.objects.within_radius(lat, lon, distance * (1 + 1e-9)).values_list('pk', flat=True)
+        outside = SOSAlert.objects.within_radius(lat, lon, distance * (1 - 1e-9)).values_list('pk', flat=True)
+        self.assertIn(pk, inside)
+        self.assertNotIn(pk, outside)
+
+    def test_nearest_matches_brute_force(self):
+        for lat, lon in [(6.5, 3.4), self.edge, (6.0, 3.0)]:
+            distances = self.distances(lat, lon)
+            for k in (1, 5, 25):
+                with self.subTest(lat=lat, lon=lon, k=k):
+                    found = [alert.pk for alert in SOSAlert.objects.nearest(lat, lon, k=k, start_km=0.1)]
+                    self.assertEqual(found, sorted(distances, key=distances.get)[:k])
+
+    def test_empty_results(self):
+        self.assertFalse(SOSAlert.objects.within_radius(9.0, 7.5, 5).exists())
+        self.assertEqual(list(SOSAlert.objects.filter(message='none').nearest(6.5, 3.4, k=3)), [])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        SOSAlert.objects.bulk_create([SOSAlert(latitude=6.45, longitude=3.39) for _ in range(23)])
+        start = timezone.now().replace(microsecond=0)
+        # Runs of three rows share a created_at, so the pk has to break ties
+        for i, pk in enumerate(SOSAlert.objects.order_by('pk').values_list('pk', flat=True)):
+            SOSAlert.objects.filter(pk=pk).update(
+                created_at=start + datetime.timedelta(seconds=i // 3), repeat_count=i % 4,
+            )
+
+    def walk(self, page_fn, expected, per_page=5):
+        """Page forward to the end, then back to the start; check both directions."""
+        pages = [page_fn(per_page=per_page)]
+        self.assertFalse(pages[0].has_previous)
+        while pages[-1].has_next:
+            pages.append(page_fn(after=pages[-1].next_cursor, per_page=per_page))
+        self.assertEqual([row.pk for page in pages for row in page], expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+
+        back = [pages[-1]]
+        while back[-1].has_previous:
+            back.append(page_fn(before=back[-1].prev_cursor, per_page=per_page))
+        self.assertEqual([[row.pk for row in page] for page in back],
+                         [[row.pk for row in page] for page in pages[::-1]])
+        self.assertTrue(back[-1].has_next)
+
+    def test_keyset_page_walks_both_ways(self):
+        expected = list(SOSAlert.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.walk(lambda **kwargs: keyset_page(SOSAlert.objects.all(), **kwargs), expected)
+
+    def test_ranked_page_walks_both_ways(self):
+        fields = ('repeat_count', 'created_at', 'pk')
+        expected = list(SOSAlert.objects.order_by('-repeat_count', '-created_at', '-pk').values_list('pk', flat=True))
+        self.walk(lambda **kwargs: ranked_page(SOSAlert.objects.all(), fields, **kwargs), expected)
+
+    def test_cursor_round_trip(self):
+        alert = SOSAlert.objects.order_by('pk')[4]
+        self.assertEqual(decode_cursor(encode_cursor(alert)), (alert.created_at, alert.pk))
+        fields = ('repeat_count', 'created_at', 'pk')
+        self.assertEqual(decode_keys(encode_keys(alert, fields), SOSAlert, fields),
+                         [alert.repeat_count, alert.created_at, alert.pk])
+
+    def test_malformed_cursor_gives_the_first_page(self):
+        fields = ('repeat_count', 'created_at', 'pk')
+        first = [row.pk for row in keyset_page(SOSAlert.objects.all(), per_page=5)]
+        for cursor in ['!!!', 'bm90LWEtY3Vyc29y', encode_keys(SOSAlert.objects.first(), ('pk',))]:
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+                self.assertIsNone(decode_keys(cursor, SOSAlert, fields))
+                self.assertEqual([row.pk for row in keyset_page(SOSAlert.objects.all(), after=cursor, per_page=5)],
+                                 first)
+                self.assertFalse(ranked_page(SOSAlert.objects.all(), fields, before=cursor, per_page=5).has_previous)
+
+
+class MRNTests(TransactionTestCase):
+    def test_check_digits(self):
+        # The textbook Luhn example
+        self.assertEqual(mrn.luhn_check_digit(7992739871), 3)
+        value = mrn.format_mrn(1234)
+        self.assertEqual(value, 'MRN00012344')
+        self.assertTrue(mrn.has_valid_check_digit(value))
+        self.assertFalse(mrn.has_valid_check_digit('MRN00012345'))
+        # A swap of adjacent digits, the commonest typo, is caught
+        self.assertFalse(mrn.has_valid_check_digit('MRN00021344'))
+        # Legacy random MRNs have no check digit
+        self.assertTrue(mrn.has_valid_check_digit('MRN1A2B'))
+        self.assertEqual(mrn.normalize(' mrn-0001 2344 '), 'MRN00012344')
+        self.assertEqual(mrn.normalize('0001-2344'), 'MRN00012344')
+
+    def test_reserved_blocks_never_overlap(self):
+        first, second = mrn.reserve(5), mrn.reserve(3)
+        self.assertEqual(first.stop, second.start)
+
+        blocks = []
+        errors = []
+        barrier = threading.Barrier(6)
+
+        def reserve_some():
+            try:
+                barrier.wait()
+                for _ in range(10):
+                    # The in-memory test database fails a locked write at once; retry like a busy timeout would
+                    while True:
+                        try:
+                            blocks.append(mrn.reserve(4))
+                            break
+                        except OperationalError:
+                            time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve_some) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        numbers = [number for block in blocks for number in block]
+        self.assertEqual(len(numbers), 240)
+        self.assertEqual(sorted(numbers), list(range(second.stop, second.stop + 240)))
+
+    def test_allocator_hands_out_distinct_mrns(self):
+        allocator = mrn.MRNAllocator()
+        with self.settings(MRN_BLOCK_SIZE=4):
+            values = [allocator.next() for _ in range(10)] + allocator.many(3)
+        self.assertEqual(len(set(values)), 13)
+        self.assertTrue(all(mrn.has_valid_check_digit(value) for value in values))
+
+    def test_migration_normalizes_stored_mrns(self):
+        user = User.objects.create_user('legacy-mrn')
+        patient = Patient.objects.create(
+            user=user, full_name='Ada Obi', date_of_birth=datetime.date(1990, 1, 1), weight=60, height=165,
+            address='Yaba, Lagos', phone_number='08000000002', emergency_contact_name='Kin',
+            emergency_contact_phone='08000000003', emergency_contact_relationship='Sibling',
+        )
+        Patient.objects.filter(pk=patient.pk).update(medical_record_number='mrn-1a2b ')
+        migration = importlib.import_module('base.migrations.0010_mrn_sequence')
+        migration.normalize_mrns(django_apps, None)
+        patient.refresh_from_db()
+        self.assertEqual(patient.medical_record_number, 'MRN1A2B')
+
+
+# A fast hasher: these tests check who signs in, not how passwords are stored
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AccountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ada', email='Ada.Obi@Example.com', password='safe-pass-123')
+
+    def test_email_sign_in_ignores_case(self):
+        self.assertEqual(authenticate(email=' ada.obi@EXAMPLE.com ', password='safe-pass-123'), self.user)
+        self.assertIsNone(authenticate(email='ada.obi@example.com', password='wrong'))
+        self.assertIsNone(authenticate(email='nobody@example.com', password='safe-pass-123'))
+        response = self.client.post(reverse('base:signin'),
+                                    {'email': 'ADA.OBI@example.com', 'password': 'safe-pass-123'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+
+    def test_registration_rejects_an_email_in_use(self):
+        data = {'username': 'ada2', 'full_name': 'Ada Obi', 'email': 'ADA.OBI@example.com',
+                'password1': 'another-pass-456', 'password2': 'another-pass-456'}
+        form = CustomUserCreationForm(data=data)
+        self.assertFalse(form.is_valid())
+        self.assertIn('already exists', form.errors['email'][0])
+        form = CustomUserCreationForm(data={**data, 'email': 'someone.else@example.com'})
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_profile_cache_is_dropped_when_a_profile_is_saved(self):
+        self.assertEqual(profiles.get_profiles(self.user), profiles.NO_PROFILES)
+        with self.assertNumQueries(0):
+            profiles.get_profiles(self.user)
+
+        patient = Patient.objects.create(
+            user=self.user, full_name='Ada Obi', date_of_birth=datetime.date(1990, 1, 1), weight=60, height=165,
+            address='Yaba, Lagos', phone_number='08000000002', emergency_contact_name='Kin',
+            emergency_contact_phone='08000000003', emergency_contact_relationship='Sibling',
+        )
+        self.assertEqual(profiles.get_profiles(self.user).patient, patient)
+
+        volunteer = Volunteer.objects.create(user=self.user)
+        self.assertEqual(profiles.get_profiles(self.user), (patient, volunteer))
+        volunteer.skills = 'First aid'
+        volunteer.save()
+        self.assertEqual(profiles.get_profiles(self.user).volunteer.skills, 'First aid')
+        volunteer.delete()
+        self.assertIsNone(profiles.get_profiles(self.user).volunteer)
+
+    @override_settings(SOS_COALESCE_WINDOW=0)
+    def test_sos_emails_the_current_emergency_contact(self):
+        patient = Patient.objects.create(
+            user=self.user, full_name='Ada Obi', date_of_birth=datetime.date(1990, 1, 1), weight=60, height=165,
+            emergency_contact_email='old@example.com',
+        )
+        self.client.force_login(self.user)
+        self.assertEqual(profiles.get_profiles(self.user).patient.emergency_contact_email, 'old@example.com')
+        # Changed by another worker: no signal reaches this process's cache
+        Patient.objects.filter(pk=patient.pk).update(emergency_contact_email='new@example.com')
+        body = json.dumps({'latitude': 6.45, 'longitude': 3.39})
+        self.client.post(reverse('base:sos_alert'), body, content_type='application/json')
+        self.client.post(reverse('base:send_sos_email'), body, content_type='application/json')
+        self.assertEqual([n.recipients for n in Notification.objects.order_by('pk')],
+                         [['new@example.com'], ['new@example.com']])
+        # The fresh read also refreshed the cache for other views
+        self.assertEqual(profiles.get_profiles(self.user).patient.emergency_contact_email, 'new@example.com')
+
+
+class DashboardCounterTests(TestCase):
+    def setUp(self):
+        stats.rebuild()
+        self.staff = User.objects.create_user('counter-staff', is_staff=True)
+
+    def assertMatchesRebuild(self):
+        counts = dict(DashboardCounter.objects.exclude(key=stats.READY_KEY).values_list('key', 'value'))
+        rebuilt = stats.rebuild()
+        del rebuilt[stats.READY_KEY]
+        self.assertEqual({key: value for key, value in counts.items() if value}, {
+            key: value for key, value in rebuilt.items() if value
+        })
+
+    def test_counters_follow_creates_changes_and_deletes(self):
+        alerts = [SOSAlert.objects.create(latitude=6.45, longitude=3.39) for _ in range(3)]
+        batch = SOSAlert.objects.bulk_create([SOSAlert(latitude=6.46, longitude=3.4) for _ in range(2)])
+        bulk_created.send(sender=SOSAlert, instances=batch)
+        task = Task.objects.create(title='Water', location='Lagos', description='Deliver', created_by=self.staff)
+        self.assertMatchesRebuild()
+
+        # A loaded row, a save limited to the field, and a hand-built instance
+        loaded = SOSAlert.objects.get(pk=alerts[0].pk)
+        loaded.status = SOSAlert.STATUS_ACK
+        loaded.save()
+        loaded.status = SOSAlert.STATUS_RESOLVED
+        loaded.save()
+        alerts[1].status = SOSAlert.STATUS_ACK
+        alerts[1].save(update_fields=['status'])
+        SOSAlert(pk=batch[0].pk, status=SOSAlert.STATUS_RESOLVED).save(update_fields=['status'])
+        task.urgency, task.status = 'critical', 'completed'
+        task.save()
+        self.assertMatchesRebuild()
+
+        alerts[2].delete()
+        loaded.delete()
+        task.delete()
+        self.assertMatchesRebuild()
+
+    def test_saving_a_loaded_row_reads_nothing_back(self):
+        alert = SOSAlert.objects.create(latitude=6.45, longitude=3.39)
+        alert = SOSAlert.objects.get(pk=alert.pk)
+        alert.status = SOSAlert.STATUS_ACK
+        with CaptureQueriesContext(connection) as queries:
+            alert.save()
+        sql = [query['sql'] for query in queries]
+        self.assertFalse([q for q in sql if q.startswith('SELECT "base_sosalert"."status"')], sql)
+        self.assertFalse([q for q in sql if stats.READY_KEY in q], sql)
+        self.assertEqual(stats.get_counts()['sosalert.status.acknowledged'], 1)
+
+    def test_old_counters_are_rebuilt(self):
+        alert = SOSAlert.objects.create(latitude=6.45, longitude=3.39)
+        # QuerySet.update sends no signal, so the counters drift
+        SOSAlert.objects.filter(pk=alert.pk).update(status=SOSAlert.STATUS_RESOLVED)
+        self.assertEqual(stats.get_counts()['sosalert.status.pending'], 1)
+        DashboardCounter.objects.filter(key=stats.READY_KEY).update(value=int(time.time()) - 3601)
+        with override_settings(DASHBOARD_STATS_MAX_AGE=3600):
+            counts = stats.get_counts()
+        self.assertEqual(counts['sosalert.status.pending'], 0)
+        self.assertEqual(counts['sosalert.status.resolved'], 1)
+
+    def test_rebuild_takes_the_write_lock_before_counting(self):
+        with CaptureQueriesContext(connection) as queries:
+            stats.rebuild()
+        sql = [query['sql'] for query in queries]
+        delete = next(i for i, q in enumerate(sql) if q.startswith('DELETE'))
+        count = next(i for i, q in enumerate(sql) if 'COUNT(' in q)
+        self.assertLess(delete, count, sql)
+
+
+@override_settings(SOS_STREAM_POLL_INTERVAL=0.05, SOS_STREAM_KEEPALIVE=60)
+class LiveFeedTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('live-staff', is_staff=True)
+
+    def alert(self, **fields):
+        return SOSAlert.objects.create(latitude=6.45, longitude=3.39, **fields)
+
+    def test_every_change_is_stored_as_an_event(self):
+        alert = self.alert(message='Help')
+        alert.status = SOSAlert.STATUS_ACK
+        alert.save()
+        events = list(AlertEvent.objects.filter(alert_id=alert.id).order_by('id'))
+        self.assertEqual([event.payload['type'] for event in events], ['created', 'updated'])
+        self.assertEqual(events[1].payload, live.alert_event(alert, 'updated'))
+
+        text = live.format_sse(events[1].id, events[1].payload)
+        lines = text.split('\n')
+        self.assertEqual(lines[:2], [f'id: {events[1].id}', 'event: sos'])
+        self.assertTrue(text.endswith('\n\n'))
+        data = json.loads(lines[2][len('data: '):])
+        self.assertEqual((data['id'], data['status'], data['message']), (alert.id, 'acknowledged', 'Help'))
+
+    def test_replay_after_last_event_id(self):
+        first, second, third = (self.alert() for _ in range(3))
+        ids = list(AlertEvent.objects.order_by('id').values_list('id', flat=True))
+        missed, newest = live.replay(ids[0])
+        self.assertEqual([event['id'] for _, event in missed], [second.id, third.id])
+        self.assertEqual(newest, ids[-1])
+        self.assertEqual(live.replay(ids[-1]), ([], ids[-1]))
+        # A new client starts from now
+        self.assertEqual(live.replay(None), ([], ids[-1]))
+        # An id this database never issued, or one whose events were purged
+        self.assertIsNone(live.replay(ids[-1] + 10)[0])
+        AlertEvent.objects.filter(id__lte=ids[1]).delete()
+        self.assertIsNone(live.replay(ids[0])[0])
+
+    def test_purge_keeps_recent_events(self):
+        self.alert()
+        AlertEvent.objects.update(created_at=timezone.now() - datetime.timedelta(hours=2))
+        self.alert()
+        self.assertEqual(live.purge(), 1)
+        self.assertEqual(AlertEvent.objects.count(), 1)
+
+    def test_stream_resumes_and_follows_new_events(self):
+        first, second = self.alert(), self.alert()
+        resume_from = AlertEvent.objects.get(alert_id=first.id).id
+        client = AsyncClient()
+        client.force_login(self.staff)
+
+        async def read():
+            response = await client.get(reverse('base:sos_stream'), headers={'Last-Event-ID': str(resume_from)})
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            stream = response.streaming_content
+            chunks = []
+            try:
+                chunks.append(await anext(stream))
+                chunks.append(await anext(stream))
+                # Written after the client connected, picked up by the poller
+                third = await sync_to_async(self.alert)()
+                chunks.append(await asyncio.wait_for(anext(stream), 5))
+            finally:
+                await stream.aclose()
+            return [chunk.decode() for chunk in chunks], third
+
+        chunks, third = async_to_sync(read)()
+        self.assertTrue(chunks[0].startswith('retry: '))
+        events = [json.loads(chunk.split('data: ', 1)[1]) for chunk in chunks[1:]]
+        self.assertEqual([(event['type'], event['id']) for event in events],
+                         [('created', second.id), ('created', third.id)])
+        self.assertEqual(len(live.hub), 0)
+
+    def test_monitor_pages_leave_the_feed_out_under_wsgi(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('base:sos_stream')).status_code, 204)
+        self.assertNotContains(self.client.get(reverse('base:sos_monitor')), 'sos-live.js')
+        self.assertNotContains(self.client.get(reverse('base:admin_dashboard') + '?tab=sos'), 'sos-live.js')
+
+
+class DispatchTests(TestCase):
+    def setUp(self):
+        # Each test builds its own index from its own volunteers
+        dispatch._index = None
+        self.addCleanup(setattr, dispatch, '_index', None)
+
+    def volunteer(self, name, lat, lon, available='Immediate (within 30 mins)', medical=True):
+        user = User.objects.create_user(name)
+        return Volunteer.objects.create(user=user, latitude=lat, longitude=lon, isAvailable=available,
+                                        medical_training=medical)
+
+    def expected_score(self, volunteer, lat, lon):
+        if volunteer.latitude is None:
+            distance = dispatch.UNKNOWN_LOCATION_KM
+        else:
+            distance = geo.haversine_km(lat, lon, float(volunteer.latitude), float(volunteer.longitude))
+        return (distance + dispatch.AVAILABILITY_PENALTY_KM[volunteer.isAvailable]
+                + (0 if volunteer.medical_training else dispatch.NO_MEDICAL_TRAINING_PENALTY_KM))
+
+    def test_nearest_available_medics_first(self):
+        near = self.volunteer('near', 6.451, 3.391)
+        untrained = self.volunteer('untrained', 6.451, 3.391, medical=False)
+        weekends = self.volunteer('weekends', 6.451, 3.391, available='Weekends')
+        far = self.volunteer('far', 6.6, 3.5)
+        nowhere = self.volunteer('nowhere', None, None)
+        ranked = dispatch.get_index().rank(6.45, 3.39, k=10)
+        self.assertEqual([pk for pk, _, _ in ranked], [near.pk, untrained.pk, far.pk, weekends.pk, nowhere.pk])
+        self.assertIsNone(ranked[-1][2])
+
+        medics = dispatch.get_index().rank(6.45, 3.39, k=10, require_medical=True)
+        self.assertEqual([pk for pk, _, _ in medics], [near.pk, far.pk, weekends.pk, nowhere.pk])
+
+    def test_ranking_matches_brute_force(self):
+        rng = random.Random(4)
+        tiers = list(dispatch.AVAILABILITY_PENALTY_KM)
+        volunteers = [
+            self.volunteer(f'v{i}', round(rng.uniform(6.3, 6.7), 6), round(rng.uniform(3.2, 3.6), 6),
+                           available=rng.choice(tiers), medical=rng.random() < 0.5)
+            for i in range(60)
+        ]
+        for lat, lon in [(6.45, 3.39), (6.31, 3.58)]:
+            with self.subTest(lat=lat, lon=lon):
+                expected = sorted(volunteers, key=lambda v: self.expected_score(v, lat, lon))[:8]
+                ranked = dispatch.get_index().rank(lat, lon, k=8)
+                self.assertEqual([pk for pk, _, _ in ranked], [v.pk for v in expected])
+                for (_, score, _), volunteer in zip(ranked, expected):
+                    self.assertAlmostEqual(score, self.expected_score(volunteer, lat, lon), places=6)
+
+    def test_assign_sets_the_responder_once(self):
+        first = self.volunteer('first', 6.451, 3.391)
+        second = self.volunteer('second', 6.452, 3.392)
+        alert = SOSAlert.objects.create(latitude=6.45, longitude=3.39)
+        dispatch.get_index()
+        dispatch.assign(alert, first)
+        alert.refresh_from_db()
+        self.assertEqual((alert.responder_id, alert.status), (first.pk, SOSAlert.STATUS_ACK))
+        # The open assignment now counts against the responder in this process's index
+        self.assertEqual(dispatch.get_index().rank(6.45, 3.39)[0][0], second.pk)
+
+        with self.assertRaises(dispatch.AlreadyAssigned):
+            dispatch.assign(SOSAlert.objects.get(pk=alert.pk), second)
+        alert.refresh_from_db()
+        self.assertEqual(alert.responder_id, first.pk)
+        # Dispatching the same volunteer again is harmless
+        dispatch.assign(alert, first)
+
+
+class PrerenderTests(TestCase):
+    def setUp(self):
+        out = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(PRERENDERED_PAGES_DIR=out))
+        self.enterContext(mock.patch.object(prerender, 'pages', prerender.PrerenderedPages()))
+        self.manifest, skipped = prerender.build(['first_aid'])
+        self.assertEqual(skipped, {})
+        self.digest = self.manifest['first_aid']['hash']
+        with open(os.path.join(out, self.manifest['first_aid']['files']['identity']['file']), 'rb') as fh:
+            self.html = fh.read()
+        self.url = reverse('base:first_aid')
+
+    def test_serves_the_build_with_a_strong_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.content, self.html)
+        self.assertEqual(response['ETag'], f'"{self.digest}"')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.PRERENDERED_PAGES_MAX_AGE}')
+        # Nothing was rendered for it
+        self.assertEqual(response.templates, [])
+
+    def test_matching_if_none_match_is_not_modified(self):
+        for tag in (f'"{self.digest}"', f'W/"{self.digest}-gzip"', f'"other", "{self.digest}"', '*'):
+            with self.subTest(tag=tag):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=tag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_negotiates_the_encoding(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], f'"{self.digest}-gzip"')
+        self.assertEqual(gzip.decompress(response.content), self.html)
+        if prerender.brotli is not None:
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=1.0, br')
+            self.assertEqual(response['Content-Encoding'], 'br')
+            self.assertEqual(prerender.brotli.decompress(response.content), self.html)
+        self.assertNotIn('Content-Encoding', self.client.get(self.url, HTTP_ACCEPT_ENCODING='identity'))
+
+    def test_signed_in_users_and_unbuilt_pages_get_a_live_render(self):
+        about = self.client.get(reverse('base:about'))
+        self.assertIn('base/about.html', [t.name for t in about.templates])
+        self.client.force_login(User.objects.create_user('reader'))
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertIn('base/first-aid.html', [t.name for t in response.templates])
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotEqual(response.get('ETag'), f'"{self.digest}"')
+
+    def test_missing_templates_are_skipped(self):
+        with mock.patch.dict(prerender.PAGES, {'missing': 'base/missing.html'}):
+            manifest, skipped = prerender.build(['missing', 'first_aid'])
+        self.assertIn('missing', skipped)
+        self.assertNotIn('missing', manifest)
+        self.assertEqual(manifest['first_aid']['hash'], self.digest)
+
+
+class ResponsiveImageTests(TestCase):
+    def setUp(self):
+        static_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.out = self.enterContext(tempfile.TemporaryDirectory())
+        os.makedirs(os.path.join(static_dir, 'images'))
+        self.source = os.path.join(static_dir, 'images', 'truck.jpg')
+        self.save_source('red')
+        self.enterContext(override_settings(
+            STATICFILES_DIRS=[static_dir], RESPONSIVE_IMAGES_DIR=self.out,
+            RESPONSIVE_IMAGE_SOURCES=['images/truck.jpg'], RESPONSIVE_IMAGE_WIDTHS=(100, 200),
+        ))
+        self.enterContext(mock.patch.object(images, 'manifest', images.ImageManifest()))
+
+    def save_source(self, color):
+        PILImage.new('RGB', (300, 150), color).save(self.source, 'JPEG')
+
+    def variant_files(self):
+        return sorted(name for name in os.listdir(self.out) if name != images.MANIFEST_NAME)
+
+    def test_builds_each_width_and_format_once(self):
+        manifest, results = images.build()
+        self.assertEqual(results, {'images/truck.jpg': 'built'})
+        entry = manifest['images/truck.jpg']
+        for fmt in images.FORMATS:
+            self.assertEqual([(v['width'], v['height']) for v in entry['formats'][fmt]], [(100, 50), (200, 100)])
+        built = self.variant_files()
+        self.assertEqual(len(built), 4)
+
+        with mock.patch.object(images, '_encode', wraps=images._encode) as encode:
+            manifest, results = images.build()
+        self.assertEqual(results, {'images/truck.jpg': 'unchanged'})
+        encode.assert_not_called()
+        self.assertEqual(self.variant_files(), built)
+
+    def test_changed_source_replaces_its_variants(self):
+        images.build()
+        before = set(self.variant_files())
+        self.save_source('blue')
+        manifest, results = images.build()
+        self.assertEqual(results, {'images/truck.jpg': 'built'})
+        after = set(self.variant_files())
+        self.assertEqual(len(after), 4)
+        self.assertFalse(before & after)
+        listed = {v['file'] for variants in manifest['images/truck.jpg']['formats'].values() for v in variants}
+        self.assertEqual(after, listed)
+
+    def render(self, path):
+        return Template(
+            "{% load responsive_images %}{% responsive_image path alt='Fire truck' sizes='50vw' css_class='hero' %}"
+        ).render(Context({'path': path}))
+
+    def test_tag_emits_picture_with_srcsets(self):
+        self.assertEqual(self.render('images/truck.jpg'),
+                         '<img src="/static/images/truck.jpg" alt="Fire truck" class="hero" loading="lazy">')
+        manifest, _ = images.build()
+        formats = manifest['images/truck.jpg']['formats']
+
+        def srcset(fmt):
+            return ', '.join(f"{reverse('base:responsive_image', args=[v['file']])} {v['width']}w"
+                             for v in formats[fmt])
+        largest = reverse('base:responsive_image', args=[formats['jpeg'][-1]['file']])
+        self.assertEqual(self.render('images/truck.jpg'), (
+            f'<picture class="hero"><source type="image/webp" srcset="{srcset("webp")}" sizes="50vw">'
+            f'<img src="{largest}" srcset="{srcset("jpeg")}" sizes="50vw" width="200" height="100" '
+            f'alt="Fire truck" decoding="async" loading="lazy"></picture>'
+        ))
+
+    def test_view_serves_only_listed_variants(self):
+        manifest, _ = images.build()
+        variant = manifest['images/truck.jpg']['formats']['webp'][0]['file']
+        response = self.client.get(reverse('base:responsive_image', args=[variant]))
+        self.assertEqual(response.status_code, 200)
+        with open(os.path.join(self.out, variant), 'rb') as fh:
+            self.assertEqual(b''.join(response.streaming_content), fh.read())
+        response.close()
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        for name in (images.MANIFEST_NAME, 'truck.100w.000000000000.webp', 'truck.jpg'):
+            with self.subTest(name=name):
+                self.assertEqual(self.client.get(reverse('base:responsive_image', args=[name])).status_code, 404)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('exporter', is_staff=True))
+        user = User.objects.create_user('exported')
+        self.patient = Patient.objects.create(
+            user=user, full_name='Ada Obi', date_of_birth=datetime.date(1990, 1, 1), weight=60, height=160,
+        )
+        self.alerts = {}
+        for day, status in ((1, 'pending'), (2, 'acknowledged'), (2, 'resolved'), (3, 'resolved')):
+            alert = SOSAlert.objects.create(latitude=6.45, longitude=3.39, status=status, patient=self.patient,
+                                            message=f'Day {day}, "{status}"')
+            created = datetime.datetime(2026, 1, day, 12, tzinfo=datetime.timezone.utc)
+            SOSAlert.objects.filter(pk=alert.pk).update(created_at=created)
+            self.alerts[day, status] = alert.pk
+
+    def get(self, **params):
+        return self.client.get(reverse('base:export_data', args=['sos_alerts']), params)
+
+    def rows(self, response):
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def ids(self, response):
+        return [row['id'] for row in self.rows(response)]
+
+    def test_ndjson_and_csv_match_the_rows(self):
+        columns = export.DATASETS['sos_alerts'][1]
+        rows = [[export._plain(value) for value in row]
+                for row in SOSAlert.objects.order_by('created_at', 'id').values_list(*columns)]
+        ndjson = self.get()
+        self.assertEqual(ndjson['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(self.rows(ndjson), [dict(zip(columns, row)) for row in rows])
+
+        response = self.get(format='csv')
+        self.assertTrue(response['Content-Disposition'].endswith('.csv"'))
+        parsed = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(parsed[0], list(columns))
+        self.assertEqual(parsed[1:], [['' if value is None else str(value) for value in row] for row in rows])
+
+    def test_filters(self):
+        a = self.alerts
+        cases = [
+            ({'since': '2026-01-02'}, [a[2, 'acknowledged'], a[2, 'resolved'], a[3, 'resolved']]),
+            # A bare end date includes that day; a datetime is exclusive
+            ({'until': '2026-01-02'}, [a[1, 'pending'], a[2, 'acknowledged'], a[2, 'resolved']]),
+            ({'until': '2026-01-02T12:00:00Z'}, [a[1, 'pending']]),
+            ({'since': '2026-01-02', 'until': '2026-01-02', 'status': 'resolved'}, [a[2, 'resolved']]),
+            ({'status': 'resolved'}, [a[2, 'resolved'], a[3, 'resolved']]),
+        ]
+        for params, expected in cases:
+            with self.subTest(**params):
+                self.assertEqual(self.ids(self.get(**params)), expected)
+
+    def test_bad_filters_are_rejected_up_front(self):
+        for params in ({'since': 'yesterday'}, {'until': '2026-13-01'}, {'status': 'lost'}, {'format': 'xml'}):
+            with self.subTest(**params):
+                response = self.get(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['status'], 'error')
+        response = self.client.get(reverse('base:export_data', args=['patients']), {'status': 'resolved'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_archived_alerts_appear_once(self):
+        old = self.alerts[2, 'resolved']
+        SOSAlert.objects.filter(pk=old).update(resolved_at=timezone.now() - datetime.timedelta(days=100))
+        self.assertEqual(archive.run(days=90), 1)
+        self.assertNotIn(old, self.ids(self.get()))
+        rows = self.rows(self.get(archived='1'))
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(self.alerts.values()))
+        archived = [row for row in rows if row['id'] == old]
+        self.assertEqual(archived[0]['patient__full_name'], 'Ada Obi')
+        self.assertEqual(self.ids(self.get(archived='1', status='resolved', since='2026-01-02', until='2026-01-02')),
+                         [old])
+
+
+class SOSBatchTests(TestCase):
+    def setUp(self):
+        coalesce.recent.clear()
+
+    def upload(self, items):
+        response = self.client.post(reverse('base:sos_alert_batch'), json.dumps({'alerts': items}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_mixed_batch_reports_each_item_and_writes_only_valid_ones(self):
+        raised = '2026-01-05T08:30:00+00:00'
+        body = self.upload([
+            {'latitude': 6.45, 'longitude': 3.39, 'message': 'Fire', 'client_timestamp': raised},
+            {'latitude': 6.45},
+            {'latitude': 95, 'longitude': 3.39},
+            'not an alert',
+            {'latitude': 6.5, 'longitude': 3.4, 'client_timestamp': 'last tuesday'},
+            {'lat': 6.46, 'lng': 3.41},
+        ])
+        self.assertEqual((body['status'], body['received']), ('partial', 2))
+        self.assertEqual([r['status'] for r in body['results']],
+                         ['success', 'error', 'error', 'error', 'error', 'success'])
+        self.assertEqual(body['results'][1]['message'], 'Missing coordinates')
+        stored = list(SOSAlert.objects.order_by('pk'))
+        self.assertEqual([a.pk for a in stored], [body['results'][0]['id'], body['results'][5]['id']])
+        self.assertEqual(stored[0].message, 'Fire')
+        self.assertEqual(stored[0].client_created_at.isoformat(), raised)
+
+    def test_all_valid_batch_succeeds(self):
+        body = self.upload([{'latitude': 6.45 + i / 100, 'longitude': 3.39} for i in range(3)])
+        self.assertEqual((body['status'], body['received']), ('success', 3))
+        self.assertEqual(SOSAlert.objects.count(), 3)
+
+    def test_rejects_bodies_that_are_not_batches(self):
+        url = reverse('base:sos_alert_batch')
+        for body in ('{', '[]', '{"alerts": {}}', json.dumps([{}] * (settings.SOS_BATCH_MAX_ALERTS + 1))):
+            with self.subTest(body=body[:20]):
+                response = self.client.post(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(SOSAlert.objects.exists())
+
+    def test_live_press_after_upload_coalesces_into_the_queued_alert(self):
+        queued = self.upload([{'latitude': 6.45, 'longitude': 3.39, 'device_id': 'phone-9'}])
+        live = self.client.post(reverse('base:sos_alert'), json.dumps({
+            'latitude': 6.45, 'longitude': 3.39, 'device_id': 'phone-9',
+        }), content_type='application/json').json()
+        self.assertTrue(live['coalesced'])
+        self.assertEqual(live['id'], queued['results'][0]['id'])
+        # A press queued long ago is history, not an open repeat
+        old = self.upload([{'latitude': 6.5, 'longitude': 3.5, 'device_id': 'phone-8',
+                            'client_timestamp': '2026-01-01T00:00:00Z'}])
+        live = self.client.post(reverse('base:sos_alert'), json.dumps({
+            'latitude': 6.5, 'longitude': 3.5, 'device_id': 'phone-8',
+        }), content_type='application/json').json()
+        self.assertNotIn('coalesced', live)
+        self.assertNotEqual(live['id'], old['results'][0]['id'])
+
+
+class SyntheticDataTests(TransactionTestCase):
+    """Worker processes close the parent's connections, so no test transaction may be open."""
+
+    now = datetime.datetime(2026, 3, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+    def generate(self, workers):
+        # Both runs start from the same MRN sequence and the same clock
+        Sequence.objects.filter(name=mrn.SEQUENCE_NAME).delete()
+        with mock.patch.object(synthetic.timezone, 'now', return_value=self.now):
+            synthetic.generate(volunteers=4, patients=7, tasks=5, alerts=9, seed=3, days=30, chunk_size=3,
+                               workers=workers, tag='test')
+        rows = {
+            'volunteers': list(Volunteer.objects.order_by('pk').values_list(
+                'user__username', 'user__first_name', 'latitude', 'longitude', 'isAvailable', 'created_at')),
+            'patients': list(Patient.objects.order_by('pk').values_list(
+                'medical_record_number', 'full_name', 'date_of_birth', 'blood_type', 'created_at')),
+            'tasks': list(Task.objects.order_by('pk').values_list('title', 'urgency', 'status', 'created_at')),
+            'alerts': list(SOSAlert.objects.order_by('pk').values_list(
+                'patient__medical_record_number', 'responder__user__username', 'latitude', 'longitude',
+                'status', 'created_at', 'resolved_at')),
+        }
+        for model in (SOSAlert, Task, Patient, Volunteer):
+            model.objects.all().delete()
+        User.objects.filter(username__startswith='test-3-volunteer-').delete()
+        return rows
+
+    def test_rows_do_not_depend_on_the_number_of_workers(self):
+        single = self.generate(workers=1)
+        self.assertEqual({kind: len(rows) for kind, rows in single.items()},
+                         {'volunteers': 4, 'patients': 7, 'tasks': 5, 'alerts': 9})
+        self.assertEqual(self.generate(workers=2), single)
+
+        self.assertTrue(all(mrn.has_valid_check_digit(row[0]) for row in single['patients']))
+        created = [row[-1] for row in single['volunteers'] + single['patients'] + single['tasks']]
+        created += [row[5] for row in single['alerts']]
+        # bulk_create kept the generated times instead of stamping them all with now
+        self.assertTrue(all(moment <= self.now for moment in created))
+        self.assertLess(min(created), self.now - datetime.timedelta(days=1))
+        self.assertEqual(len(set(created)), len(created))
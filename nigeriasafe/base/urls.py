@@ -5,6 +5,8 @@ app_name = 'base'
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('img/<str:filename>', views.responsive_image, name='responsive_image'),
+    path('sw.js', views.service_worker, name='service_worker'),
     path('about/', views.about, name='about'),
     path('contact/', views.contact, name='contact'),
     path('resources/', views.resources, name='resources'),
@@ -23,14 +25,19 @@ urlpatterns = [
     path('volunteer/', views.volunteer, name='volunteer'),
     path('signout/', views.signout_view, name='signout'),
     path('api/sos-alert/', views.sos_alert, name='sos_alert'),
+    path('api/sos-alert/batch/', views.sos_alert_batch, name='sos_alert_batch'),
     path('sos-monitor/', views.sos_monitor, name='sos_monitor'),
+    path('sos-monitor/stream/', views.sos_stream, name='sos_stream'),
     path('volunteer/tasks/', views.volunteer_tasks, name='volunteer_tasks'),
     path('staff/create-task/', views.create_task, name='create_task'),
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('dashboard/sos/<int:alert_id>/update/', views.update_sos_status, name='update_sos_status'),
+    path('dashboard/sos/<int:alert_id>/dispatch/', views.dispatch_sos, name='dispatch_sos'),
+    path('dashboard/export/<str:dataset>/', views.export_data, name='export_data'),
     path('dashboard/task/<int:task_id>/update/', views.update_task, name='update_task'),
     path('dashboard/task/<int:task_id>/toggle/', views.toggle_task_active, name='toggle_task_active'),
     path('task/<int:task_id>/status/', views.update_volunteer_task_status, name='update_volunteer_task_status'),
     path('send-sos-email/', views.send_sos_email, name='send_sos_email'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
  
\ No newline at end of file
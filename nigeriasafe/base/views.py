@@ -1,6 +1,9 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+import os
+import asyncio
 import json
+from asgiref.sync import sync_to_async
 from django import forms
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
@@ -10,17 +13,39 @@ from django.contrib.auth.models import User
 from django.urls import reverse
 from .models import Patient, SOSAlert, Task, Volunteer
 from .forms import PatientForm, CustomUserCreationForm
+from . import (
+    coalesce, dispatch, export, images, ingest, live, metrics as request_metrics, offline, outbox, profiles, stats,
+    taskfeed, wire,
+)
+from .idempotency import idempotent
+from .mrn import has_valid_check_digit, normalize as normalize_mrn
+from .pagination import keyset_page
+from .prerender import serve_prerendered
+from .routers import read_replica
+from .signals import bulk_created
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
 from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
 from django.conf import settings
 from django.views.decorators.http import require_POST
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+
+# Maps the <select name="availability"> values in volunteer.html to Volunteer.isAvailable
+VOLUNTEER_AVAILABILITY = {
+    'immediate': 'Immediate (within 30 mins)',
+    'hour': 'Within 1 hour',
+    'scheduled': 'Scheduled / On-call',
+    'weekends': 'Weekends',
+}
 
 
 # Create your views here.
 @login_required(login_url='base:signin')
 def volunteer(request):
-    is_volunteer = hasattr(request.user, 'volunteer_profile')
+    is_volunteer = request.profiles.volunteer is not None
     
     if request.method == 'POST':
         location = request.POST.get('location')
@@ -33,15 +58,25 @@ def volunteer(request):
             messages.error(request, 'You must consent to volunteer.')
             return redirect('base:volunteer')
 
-        Volunteer.objects.update_or_create(
-            user=request.user,
-            defaults={
-                'location': location,
-                'skills': skills,
-                'medical_training': True if medical_training else False,
-                'notes': notes
-            }
-        )
+        defaults = {
+            'location': location,
+            'skills': skills,
+            'medical_training': True if medical_training else False,
+            'notes': notes,
+            'isAvailable': VOLUNTEER_AVAILABILITY.get(
+                request.POST.get('availability'), Volunteer.AVAILABLESTATUS_CHOICES[0][0]
+            ),
+        }
+        # Coordinates are filled in by the browser when the volunteer allows it
+        lat = request.POST.get('latitude')
+        lon = request.POST.get('longitude')
+        if lat and lon:
+            try:
+                defaults['latitude'], defaults['longitude'] = ingest.clean_coordinates(lat, lon)
+            except ValidationError:
+                pass
+
+        Volunteer.objects.update_or_create(user=request.user, defaults=defaults)
 
         messages.success(request, 'Thank you for volunteering! You can now access tasks.')
         return redirect('base:volunteer_tasks')
@@ -52,54 +87,253 @@ def volunteer(request):
 def home(request):
     context = {}
     if request.user.is_authenticated:
-        try:
-            context['patient'] = request.user.patient_profile
-        except Patient.DoesNotExist:
-            context['patient'] = None
+        context['patient'] = request.profiles.patient
     return render(request, 'base/home.html', context)
 
 
+def responsive_image(request, filename):
+    """Serve a generated image variant; its hashed name lets browsers cache it for a year"""
+    if not images.manifest.is_variant(filename):
+        raise Http404("Unknown image")
+    try:
+        response = FileResponse(open(os.path.join(images.output_dir(), filename), 'rb'))
+    except OSError:
+        raise Http404("Unknown image")
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+def service_worker(request):
+    """The offline service worker, served from the root so that it controls every page"""
+    script, version = offline.script.get()
+    etag = f'"sw-{version}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(script, content_type='text/javascript; charset=utf-8')
+    response['ETag'] = etag
+    # Browsers check for a new worker on navigation; a matching ETag makes that a 304
+    patch_cache_control(response, no_cache=True)
+    return response
+
 
 @csrf_exempt
+# The write buffer's thread commits the alert, so the view cannot share a transaction with it
+@idempotent(atomic=ingest.is_direct)
 def sos_alert(request):
+    """Raise an SOS alert from a JSON body, or from a text/plain compact one (see base.wire)."""
     if request.method == 'POST':
-        data = json.loads(request.body)
-        # Expected fields: latitude, longitude, message
-        lat = data.get('latitude') or data.get('lat')
-        lon = data.get('longitude') or data.get('lon') or data.get('lng')
-        message = data.get('message')
+        compact = wire.is_compact(request)
+        # Compact requests get compact answers
+        respond = wire.response if compact else JsonResponse
+        # Read past the profile cache: another worker may have changed the emergency contact
+        request.profiles = profiles.get_profiles(request.user, fresh=True)
+        patient = request.profiles.patient
+        # Only a signed-in patient's alerts email their emergency contact
+        contact_email = patient.emergency_contact_email if patient else None
+        client_created_at = None
+        if compact:
+            try:
+                sent = wire.decode(request.body)
+            except ValidationError as e:
+                return respond({'status': 'error', 'message': e.message}, status=400)
+            lat, lon, message, client_created_at = sent.latitude, sent.longitude, sent.message, sent.client_created_at
+            data = {'device_id': sent.device_id}
+            if patient is None and sent.mrn:
+                # Only the sender's word; it names the patient but never picks the alert to coalesce into
+                patient = Patient.objects.filter(medical_record_number=sent.mrn).first()
+        else:
+            data = json.loads(request.body)
+            # Expected fields: latitude, longitude, message
+            lat = data.get('latitude') or data.get('lat')
+            lon = data.get('longitude') or data.get('lon') or data.get('lng')
+            message = data.get('message')
 
-        if lat is None or lon is None:
-            return JsonResponse({'status': 'error', 'message': 'Missing coordinates'}, status=400)
+            if lat is None or lon is None:
+                return respond({'status': 'error', 'message': 'Missing coordinates'}, status=400)
 
-        patient = None
-        if request.user.is_authenticated:
             try:
-                patient = request.user.patient_profile
-            except Patient.DoesNotExist:
-                pass
+                lat, lon = ingest.clean_coordinates(lat, lon)
+            except ValidationError as e:
+                return respond({'status': 'error', 'message': e.message}, status=400)
+
+        source = coalesce.source_key(request, data)
+        now = timezone.now()
 
         try:
-            alert = SOSAlert.objects.create(
+            # A repeat press updates the open alert instead of queueing another
+            alert_id = coalesce.find(source, lat, lon, now)
+            alert = coalesce.bump(alert_id, source, lat, lon, now, message) if alert_id else None
+            if alert is not None:
+                return respond({
+                    'status': 'success', 'message': 'Alert updated', 'id': alert.id,
+                    'coalesced': True, 'repeat_count': alert.repeat_count,
+                })
+            alert = ingest.save_alert(SOSAlert(
                 patient=patient,
                 latitude=lat,
                 longitude=lon,
                 message=message,
-            )
+                client_created_at=client_created_at,
+                source_key=source,
+                last_seen_at=now,
+            ))
+            coalesce.remember(alert)
+            if contact_email:
+                outbox.enqueue(*outbox.sos_email(lat, lon, message, patient.full_name), [contact_email])
+        except TimeoutError:
+            # The buffered write was withdrawn, so a retry cannot duplicate it
+            response = respond({'status': 'error', 'message': 'Busy, please retry'}, status=503)
+            response['Retry-After'] = '1'
+            return response
         except Exception as e:
-            return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+            return respond({'status': 'error', 'message': str(e)}, status=500)
 
-        return JsonResponse({'status': 'success', 'message': 'Alert received', 'id': alert.id})
+        return respond({'status': 'success', 'message': 'Alert received', 'id': alert.id})
     return JsonResponse({'status': 'error'}, status=400)
 
 
+@csrf_exempt
+@require_POST
+@idempotent
+def sos_alert_batch(request):
+    """Accept alerts a client queued while offline.
+
+    The body is a JSON array of alerts (or {"alerts": [...]}), each shaped like
+    a sos_alert payload plus an optional client_timestamp. Every item is
+    validated first, the valid ones are inserted in one transaction, and the
+    response carries one result per item in request order.
+
+    Queued presses are kept as separate alerts, each with its own time. They
+    carry the same source key as sos_alert, so a live press made soon after
+    one of them is coalesced into it.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+    items = data.get('alerts') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'status': 'error', 'message': 'Expected a non-empty list of alerts'}, status=400)
+    if len(items) > settings.SOS_BATCH_MAX_ALERTS:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'At most {settings.SOS_BATCH_MAX_ALERTS} alerts per batch',
+        }, status=400)
+
+    patient = request.profiles.patient
+    now = timezone.now()
+
+    results = []
+    alerts = []
+    for item in items:
+        if not isinstance(item, dict):
+            results.append({'status': 'error', 'message': 'Alert must be an object'})
+            continue
+        lat = item.get('latitude') or item.get('lat')
+        lon = item.get('longitude') or item.get('lon') or item.get('lng')
+        if lat is None or lon is None:
+            results.append({'status': 'error', 'message': 'Missing coordinates'})
+            continue
+        try:
+            lat, lon = ingest.clean_coordinates(lat, lon)
+            client_created_at = ingest.clean_client_timestamp(item.get('client_timestamp'))
+        except ValidationError as e:
+            results.append({'status': 'error', 'message': e.message})
+            continue
+        alert = SOSAlert(
+            patient=patient,
+            latitude=lat,
+            longitude=lon,
+            message=item.get('message'),
+            client_created_at=client_created_at,
+            source_key=coalesce.source_key(request, item),
+            last_seen_at=min(client_created_at or now, now),
+        )
+        alerts.append(alert)
+        results.append({'status': 'success', 'alert': alert})
+
+    try:
+        with transaction.atomic():
+            SOSAlert.objects.bulk_create(alerts)
+            bulk_created.send(sender=SOSAlert, instances=alerts)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+    for alert in sorted(alerts, key=lambda alert: alert.last_seen_at):
+        coalesce.remember(alert)
+
+    for result in results:
+        if 'alert' in result:
+            result['id'] = result.pop('alert').id
+    return JsonResponse({
+        'status': 'success' if len(alerts) == len(items) else 'partial',
+        'received': len(alerts),
+        'results': results,
+    })
+
+
+@read_replica
 @staff_member_required
 def sos_monitor(request):
-    # Staff-only monitoring page showing recent SOS alerts
-    alerts = SOSAlert.objects.all()[:200]
-    return render(request, 'base/sos_monitor.html', {'alerts': alerts})
+    # Staff-only monitoring page showing recent SOS alerts, one page at a time
+    alerts = keyset_page(
+        SOSAlert.objects.select_related('patient'),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        per_page=settings.SOS_MONITOR_PAGE_SIZE,
+    )
+    return render(request, 'base/sos_monitor.html', {
+        'alerts': alerts, 'page_query': '', 'live_feed': live.stream_available(request),
+    })
 
 
+@staff_member_required
+async def sos_stream(request):
+    """Server-Sent Events feed of new alerts and status changes for staff monitors.
+
+    Needs the ASGI application (nigeriasafe.asgi). Under WSGI the endless
+    stream would never be sent and would hold a worker, so the view answers
+    204, which tells EventSource not to reconnect.
+    """
+    if not live.stream_available(request):
+        return HttpResponse(status=204)
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+
+    async def events():
+        # Subscribe only once the stream is actually being consumed, and
+        # before the replay, so nothing stored in between is lost
+        queue = await live.hub.subscribe()
+        try:
+            yield f"retry: {settings.SOS_STREAM_RETRY_MS}\n\n"
+            missed, sent = await sync_to_async(live.replay)(last_event_id)
+            if missed is None:
+                yield live.format_sse(sent, {'type': 'reset'})
+            for seq, event in missed or ():
+                yield live.format_sse(seq, event)
+            while True:
+                try:
+                    seq, event = await asyncio.wait_for(queue.get(), settings.SOS_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                if seq <= sent and event['type'] != 'reset':
+                    # Already in the replay
+                    continue
+                sent = max(sent, seq)
+                yield live.format_sse(seq, event)
+        finally:
+            live.hub.unsubscribe(queue)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@serve_prerendered('about')
 def about(request):
     return render(request, 'base/about.html')
 
@@ -117,22 +351,27 @@ def contact(request):
     return render(request, 'base/contact.html')
 
 
+@serve_prerendered('resources')
 def resources(request):
     return render(request, 'base/resources.html')
 
 
+@serve_prerendered('fire_safety')
 def fire_safety(request):
     return render(request, 'base/fire-safety.html')
 
 
+@serve_prerendered('first_aid')
 def first_aid(request):
-    return render(request, 'base/first-Aid.html')
+    return render(request, 'base/first-aid.html')
 
 
+@serve_prerendered('flooding_safety')
 def flooding_safety(request):
     return render(request, 'base/flooding-safety.html')
 
 
+@serve_prerendered('landslides_safety')
 def landslides_safety(request):
     return render(request, 'base/landslides-safety.html')
 
@@ -140,14 +379,17 @@ def landslides_safety(request):
 def power_outage(request):
     return render(request, 'base/power-outage.html')
 
+@serve_prerendered('emergency_numbers')
 def emergency_numbers(request):
     return render(request, 'base/emergency-numbers.html')
 
 
+@serve_prerendered('extreme_heat')
 def extreme_heat(request):
     return render(request, 'base/extreme-heat.html')
 
 
+@serve_prerendered('water_safety')
 def water_safety(request):
     return render(request, 'base/water-safety.html')
 
@@ -158,13 +400,8 @@ def signin_view(request):
         email = request.POST.get('email')
         password = request.POST.get('password')
 
-        # Check if user exists by email
-        user_obj = User.objects.filter(email=email).first()
-        if user_obj is None:
-            messages.error(request, 'User does not exist. Please sign up.')
-            return redirect('base:signin')
-
-        user = authenticate(request, username=user_obj.username, password=password)
+        # base.backends.EmailBackend finds the account by email in one indexed query
+        user = authenticate(request, email=email, password=password)
         if user is not None:
             login(request, user)
             messages.success(request, 'Signed in successfully.')
@@ -187,7 +424,7 @@ def registerform_view(request):
         form = CustomUserCreationForm(data)
         if form.is_valid():
             user = form.save()
-            login(request, user)
+            login(request, user, backend='base.backends.EmailBackend')
             messages.success(request, 'Account created and signed in.')
             # mark new user so they are prompted to complete medical profile
             request.session['new_user'] = True
@@ -211,10 +448,7 @@ def signout_view(request):
 @login_required(login_url='base:signin')
 def medical_id(request):
     # If user already has a profile, load it; otherwise allow creation
-    try:
-        patient = request.user.patient_profile
-    except Patient.DoesNotExist:
-        patient = None
+    patient = request.profiles.patient
 
     if request.method == 'POST':
         form = PatientForm(request.POST, instance=patient)
@@ -241,17 +475,42 @@ def medical_id(request):
 
 
 
+@read_replica
 @login_required(login_url='base:signin')
 def volunteer_tasks(request):
     # Restrict access to volunteers and staff
-    if not hasattr(request.user, 'volunteer_profile') and not request.user.is_staff:
+    if request.profiles.volunteer is None and not request.user.is_staff:
         messages.error(request, 'Please sign up as a volunteer to view tasks.')
         return redirect('base:volunteer')
 
-    # Fetch all active tasks, newest first
-    tasks = Task.objects.filter(isActive=True).order_by('-created_at')
-    context = {'tasks': tasks}
-    return render(request, 'base/volunteer_tasks.html', context)
+    urgency = taskfeed.clean_urgency(request.GET.get('urgency'))
+    fmt = 'json' if request.GET.get('format') == 'json' else 'html'
+    after, before = request.GET.get('after'), request.GET.get('before')
+
+    # Pending flash messages must be shown, so such a page is never a 304
+    etag = None
+    if not len(messages.get_messages(request)):
+        etag = taskfeed.etag(request.user, urgency, fmt, after, before)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+    if fmt == 'json':
+        page = taskfeed.page(urgency, after, before, fields=taskfeed.JSON_FIELDS)
+        response = JsonResponse(taskfeed.as_json(page))
+    else:
+        page = taskfeed.page(urgency, after, before)
+        response = render(request, 'base/volunteer_tasks.html', {
+            'tasks': page,
+            'urgency': urgency,
+            'urgency_choices': Task.URGENCY_CHOICES,
+            'page_query': f'urgency={urgency}' if urgency else '',
+        })
+    if etag:
+        response['ETag'] = etag
+    # Browsers keep the page but ask again on every load, with If-None-Match
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 @login_required(login_url='base:signin')
 def create_task(request):
@@ -301,6 +560,80 @@ def update_sos_status(request, alert_id):
     return redirect(request.META.get('HTTP_REFERER', 'base:admin_dashboard'))
 
 
+@staff_member_required
+def export_data(request, dataset):
+    """Stream a dataset as NDJSON or CSV, filtered by ?since, ?until and ?status
+
+    ?archived=1 adds alerts moved out of the hot table.
+    """
+    fmt = request.GET.get('format', 'ndjson')
+    try:
+        lines = export.stream(
+            dataset, fmt,
+            since=request.GET.get('since'),
+            until=request.GET.get('until'),
+            status=request.GET.get('status'),
+            include_archived=request.GET.get('archived') == '1',
+        )
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    response = StreamingHttpResponse(lines, content_type=export.FORMATS[fmt])
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+    response['Content-Disposition'] = f'attachment; filename="{dataset}-{stamp}.{fmt}"'
+    return response
+
+
+@staff_member_required
+def metrics(request):
+    """Request metrics of every worker process, in the Prometheus text format"""
+    text = request_metrics.render_text(*request_metrics.collect())
+    return HttpResponse(text, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def dispatch_sos(request, alert_id):
+    """Rank volunteers for an SOS alert (GET, JSON) or assign one as responder (POST)"""
+    try:
+        alert = SOSAlert.objects.get(id=alert_id)
+    except SOSAlert.DoesNotExist:
+        if request.method == 'POST':
+            messages.error(request, "SOS Alert not found")
+            return redirect(request.META.get('HTTP_REFERER', 'base:admin_dashboard'))
+        return JsonResponse({'status': 'error', 'message': 'SOS Alert not found'}, status=404)
+
+    if request.method == 'POST':
+        try:
+            volunteer = Volunteer.objects.select_related('user').get(id=request.POST.get('volunteer_id'))
+            dispatch.assign(alert, volunteer)
+            messages.success(request, f"{volunteer.user.get_full_name() or volunteer.user.username} dispatched to SOS Alert #{alert.id}")
+        except (Volunteer.DoesNotExist, ValueError):
+            messages.error(request, "Volunteer not found")
+        except dispatch.AlreadyAssigned as e:
+            messages.error(request, str(e))
+        return redirect(request.META.get('HTTP_REFERER', 'base:admin_dashboard'))
+
+    try:
+        k = min(int(request.GET.get('k', 5)), 50)
+    except ValueError:
+        k = 5
+    candidates = dispatch.candidates_for(alert, k=k, require_medical=request.GET.get('medical') == '1')
+    return JsonResponse({
+        'alert': alert.id,
+        'candidates': [
+            {
+                'volunteer': v.id,
+                'name': v.user.get_full_name() or v.user.username,
+                'score': round(score, 2),
+                'distance_km': None if distance is None else round(distance, 2),
+                'availability': v.isAvailable,
+                'medical_training': v.medical_training,
+            }
+            for v, score, distance in candidates
+        ],
+    })
+
+
 @staff_member_required
 def toggle_task_active(request, task_id):
     """Toggle task active/inactive status"""
@@ -360,6 +693,7 @@ def update_volunteer_task_status(request, task_id):
     
     return redirect(request.META.get('HTTP_REFERER', 'base:volunteer_tasks'))
 
+@read_replica
 def admin_dashboard(request):
     # Restrict access to staff members only
     if not request.user.is_staff:
@@ -372,36 +706,74 @@ def admin_dashboard(request):
     sos_status = request.GET.get('sos_status', '')
     task_urgency = request.GET.get('task_urgency', '')
 
-    # Overview stats
-    total_patients = Patient.objects.count()
-    total_volunteers = Volunteer.objects.count()
-    total_sos_alerts = SOSAlert.objects.count()
-    total_tasks = Task.objects.count()
-    pending_alerts = SOSAlert.objects.filter(status=SOSAlert.STATUS_PENDING).count()
+    # Overview stats, maintained incrementally by base.stats
+    counts = stats.get_counts()
+    total_patients = counts.get('patient', 0)
+    total_volunteers = counts.get('volunteer', 0)
+    total_sos_alerts = counts.get('sosalert', 0)
+    total_tasks = counts.get('task', 0)
+    alert_status_counts = stats.breakdown(counts, SOSAlert, 'status')
+    task_urgency_counts = stats.breakdown(counts, Task, 'urgency')
+    task_status_counts = stats.breakdown(counts, Task, 'status')
+    pending_alerts = alert_status_counts[SOSAlert.STATUS_PENDING]
 
     # Search patients by MRN
     patient_details = None
     if search_mrn:
-        try:
-            patient_details = Patient.objects.get(medical_record_number__iexact=search_mrn)
-        except Patient.DoesNotExist:
-            messages.warning(request, f"No patient found with MRN: {search_mrn}")
+        mrn = normalize_mrn(search_mrn)
+        if not has_valid_check_digit(mrn):
+            messages.warning(request, f"MRN {search_mrn} has an invalid check digit. Please check it for typos.")
+        else:
+            try:
+                patient_details = Patient.objects.get(medical_record_number=mrn)
+            except Patient.DoesNotExist:
+                messages.warning(request, f"No patient found with MRN: {search_mrn}")
+
+    # Only the active tab's list is fetched, one keyset page at a time
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    per_page = settings.DASHBOARD_PAGE_SIZE
+    sos_alerts = tasks = volunteers = None
 
     # Get SOS Alerts with optional filtering
-    sos_alerts = SOSAlert.objects.all().order_by('-created_at')
-    if sos_status:
-        sos_alerts = sos_alerts.filter(status=sos_status)
+    if tab == 'sos':
+        sos_alerts = SOSAlert.objects.select_related('patient', 'responder__user')
+        if sos_status:
+            sos_alerts = sos_alerts.filter(status=sos_status)
+        sos_alerts = keyset_page(sos_alerts, after, before, per_page)
+
+    # Suggested volunteers for the alert being dispatched; only the SOS tab shows them
+    dispatch_alert_id = None
+    dispatch_candidates = []
+    if tab == 'sos' and request.GET.get('dispatch', '').isdigit():
+        dispatch_alert_id = int(request.GET['dispatch'])
+        try:
+            dispatch_candidates = dispatch.candidates_for(SOSAlert.objects.get(id=dispatch_alert_id))
+        except SOSAlert.DoesNotExist:
+            messages.warning(request, f"SOS Alert #{dispatch_alert_id} not found")
 
     # Get Tasks with optional filtering
-    tasks = Task.objects.all().order_by('-created_at')
-    if task_urgency:
-        tasks = tasks.filter(urgency=task_urgency)
+    if tab == 'tasks':
+        tasks = Task.objects.select_related('created_by')
+        if task_urgency:
+            tasks = tasks.filter(urgency=task_urgency)
+        tasks = keyset_page(tasks, after, before, per_page)
+
+    if tab == 'volunteers':
+        volunteers = keyset_page(Volunteer.objects.select_related('user'), after, before, per_page)
+
+    # Query string for pager links: current tab and filters, without the cursor
+    page_query = request.GET.copy()
+    for key in ('after', 'before', 'dispatch'):
+        page_query.pop(key, None)
+    # Query string for links that should stay on the current page
+    current_query = request.GET.copy()
+    current_query.pop('dispatch', None)
 
     # Get recent data for dashboard
-    recent_alerts = SOSAlert.objects.all().order_by('-created_at')[:10]
-    recent_tasks = Task.objects.all().order_by('-created_at')[:10]
+    recent_alerts = SOSAlert.objects.select_related('patient').order_by('-created_at')[:10]
+    recent_tasks = Task.objects.select_related('created_by').order_by('-created_at')[:10]
     recent_patients = Patient.objects.all().order_by('-created_at')[:10]
-    volunteers = Volunteer.objects.all().order_by('-created_at')
 
 
     context = {
@@ -411,6 +783,9 @@ def admin_dashboard(request):
         'total_sos_alerts': total_sos_alerts,
         'pending_alerts': pending_alerts,
         'total_tasks': total_tasks,
+        'alert_status_counts': alert_status_counts,
+        'task_urgency_counts': task_urgency_counts,
+        'task_status_counts': task_status_counts,
         'sos_alerts': sos_alerts,
         'tasks': tasks,
         'recent_alerts': recent_alerts,
@@ -421,11 +796,17 @@ def admin_dashboard(request):
         'search_mrn': search_mrn,
         'sos_status': sos_status,
         'task_urgency': task_urgency,
+        'page_query': page_query.urlencode(),
+        'current_query': current_query.urlencode(),
+        'dispatch_alert_id': dispatch_alert_id,
+        'dispatch_candidates': dispatch_candidates,
+        'live_feed': live.stream_available(request),
     }
 
     return render(request, 'base/admin_dashboard.html', context)
 
 @require_POST
+@idempotent
 def send_sos_email(request):
     try:
         data = json.loads(request.body)
@@ -435,36 +816,17 @@ def send_sos_email(request):
         if not latitude or not longitude:
             return JsonResponse({'message': 'Coordinates missing'}, status=400)
 
-        # Construct Google Maps link
-        maps_link = f"https://www.google.com/maps?q={latitude},{longitude}"
-        
-        subject = "SOS: Emergency Location Alert"
-        message = (
-            f"Emergency Alert!\n\n"
-            f"Coordinates received:\n"
-            f"Latitude: {latitude}\n"
-            f"Longitude: {longitude}\n\n"
-            f"View on Google Maps: {maps_link}"
-        )
-        
         # Replace with the actual emergency contact email you want to alert
         recipient_list = ['emergency_contact@example.com']
         
-        if request.user.is_authenticated:
-            try:
-                if request.user.patient_profile.emergency_contact_email:
-                    recipient_list = [request.user.patient_profile.emergency_contact_email]
-            except Patient.DoesNotExist:
-                pass
+        # Read past the profile cache: another worker may have changed the emergency contact
+        patient = profiles.get_profiles(request.user, fresh=True).patient
+        if patient and patient.emergency_contact_email:
+            recipient_list = [patient.emergency_contact_email]
         
-        send_mail(
-            subject,
-            message,
-            settings.EMAIL_HOST_USER,
-            recipient_list,
-            fail_silently=False,
-        )
+        # Sent by the send_notifications worker, so a slow or failing SMTP server never holds up this request
+        outbox.enqueue(*outbox.sos_email(latitude, longitude), recipient_list)
         
-        return JsonResponse({'message': 'SOS Email sent successfully!'})
+        return JsonResponse({'message': 'SOS Email is being sent!'})
     except Exception as e:
-        return JsonResponse({'message': f'Error sending email: {str(e)}'}, status=500)
\ No newline at end of file
+        return JsonResponse({'message': f'Error queueing email: {str(e)}'}, status=500)
\ No newline at end of file
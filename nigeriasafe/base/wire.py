@@ -0,0 +1,150 @@
+"""Compact text encoding of an SOS alert, for 2G connections and SMS.
+
+The JSON body sos.js sends is about 120 bytes with a device id, and the
+JSON response is 60 bytes more. The compact form of the same alert is about
+70 bytes, and its response about 10 (see benchmarks/bench_wire.py). It uses
+only characters an SMS gateway passes through: Crockford base32 (digits and
+upper-case letters without I, L, O and U; decoding ignores case), ``*``
+and the message text.
+
+    1 2W1P2V 5EW986 1ND9D60 MRN00012344*device-id*Need help
+
+- ``1``: the format version.
+- Latitude and longitude: microdegrees plus 90 and 180 degrees, as 6 base32
+  digits each. They are the same 6 decimal places that SOSAlert stores.
+- Timestamp: Unix seconds when the alert was raised, as 7 base32 digits;
+  ``0000000`` means unknown.
+- Then, split on the first two ``*``: the patient's MRN, a device id for
+  coalescing repeat presses, and the message. All three are optional,
+  and trailing empty fields may be left off. Nothing proves the sender is
+  that patient, so the MRN only names the patient on the alert. Which
+  alert a repeat press coalesces into still depends on the device or
+  session.
+
+The spaces above are only there for readability: the fixed-width head has no
+separators. ``sos_alert`` treats a ``text/plain`` body as this format, and
+answers in text too:
+- ``OK <id>`` for a new alert
+- ``OK <id> R<repeats>`` when the press was folded into an open alert
+- ``ERR <message>`` for an error
+
+``decode`` uses no JSON and no Decimal parsing. Coordinates are range
+checks on integers, and the Decimals the model needs are built directly
+from those integers. sos.js switches to this form when the browser reports
+a 2G connection.
+"""
+import datetime
+from collections import namedtuple
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+
+from .mrn import has_valid_check_digit, normalize as normalize_mrn
+
+
+VERSION = '1'
+CONTENT_TYPE = 'text/plain'
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+SEPARATOR = '*'
+COORDINATE_WIDTH = 6
+TIMESTAMP_WIDTH = 7
+HEAD_LENGTH = len(VERSION) + 2 * COORDINATE_WIDTH + TIMESTAMP_WIDTH
+SCALE = 1_000_000
+MAX_MESSAGE_LENGTH = 1000
+
+# Crockford decoding: either case, and the letters most often mistyped for digits
+_VALUES = {char: value for value, char in enumerate(ALPHABET)}
+_VALUES.update({char.lower(): value for char, value in list(_VALUES.items())})
+_VALUES.update({'O': 0, 'o': 0, 'I': 1, 'i': 1, 'L': 1, 'l': 1})
+# Translates the head into the digits int(..., 32) reads, so the arithmetic
+# runs in C. Any other ASCII character becomes '!', which int() rejects.
+_TO_INT_DIGITS = str.maketrans({
+    chr(code): '0123456789abcdefghijklmnopqrstuv'[_VALUES[chr(code)]] if chr(code) in _VALUES else '!'
+    for code in range(128)
+})
+
+CompactAlert = namedtuple('CompactAlert', 'latitude longitude client_created_at mrn device_id message')
+
+
+def _encode_int(value, width):
+    digits = []
+    for _ in range(width):
+        value, digit = divmod(value, 32)
+        digits.append(ALPHABET[digit])
+    if value:
+        raise ValueError('Value does not fit the field')
+    return ''.join(reversed(digits))
+
+
+def _decode_int(digits, name):
+    try:
+        return int(digits, 32)
+    except ValueError:
+        raise ValidationError(f'Invalid {name}')
+
+
+def encode(latitude, longitude, client_created_at=None, mrn='', device_id='', message=''):
+    """The compact form of an alert; coordinates may be floats, Decimals or strings."""
+    lat = round(float(latitude) * SCALE) + 90 * SCALE
+    lon = round(float(longitude) * SCALE) + 180 * SCALE
+    seconds = int(client_created_at.timestamp()) if client_created_at else 0
+    tail = SEPARATOR.join([mrn or '', device_id or '', message or '']).rstrip(SEPARATOR)
+    return (
+        VERSION + _encode_int(lat, COORDINATE_WIDTH) + _encode_int(lon, COORDINATE_WIDTH)
+        + _encode_int(seconds, TIMESTAMP_WIDTH) + tail
+    )
+
+
+def decode(body):
+    """Parse a compact alert from bytes or text; raises ValidationError."""
+    if isinstance(body, bytes):
+        try:
+            body = body.decode()
+        except UnicodeDecodeError:
+            raise ValidationError('Alert is not valid UTF-8')
+    body = body.strip()
+    if len(body) < HEAD_LENGTH or body[0] != VERSION:
+        raise ValidationError('Not a compact SOS alert')
+    head = body[len(VERSION):HEAD_LENGTH]
+    if not head.isascii():
+        raise ValidationError('Not a compact SOS alert')
+    head = head.translate(_TO_INT_DIGITS)
+    lat = _decode_int(head[:COORDINATE_WIDTH], 'latitude') - 90 * SCALE
+    lon = _decode_int(head[COORDINATE_WIDTH:2 * COORDINATE_WIDTH], 'longitude') - 180 * SCALE
+    if not -90 * SCALE <= lat <= 90 * SCALE:
+        raise ValidationError('Latitude out of range')
+    if not -180 * SCALE <= lon <= 180 * SCALE:
+        raise ValidationError('Longitude out of range')
+    seconds = _decode_int(head[2 * COORDINATE_WIDTH:], 'timestamp')
+    client_created_at = None
+    if seconds:
+        try:
+            client_created_at = datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ValidationError('Invalid timestamp')
+    mrn, device_id, message = (body[HEAD_LENGTH:].split(SEPARATOR, 2) + ['', ''])[:3]
+    if len(message) > MAX_MESSAGE_LENGTH:
+        raise ValidationError('Message is too long')
+    if mrn:
+        mrn = normalize_mrn(mrn)
+        if not has_valid_check_digit(mrn):
+            raise ValidationError('Invalid MRN check digit')
+    return CompactAlert(
+        Decimal(lat).scaleb(-6), Decimal(lon).scaleb(-6), client_created_at, mrn, device_id, message or None,
+    )
+
+
+def is_compact(request):
+    return request.content_type == CONTENT_TYPE
+
+
+def response(payload, status=200):
+    """The text form of a sos_alert JSON payload."""
+    if payload.get('status') == 'success':
+        text = f"OK {payload['id']}"
+        if payload.get('coalesced'):
+            text += f" R{payload['repeat_count']}"
+    else:
+        text = f"ERR {payload.get('message') or 'Request failed'}"
+    return HttpResponse(text, content_type='text/plain; charset=utf-8', status=status)
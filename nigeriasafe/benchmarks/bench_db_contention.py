@@ -0,0 +1,91 @@
+"""SOS writes against concurrent dashboard reads, with and without the SQLite tuning.
+
+    python benchmarks/bench_db_contention.py [--untuned] [--seconds 10] [--writers 8] [--readers 8]
+
+Writers insert alerts and update their status, like sos_alert and
+update_sos_status. Readers run the dashboard's status aggregate plus a page of
+recent alerts. By default the script uses the tuned production profile,
+settings.SQLITE_TUNED_OPTIONS. ``--untuned`` uses SQLite's defaults instead
+(rollback journal, 5 s timeout, deferred transactions). Run the script once
+each way and compare.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+from common import print_row, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--untuned', action='store_true')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    if not args.untuned:
+        os.environ['NIGERIASAFE_SQLITE_TUNED'] = '1'
+    setup_django(db_options={} if args.untuned else None)
+
+    from django.db import OperationalError, connection, transaction
+    from django.db.models import Count
+
+    from base.models import SOSAlert
+
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        print(f"journal_mode={cursor.fetchone()[0]}")
+    SOSAlert.objects.bulk_create(
+        [SOSAlert(latitude='6.5', longitude='3.3') for _ in range(args.rows)], batch_size=2000,
+    )
+
+    stop = time.monotonic() + args.seconds
+    results = {'write': ([], [0]), 'read': ([], [0])}
+
+    def writer(seed):
+        rng = random.Random(seed)
+        latencies, errors = results['write']
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                alert = SOSAlert.objects.create(latitude=rng.uniform(4, 13), longitude=rng.uniform(3, 14))
+                with transaction.atomic():
+                    alert.status = SOSAlert.STATUS_ACK
+                    alert.save(update_fields=['status'])
+                latencies.append(time.perf_counter() - started)
+            except OperationalError:
+                errors[0] += 1
+        connection.close()
+
+    def reader():
+        latencies, errors = results['read']
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                dict(SOSAlert.objects.values_list('status').annotate(n=Count('id')))
+                list(SOSAlert.objects.order_by('-created_at', '-id')[:25])
+                latencies.append(time.perf_counter() - started)
+            except OperationalError:
+                errors[0] += 1
+        connection.close()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    label = 'untuned' if args.untuned else 'tuned'
+    for kind, (latencies, errors) in results.items():
+        print_row(f'{label} {kind}s', len(latencies), elapsed, latencies, errors[0])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Time VolunteerIndex.rank() for one alert against N volunteers.
+
+    python benchmarks/bench_dispatch.py [--volunteers 50000] [--alerts 1000]
+
+Runs on in-memory arrays only; no database is needed after setup.
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from common import percentile, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--volunteers', type=int, default=50_000)
+    parser.add_argument('--alerts', type=int, default=1000)
+    parser.add_argument('-k', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from base.dispatch import AVAILABILITY_PENALTY_KM, VolunteerIndex
+
+    rng = random.Random(3)
+    tiers = list(AVAILABILITY_PENALTY_KM)
+    index = VolunteerIndex()
+    started = time.perf_counter()
+    for pk in range(1, args.volunteers + 1):
+        index.upsert(SimpleNamespace(
+            pk=pk,
+            latitude=rng.uniform(4.3, 13.9),
+            longitude=rng.uniform(2.7, 14.7),
+            isAvailable=rng.choice(tiers),
+            medical_training=rng.random() < 0.2,
+        ))
+    print(f"indexed {args.volunteers} volunteers in {time.perf_counter() - started:.2f}s")
+
+    latencies = []
+    for _ in range(args.alerts):
+        lat, lon = rng.uniform(4.3, 13.9), rng.uniform(2.7, 14.7)
+        started = time.perf_counter()
+        index.rank(lat, lon, k=args.k)
+        latencies.append(time.perf_counter() - started)
+    print(
+        f"rank top-{args.k}: mean {sum(latencies) / len(latencies) * 1000:.2f} ms"
+        f"  p99 {percentile(latencies, 99) * 1000:.2f} ms"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Spatial lookups on SOSAlert: geohash index vs. a full table scan.
+
+    python benchmarks/bench_geo.py [--alerts 1000000] [--queries 200]
+
+Fills a throwaway database with alerts spread over Nigeria, then times 2 km
+radius queries and 10-nearest queries through GeoQuerySet, and the same
+radius query done the old way (load every row, filter in Python).
+"""
+import argparse
+import random
+import time
+
+from common import percentile, setup_django
+
+NIGERIA_BBOX = (4.3, 2.7, 13.9, 14.7)  # min_lat, min_lon, max_lat, max_lon
+
+
+def random_point(rng):
+    min_lat, min_lon, max_lat, max_lon = NIGERIA_BBOX
+    # Cluster most alerts around a few cities, as real incidents do.
+    if rng.random() < 0.7:
+        lat, lon = rng.choice([(6.5244, 3.3792), (9.0765, 7.3986), (12.0022, 8.5920), (4.8156, 7.0498)])
+        return round(rng.gauss(lat, 0.3), 6), round(rng.gauss(lon, 0.3), 6)
+    return round(rng.uniform(min_lat, max_lat), 6), round(rng.uniform(min_lon, max_lon), 6)
+
+
+def timed(fn, points):
+    latencies = []
+    for lat, lon in points:
+        started = time.perf_counter()
+        fn(lat, lon)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(label, latencies):
+    print(
+        f"{label:<28} {len(latencies):>5} queries"
+        f"  mean {sum(latencies) / len(latencies) * 1000:>9.2f} ms"
+        f"  p99 {percentile(latencies, 99) * 1000:>9.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--alerts', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--scan-queries', type=int, default=3)
+    parser.add_argument('--radius-km', type=float, default=2.0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import transaction
+
+    from base.geo import haversine_km
+    from base.models import SOSAlert
+
+    rng = random.Random(7)
+    started = time.perf_counter()
+    for offset in range(0, args.alerts, 10_000):
+        with transaction.atomic():
+            SOSAlert.objects.bulk_create([
+                SOSAlert(latitude=lat, longitude=lon)
+                for lat, lon in (random_point(rng) for _ in range(min(10_000, args.alerts - offset)))
+            ])
+    print(f"inserted {args.alerts} alerts in {time.perf_counter() - started:.1f}s")
+
+    points = [random_point(rng) for _ in range(args.queries)]
+    radius = args.radius_km
+
+    def indexed_radius(lat, lon):
+        return list(SOSAlert.objects.within_radius(lat, lon, radius).values_list('id', flat=True))
+
+    def indexed_nearest(lat, lon):
+        return list(SOSAlert.objects.nearest(lat, lon, 10).values_list('id', flat=True))
+
+    def scan_radius(lat, lon):
+        return [
+            pk for pk, a_lat, a_lon in SOSAlert.objects.values_list('id', 'latitude', 'longitude').iterator()
+            if haversine_km(lat, lon, a_lat, a_lon) <= radius
+        ]
+
+    for lat, lon in points[:args.scan_queries]:
+        assert sorted(indexed_radius(lat, lon)) == sorted(scan_radius(lat, lon))
+
+    report(f"radius {radius:g} km (geohash)", timed(indexed_radius, points))
+    report("10 nearest (geohash)", timed(indexed_nearest, points))
+    report(f"radius {radius:g} km (full scan)", timed(scan_radius, points[:args.scan_queries]))
+
+
+if __name__ == '__main__':
+    main()
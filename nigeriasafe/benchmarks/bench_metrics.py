@@ -0,0 +1,92 @@
+"""Cost of the request metrics: the same pages with and without MetricsMiddleware.
+
+    python benchmarks/bench_metrics.py [--requests 1000] [--rounds 5]
+
+Seeds a small synthetic dataset, then requests a template page, a
+pre-rendered page and the staff dashboard (which runs several queries).
+Runs with and without the middleware alternate, and the fastest round of
+each is compared, to even out drift. Page timings include the test client's
+own cost and are noisy on a busy machine. So the script also times the two
+parts of the overhead directly: the wrapper around each SQL query, and the
+middleware around a view that does nothing.
+"""
+import argparse
+import time
+
+from common import setup_django
+
+
+def run(client, url, requests):
+    started = time.perf_counter()
+    for _ in range(requests):
+        resp = client.get(url)
+        assert resp.status_code == 200, resp.status_code
+    return (time.perf_counter() - started) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.http import HttpResponse
+    from django.test import Client, RequestFactory
+
+    from base import metrics, synthetic
+
+    settings.METRICS_DIR = None
+    synthetic.generate(volunteers=200, patients=500, tasks=200, alerts=5000)
+    staff = User.objects.create_user('bench-staff', is_staff=True)
+
+    with_metrics = Client()
+    settings.MIDDLEWARE = [m for m in settings.MIDDLEWARE if m != 'base.metrics.MetricsMiddleware']
+    without_metrics = Client()
+    for client in (with_metrics, without_metrics):
+        client.force_login(staff)
+    # The middleware chain is built on a client's first request
+    settings.MIDDLEWARE.insert(0, 'base.metrics.MetricsMiddleware')
+    with_metrics.get('/contact/')
+    settings.MIDDLEWARE.pop(0)
+    without_metrics.get('/contact/')
+
+    print(f"{'page':<28} {'without µs':>11} {'with µs':>9} {'overhead µs':>12} {'overhead':>9}")
+    for label, url in [('contact (template)', '/contact/'), ('about (pre-rendered)', '/about/'),
+                       ('admin_dashboard ?tab=sos', '/admin-dashboard/?tab=sos')]:
+        plain, measured = [], []
+        for _ in range(args.rounds):
+            plain.append(run(without_metrics, url, args.requests))
+            measured.append(run(with_metrics, url, args.requests))
+        a, b = min(plain) * 1e6, min(measured) * 1e6
+        print(f'{label:<28} {a:>11.1f} {b:>9.1f} {b - a:>12.1f} {(b - a) / a * 100:>8.1f}%')
+
+    n = 20000
+    with connection.cursor() as cursor:
+        def queries():
+            started = time.perf_counter()
+            for _ in range(n):
+                cursor.execute('SELECT 1')
+            return (time.perf_counter() - started) / n
+        plain, wrapped = [], []
+        for _ in range(5):
+            plain.append(queries())
+            with connection.execute_wrapper(metrics.Sample()):
+                wrapped.append(queries())
+        plain, wrapped = min(plain), min(wrapped)
+    print(f'per SQL query: {(wrapped - plain) * 1e6:.2f} µs')
+
+    request = RequestFactory().get('/about/')
+    response = HttpResponse(b'x' * 4096)
+    middleware = metrics.MetricsMiddleware(lambda request: response)
+    started = time.perf_counter()
+    for _ in range(n):
+        middleware(request)
+    print(f'per request (middleware around a no-op view): {(time.perf_counter() - started) / n * 1e6:.2f} µs')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""SOS email delivery: inline send_mail per request versus the outbox worker.
+
+    python benchmarks/bench_outbox.py [--emails 200] [--handshake-ms 150] [--rtt-ms 2]
+
+Runs against a local SMTP stand-in, which is a minimal SMTP sink on a
+loopback port. It waits ``--handshake-ms`` before its greeting, to stand in
+for the TCP and TLS setup to a remote host, and ``--rtt-ms`` before each
+reply. Django's real SMTP backend talks to it. Three timings:
+- Inline: ``send_mail`` once per email, which is what ``send_sos_email``
+  did. Each call opens and closes its own connection, and the request
+  waits for all of it.
+- Queue: a POST to ``send_sos_email`` now, which only inserts the outbox row.
+- Worker: ``outbox.run(once=True)`` draining the queued emails over one
+  connection.
+"""
+import argparse
+import json
+import socketserver
+import threading
+import time
+
+from common import setup_django
+
+
+class SMTPSink(socketserver.StreamRequestHandler):
+    handshake = 0.0
+    rtt = 0.0
+    connections = 0
+    messages = 0
+
+    def reply(self, line):
+        time.sleep(self.rtt)
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        type(self).connections += 1
+        time.sleep(self.handshake)
+        self.reply('220 sink ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.strip().upper()
+            if command.startswith((b'EHLO', b'HELO')):
+                self.reply('250 sink')
+            elif command == b'DATA':
+                self.reply('354 go ahead')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                type(self).messages += 1
+                self.reply('250 queued')
+            elif command == b'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--handshake-ms', type=float, default=150)
+    parser.add_argument('--rtt-ms', type=float, default=2)
+    args = parser.parse_args()
+
+    SMTPSink.handshake = args.handshake_ms / 1000
+    SMTPSink.rtt = args.rtt_ms / 1000
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPSink)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.mail import get_connection, send_mail
+    from django.test import Client
+
+    from base import outbox
+    from base.models import Notification
+
+    settings.EMAIL_HOST, settings.EMAIL_PORT = server.server_address
+    settings.EMAIL_USE_TLS = settings.EMAIL_USE_SSL = False
+    settings.EMAIL_HOST_USER = settings.EMAIL_HOST_PASSWORD = ''
+    smtp = 'django.core.mail.backends.smtp.EmailBackend'
+    subject, body = outbox.sos_email(6.45, 3.39, 'Help')
+
+    started = time.perf_counter()
+    for i in range(args.emails):
+        send_mail(subject, body, 'sos@example.com', [f'kin{i}@example.com'],
+                  connection=get_connection(smtp))
+    inline = (time.perf_counter() - started) / args.emails
+    inline_connections, SMTPSink.connections = SMTPSink.connections, 0
+
+    client = Client()
+    payload = json.dumps({'latitude': 6.45, 'longitude': 3.39})
+    started = time.perf_counter()
+    for _ in range(args.emails):
+        resp = client.post('/send-sos-email/', payload, content_type='application/json')
+        assert resp.status_code == 200, resp.content
+    queue = (time.perf_counter() - started) / args.emails
+
+    started = time.perf_counter()
+    totals = outbox.run(once=True, connection=get_connection(smtp))
+    worker = (time.perf_counter() - started) / args.emails
+    assert totals.sent == args.emails, totals
+    assert not Notification.objects.exclude(status=Notification.STATUS_SENT).exists()
+
+    print(f"{'':<34} {'ms/email':>9} {'connections':>12}")
+    print(f"{'inline send_mail (before)':<34} {inline * 1000:>9.2f} {inline_connections:>12}")
+    print(f"{'send_sos_email POST, queue only':<34} {queue * 1000:>9.2f} {0:>12}")
+    print(f"{'outbox worker, one connection':<34} {worker * 1000:>9.2f} {SMTPSink.connections:>12}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
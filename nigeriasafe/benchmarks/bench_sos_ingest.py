@@ -0,0 +1,68 @@
+"""Compare per-request SOS inserts with the group-commit write buffer.
+
+    python benchmarks/bench_sos_ingest.py [--alerts 2000] [--workers 32]
+
+Each worker thread POSTs alerts to /api/sos-alert/ through the test client, so
+the numbers include view and middleware cost, not only the INSERT.
+"""
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import print_row, setup_django
+
+
+def run(mode, alerts, workers):
+    from django.db import connection
+    from django.test import Client, override_settings
+
+    from base import ingest
+    from base.models import SOSAlert
+
+    SOSAlert.objects.all().delete()
+    rng = random.Random(42)
+    payloads = [
+        json.dumps({
+            'latitude': round(rng.uniform(4.3, 13.9), 6),
+            'longitude': round(rng.uniform(2.7, 14.7), 6),
+            'message': 'bench',
+        })
+        for _ in range(alerts)
+    ]
+
+    def post(body):
+        client = Client()
+        started = time.perf_counter()
+        resp = client.post('/api/sos-alert/', body, content_type='application/json')
+        elapsed = time.perf_counter() - started
+        connection.close()
+        return elapsed, resp.status_code
+
+    with override_settings(SOS_INGEST_MODE=mode):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(post, payloads))
+        elapsed = time.perf_counter() - started
+        ingest.get_buffer().stop()
+
+    latencies = [r[0] for r in results]
+    errors = sum(1 for r in results if r[1] != 200)
+    print_row(mode, alerts, elapsed, latencies, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--alerts', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=32)
+    args = parser.parse_args()
+
+    setup_django()
+    print(f"{args.alerts} alerts, {args.workers} concurrent clients")
+    for mode in ('direct', 'buffered'):
+        run(mode, args.alerts, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Requests/sec for the guidance pages: live render() vs. pre-rendered bytes.
+
+    python benchmarks/bench_static_pages.py [--requests 2000]
+
+Builds the pre-rendered copies into a temporary directory, then requests each
+page through the test client as an anonymous visitor with and without them.
+"""
+import argparse
+import tempfile
+import time
+
+from common import print_row, setup_django
+
+
+def run(label, client, urls, requests, headers):
+    latencies = []
+    started = time.perf_counter()
+    for i in range(requests):
+        t0 = time.perf_counter()
+        resp = client.get(urls[i % len(urls)], headers=headers)
+        latencies.append(time.perf_counter() - t0)
+        assert resp.status_code in (200, 304), resp.status_code
+    print_row(label, requests, time.perf_counter() - started, latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test import Client
+    from django.urls import reverse
+
+    from base import prerender
+
+    names = list(prerender.PAGES)
+    urls = [reverse(f'base:{name}') for name in names]
+    client = Client()
+
+    settings.PRERENDERED_PAGES_DIR = tempfile.mkdtemp(prefix='nigeriasafe-prerendered-')
+    run('render()', client, urls, args.requests, {})
+
+    manifest, _ = prerender.build(names)
+    run('pre-rendered identity', client, urls, args.requests, {})
+    run('pre-rendered br', client, urls, args.requests, {'Accept-Encoding': 'gzip, br'})
+
+    page = prerender.pages.get(names[0])
+    etag = prerender.etag_for(page['hash'], 'br')
+    run('pre-rendered 304', client, urls[:1], args.requests, {'Accept-Encoding': 'br', 'If-None-Match': etag})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Compare the JSON SOS payload with the compact text form (base.wire).
+
+    python benchmarks/bench_wire.py [--alerts 20000] [--requests 1000] [--rounds 5]
+
+For each form, prints the request and response sizes and the cost of
+turning a body into the cleaned values an alert is saved from:
+- JSON: json.loads, then clean_coordinates (Decimal parsing), then
+  clean_client_timestamp.
+- Compact: wire.decode.
+The last column is a full POST to /api/sos-alert/ through the test client.
+There the INSERT dominates, and an SMS-style body with an MRN adds the
+patient lookup.
+"""
+import argparse
+import datetime
+import json
+import random
+import time
+
+from common import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--alerts', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.http import JsonResponse
+    from django.test import Client, override_settings
+
+    from base import ingest, wire
+    from base.mrn import format_mrn
+
+    rng = random.Random(42)
+    now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    alerts = [
+        {
+            'latitude': round(rng.uniform(4.3, 13.9), 6),
+            'longitude': round(rng.uniform(2.7, 14.7), 6),
+            'client_timestamp': now - datetime.timedelta(seconds=rng.randrange(3600)),
+            'mrn': format_mrn(rng.randrange(1, 10 ** 6)),
+            'device_id': f'{rng.getrandbits(128):032x}',
+            'message': rng.choice(['', 'Help', 'Car crash on the expressway', 'Fire in the building, two trapped']),
+        }
+        for _ in range(args.alerts)
+    ]
+    # What sos.js sends (it has no MRN), plus the client timestamp
+    json_bodies = [
+        json.dumps({
+            'latitude': a['latitude'], 'longitude': a['longitude'], 'message': a['message'],
+            'device_id': a['device_id'], 'client_timestamp': a['client_timestamp'].isoformat(),
+        }).encode()
+        for a in alerts
+    ]
+    # The same alerts in compact form
+    compact_bodies = [
+        wire.encode(a['latitude'], a['longitude'], a['client_timestamp'], '', a['device_id'], a['message']).encode()
+        for a in alerts
+    ]
+    # As an SMS gateway would send them: an MRN, whose check digit is verified, and no device id
+    sms_bodies = [
+        wire.encode(a['latitude'], a['longitude'], a['client_timestamp'], a['mrn'], '', a['message']).encode()
+        for a in alerts
+    ]
+
+    def parse_json(bodies):
+        for body in bodies:
+            data = json.loads(body)
+            ingest.clean_coordinates(data.get('latitude'), data.get('longitude'))
+            ingest.clean_client_timestamp(data.get('client_timestamp'))
+            data.get('message'), data.get('device_id')
+
+    def parse_compact(bodies):
+        for body in bodies:
+            wire.decode(body)
+
+    client = Client()
+    n = min(args.requests, len(alerts))
+
+    def post(bodies, content_type):
+        for body in bodies[:n]:
+            resp = client.post('/api/sos-alert/', body, content_type=content_type)
+            assert resp.status_code == 200, resp.content
+
+    formats = [
+        ('json', json_bodies, parse_json, 'application/json', JsonResponse),
+        ('compact', compact_bodies, parse_compact, wire.CONTENT_TYPE, wire.response),
+        ('compact, SMS', sms_bodies, parse_compact, wire.CONTENT_TYPE, wire.response),
+    ]
+    parse_times = {name: [] for name, *_ in formats}
+    post_times = {name: [] for name, *_ in formats}
+    # Rounds alternate between the formats, to even out drift; every alert
+    # is new, so each POST does the same INSERT
+    with override_settings(SOS_COALESCE_WINDOW=0):
+        for _ in range(args.rounds):
+            for name, bodies, parse, content_type, _ in formats:
+                started = time.perf_counter()
+                parse(bodies)
+                parse_times[name].append((time.perf_counter() - started) / len(bodies))
+                started = time.perf_counter()
+                post(bodies, content_type)
+                post_times[name].append((time.perf_counter() - started) / n)
+
+    reply = {'status': 'success', 'message': 'Alert received', 'id': 123456}
+    print(f"{'format':<20} {'request B':>10} {'response B':>11} {'parse µs':>9} {'POST µs':>9}")
+    for name, bodies, _, _, respond in formats:
+        size = sum(map(len, bodies)) / len(bodies)
+        print(f'{name:<20} {size:>10.1f} {len(respond(reply).content):>11} '
+              f'{min(parse_times[name]) * 1e6:>9.2f} {min(post_times[name]) * 1e6:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Shared setup for the scripts in this directory.
+
+Benchmarks never touch db.sqlite3: ``setup_django`` points the default
+database at a throwaway SQLite file and migrates it before returning.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path=None, db_options=None):
+    if str(PROJECT_DIR) not in sys.path:
+        sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nigeriasafe.settings')
+
+    import django
+    from django.conf import settings
+
+    if db_path is None:
+        db_path = Path(tempfile.mkdtemp(prefix='nigeriasafe-bench-')) / 'bench.sqlite3'
+    settings.DATABASES['default']['NAME'] = str(db_path)
+    if db_options is not None:
+        settings.DATABASES['default']['OPTIONS'] = db_options
+    django.setup()
+
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+
+    # Allows the 'testserver' host and swaps in the locmem email backend.
+    setup_test_environment()
+    call_command('migrate', verbosity=0)
+    return db_path
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def print_row(label, count, elapsed, latencies, errors=0):
+    print(
+        f"{label:<24} {count / elapsed:>10.1f}/s"
+        f"  p50 {percentile(latencies, 50) * 1000:>8.2f} ms"
+        f"  p99 {percentile(latencies, 99) * 1000:>8.2f} ms"
+        f"  errors {errors}"
+    )
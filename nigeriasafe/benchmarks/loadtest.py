@@ -0,0 +1,304 @@
+"""In-process load test: scripted traffic against the full Django stack.
+
+    python benchmarks/loadtest.py [--scenario sos_storm] [--workers 32] [--seconds 20]
+                                  [--interface wsgi|asgi] [--json results.json]
+                                  [--compare previous.json]
+
+Each worker plays one of the scenario's weighted actions in a loop as a
+signed-in patient, volunteer or staff member, or as an anonymous visitor.
+Requests go through the test client, so URL routing, middleware, views,
+templates and the database are all included, but no network or server
+process. ``--interface asgi`` sends the same traffic through the ASGI
+handler with ``AsyncClient``, which is how ``nigeriasafe.asgi`` runs the
+sync views.
+
+The report gives throughput, p50/p95/p99 latency and the error count for
+each endpoint. An error is a 5xx response or an exception. ``--json``
+writes the same figures, plus the settings that shape them, for later runs
+to be compared against with ``--compare``.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from common import percentile, setup_django
+
+
+# Scenario -> [(weight, label, role, method, path)]. Paths may contain
+# {alert_id} or {task_id}, filled with a random existing row.
+SCENARIOS = {
+    'sos_storm': [
+        (6, 'sos_alert (anonymous)', 'anonymous', 'sos', '/api/sos-alert/'),
+        (3, 'sos_alert (patient)', 'patient', 'sos', '/api/sos-alert/'),
+        (1, 'send_sos_email', 'patient', 'sos', '/send-sos-email/'),
+    ],
+    'dashboard': [
+        (3, 'admin_dashboard overview', 'staff', 'get', '/admin-dashboard/'),
+        (3, 'admin_dashboard sos tab', 'staff', 'get', '/admin-dashboard/?tab=sos'),
+        (3, 'sos_monitor', 'staff', 'get', '/sos-monitor/'),
+        (1, 'dispatch candidates', 'staff', 'get', '/dashboard/sos/{alert_id}/dispatch/'),
+    ],
+    'volunteer_polling': [
+        (8, 'volunteer_tasks', 'volunteer', 'get', '/volunteer/tasks/'),
+        (2, 'task status update', 'volunteer', 'task_status', '/task/{task_id}/status/'),
+    ],
+}
+# An incident: alerts pour in while dispatchers and volunteers watch
+SCENARIOS['incident'] = (
+    [(w * 2, *rest) for w, *rest in SCENARIOS['sos_storm']]
+    + SCENARIOS['dashboard']
+    + SCENARIOS['volunteer_polling']
+)
+
+
+def seed(patients, volunteers, alerts, tasks):
+    import datetime as dt
+
+    from django.contrib.auth.models import User
+
+    from base import stats
+    from base.models import Patient, SOSAlert, Task, Volunteer
+
+    rng = random.Random(7)
+    staff = User.objects.create_user('loadtest-staff', is_staff=True)
+    patient_users = [User.objects.create_user(f'loadtest-patient-{i}') for i in range(patients)]
+    for i, user in enumerate(patient_users):
+        Patient.objects.create(
+            user=user, full_name=f'Load Patient {i}', date_of_birth=dt.date(1990, 1, 1),
+            weight=70, height=170, address='Lagos', phone_number='08000000000',
+            emergency_contact_name='Kin', emergency_contact_phone='08000000001',
+            emergency_contact_email=f'kin{i}@example.com', emergency_contact_relationship='Sibling',
+        )
+    volunteer_users = [User.objects.create_user(f'loadtest-volunteer-{i}') for i in range(volunteers)]
+    Volunteer.objects.bulk_create([
+        Volunteer(user=user, latitude=round(rng.uniform(4.3, 13.9), 6), longitude=round(rng.uniform(2.7, 14.7), 6))
+        for user in volunteer_users
+    ])
+    SOSAlert.objects.bulk_create([
+        SOSAlert(latitude=round(rng.uniform(4.3, 13.9), 6), longitude=round(rng.uniform(2.7, 14.7), 6))
+        for _ in range(alerts)
+    ], batch_size=2000)
+    Task.objects.bulk_create([
+        Task(title=f'Task {i}', location='Lagos', description='Load test task', created_by=staff,
+             urgency=rng.choice(['low', 'medium', 'high', 'critical']))
+        for i in range(tasks)
+    ], batch_size=2000)
+    stats.rebuild()
+    return {
+        'staff': [staff],
+        'patient': patient_users,
+        'volunteer': volunteer_users,
+        'alert_ids': list(SOSAlert.objects.values_list('id', flat=True)),
+        'task_ids': list(Task.objects.values_list('id', flat=True)),
+    }
+
+
+class Worker:
+    """One simulated user: picks weighted actions and records each request."""
+
+    def __init__(self, index, actions, people, client_class, record):
+        self.rng = random.Random(index)
+        self.actions = actions
+        self.weights = [weight for weight, *_ in actions]
+        self.people = people
+        self.client_class = client_class
+        self.record = record
+        self.index = index
+        self.clients = {}
+
+    def client(self, role):
+        if role not in self.clients:
+            client = self.client_class()
+            if role != 'anonymous':
+                users = self.people[role]
+                client.force_login(users[self.index % len(users)])
+            self.clients[role] = client
+        return self.clients[role]
+
+    def next_request(self):
+        _, label, role, method, path = self.rng.choices(self.actions, self.weights)[0]
+        path = path.format(
+            alert_id=self.rng.choice(self.people['alert_ids']),
+            task_id=self.rng.choice(self.people['task_ids']) if self.people['task_ids'] else 0,
+        )
+        client = self.client(role)
+        if method == 'get':
+            return label, client.get, (path,), {}
+        if method == 'sos':
+            body = json.dumps({
+                'latitude': round(self.rng.uniform(4.3, 13.9), 6),
+                'longitude': round(self.rng.uniform(2.7, 14.7), 6),
+                'message': 'load test',
+            })
+            return label, client.post, (path, body), {'content_type': 'application/json'}
+        status = self.rng.choice(['in_progress', 'completed'])
+        return label, client.post, (path, {'status': status}), {}
+
+    def run_sync(self, deadline):
+        from django.db import connection
+        try:
+            while time.monotonic() < deadline:
+                label, call, args, kwargs = self.next_request()
+                started = time.perf_counter()
+                try:
+                    status = call(*args, **kwargs).status_code
+                except Exception as e:
+                    status = type(e).__name__
+                self.record(label, time.perf_counter() - started, status)
+        finally:
+            connection.close()
+
+    async def run_async(self, deadline):
+        from asgiref.sync import sync_to_async
+        await sync_to_async(self._login_all)()
+        while time.monotonic() < deadline:
+            label, call, args, kwargs = self.next_request()
+            started = time.perf_counter()
+            try:
+                status = (await call(*args, **kwargs)).status_code
+            except Exception as e:
+                status = type(e).__name__
+            self.record(label, time.perf_counter() - started, status)
+
+    def _login_all(self):
+        for _, _, role, _, _ in self.actions:
+            self.client(role)
+
+
+def run(scenario, workers, seconds, interface, people):
+    from django.test import AsyncClient, Client
+
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def record(label, latency, status):
+        with lock:
+            samples[label].append(latency)
+            if not isinstance(status, int) or status >= 500:
+                errors[label] += 1
+
+    actions = SCENARIOS[scenario]
+    started = time.monotonic()
+    deadline = started + seconds
+    if interface == 'asgi':
+        pool = [Worker(i, actions, people, AsyncClient, record) for i in range(workers)]
+
+        async def main():
+            await asyncio.gather(*(worker.run_async(deadline) for worker in pool))
+        asyncio.run(main())
+    else:
+        pool = [Worker(i, actions, people, Client, record) for i in range(workers)]
+        threads = [threading.Thread(target=worker.run_sync, args=(deadline,)) for worker in pool]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.monotonic() - started
+    return summarize(samples, errors, elapsed)
+
+
+def summarize(samples, errors, elapsed):
+    def figures(latencies, error_count):
+        return {
+            'requests': len(latencies),
+            'errors': error_count,
+            'throughput': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+    endpoints = {label: figures(latencies, errors[label]) for label, latencies in sorted(samples.items())}
+    everything = [latency for latencies in samples.values() for latency in latencies]
+    return {
+        'elapsed_s': round(elapsed, 2),
+        'endpoints': endpoints,
+        'total': figures(everything, sum(errors.values())),
+    }
+
+
+def print_report(results, previous=None):
+    header = f"{'endpoint':<28} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+    if previous:
+        header += f"  {'Δreq/s':>8} {'Δp95':>8}"
+    print(header)
+    rows = list(results['endpoints'].items()) + [('TOTAL', results['total'])]
+    for label, row in rows:
+        line = (f"{label:<28} {row['throughput']:>9.1f} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f}"
+                f" {row['p99_ms']:>9.2f} {row['errors']:>7}")
+        if previous:
+            old = previous['total'] if label == 'TOTAL' else previous['endpoints'].get(label)
+            if old:
+                line += (f"  {_change(row['throughput'], old['throughput']):>8}"
+                         f" {_change(row['p95_ms'], old['p95_ms']):>8}")
+        print(line)
+
+
+def _change(new, old):
+    if not old:
+        return 'n/a'
+    return f'{(new - old) / old * 100:+.0f}%'
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='incident')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--interface', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--volunteers', type=int, default=500)
+    parser.add_argument('--alerts', type=int, default=20000)
+    parser.add_argument('--tasks', type=int, default=200)
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--compare', help='Show changes against a previous --json file')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+
+    people = seed(args.patients, args.volunteers, args.alerts, args.tasks)
+    results = run(args.scenario, args.workers, args.seconds, args.interface, people)
+    results['meta'] = {
+        'scenario': args.scenario,
+        'workers': args.workers,
+        'seconds': args.seconds,
+        'interface': args.interface,
+        'seed': {'patients': args.patients, 'volunteers': args.volunteers,
+                 'alerts': args.alerts, 'tasks': args.tasks},
+        'settings': {'SOS_INGEST_MODE': settings.SOS_INGEST_MODE},
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'finished_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as fh:
+            previous = json.load(fh)
+    print(f"{args.scenario}: {args.workers} workers for {results['elapsed_s']}s over {args.interface}")
+    print_report(results, previous)
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+        print(f'Results written to {args.json}')
+
+
+if __name__ == '__main__':
+    main()
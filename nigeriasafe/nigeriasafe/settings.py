@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,11 +46,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'base.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'base.profiles.ProfileMiddleware',
+    'base.routers.ReadReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -58,7 +62,8 @@ ROOT_URLCONF = 'nigeriasafe.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, plus render time for the request metrics
+        'BACKEND': 'base.metrics.TimedDjangoTemplates',
         'DIRS': [
             BASE_DIR / 'templates'
         ],
@@ -79,13 +84,45 @@ WSGI_APPLICATION = 'nigeriasafe.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Production profile for SQLite, opted into with NIGERIASAFE_SQLITE_TUNED=1.
+# WAL lets dashboard reads run alongside SOS writes. IMMEDIATE transactions
+# take the write lock up front so waiting writers honour the busy timeout,
+# which also makes every atomic() block hold the write lock until it ends.
+# Off by default: WAL rewrites the database file's header and leaves -wal and
+# -shm files next to it, which the committed db.sqlite3 and tests should not get.
+SQLITE_TUNED_OPTIONS = {
+    'timeout': 20,  # seconds to wait for a lock before "database is locked"
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+}
+SQLITE_OPTIONS = SQLITE_TUNED_OPTIONS if os.environ.get('NIGERIASAFE_SQLITE_TUNED') == '1' else {}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
     }
 }
 
+# Optional read replica for the read-heavy pages (see base.routers). For a
+# local stand-in, point this at a copy kept current by `manage.py sync_read_replica`.
+if os.environ.get('NIGERIASAFE_READ_REPLICA'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['NIGERIASAFE_READ_REPLICA'],
+        'OPTIONS': {key: value for key, value in SQLITE_OPTIONS.items() if key != 'transaction_mode'},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['base.routers.ReadReplicaRouter']
+READ_REPLICA_PIN_SECONDS = 10  # reads stay on the primary this long after a POST
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -136,3 +173,89 @@ EMAIL_HOST_PASSWORD = '5cf5539afb77d9'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
+
+# SOS alert ingestion
+# 'direct' saves each alert in its own transaction. 'buffered' group-commits
+# alerts from concurrent requests through base.ingest.
+SOS_INGEST_MODE = 'direct'
+SOS_INGEST_BATCH_SIZE = 100
+SOS_INGEST_FLUSH_INTERVAL = 0.005  # seconds
+SOS_INGEST_ACK_TIMEOUT = 10  # seconds
+SOS_BATCH_MAX_ALERTS = 100  # per request to sos_alert_batch
+
+# Repeat SOS presses from the same patient, device or session within this
+# window and radius update the open alert instead of adding one (see
+# base.coalesce). A window of 0 turns coalescing off.
+SOS_COALESCE_WINDOW = 120  # seconds since the last press
+SOS_COALESCE_RADIUS_M = 250
+SOS_COALESCE_INDEX_SIZE = 10000  # recent sources remembered per process
+
+# Resolved alerts older than this move to the archive table, in chunks of
+# SOS_ARCHIVE_CHUNK_SIZE per transaction (`manage.py archive_alerts`)
+SOS_ARCHIVE_AFTER_DAYS = 90
+SOS_ARCHIVE_CHUNK_SIZE = 1000
+
+# Idempotency-Key handling for SOS submissions (see base.idempotency).
+# Stored responses are replayed for this long; expired keys are deleted by
+# `manage.py purge_idempotency_keys`.
+IDEMPOTENCY_KEY_TTL = 24 * 3600  # seconds
+IDEMPOTENCY_LOCK_SECONDS = 60  # before a crashed request's claim is taken over
+
+# Notification outbox (see base.outbox). Views queue SOS emails, and
+# `manage.py send_notifications` sends them over one SMTP connection.
+NOTIFICATION_BATCH_SIZE = 50  # emails claimed per batch
+NOTIFICATION_POLL_INTERVAL = 1  # seconds between looks at an empty outbox
+NOTIFICATION_LEASE_SECONDS = 120  # before a crashed worker's emails are due again
+NOTIFICATION_CONNECTION_IDLE = 30  # seconds before an idle SMTP connection is closed
+NOTIFICATION_RETRY_BASE = 30  # seconds; doubles with each failed attempt
+NOTIFICATION_RETRY_MAX = 3600  # seconds
+NOTIFICATION_MAX_ATTEMPTS = 8  # then the email is dead-lettered
+
+# Volunteer dispatch
+# Seconds before a worker process reloads its in-memory volunteer index.
+DISPATCH_INDEX_MAX_AGE = 300
+
+# Rows per page on the admin dashboard tabs and the SOS monitor
+DASHBOARD_PAGE_SIZE = 25
+DASHBOARD_STATS_MAX_AGE = 24 * 3600  # seconds before the overview counters are rebuilt (see base.stats)
+SOS_MONITOR_PAGE_SIZE = 50
+TASK_FEED_PAGE_SIZE = 20  # volunteer task feed (see base.taskfeed)
+
+# Live SOS feed (Server-Sent Events, served through nigeriasafe.asgi)
+SOS_STREAM_KEEPALIVE = 20  # seconds between keepalive comments
+SOS_STREAM_RETRY_MS = 3000  # client reconnect delay
+SOS_STREAM_POLL_INTERVAL = 1  # seconds between reads of new AlertEvent rows
+SOS_STREAM_EVENT_TTL = 3600  # seconds an event is kept for reconnecting clients
+
+# Pre-rendered guidance pages, built with `manage.py prerender_pages`
+PRERENDERED_PAGES_DIR = BASE_DIR / 'prerendered'
+PRERENDERED_PAGES_MAX_AGE = 300  # seconds
+
+# Responsive image variants, built with `manage.py build_image_variants`
+RESPONSIVE_IMAGES_DIR = BASE_DIR / 'responsive'
+RESPONSIVE_IMAGE_SOURCES = ['images/ambulance.jpg', 'images/firetruck.jpg']
+RESPONSIVE_IMAGE_WIDTHS = (480, 768, 1280, 1920)
+RESPONSIVE_IMAGE_JPEG_QUALITY = 78
+RESPONSIVE_IMAGE_WEBP_QUALITY = 75
+
+# Rows fetched per database round trip by the streaming exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Medical record numbers reserved per database round trip (see base.mrn)
+MRN_BLOCK_SIZE = 20
+
+# Sign in by email first; username sign-in (the Django admin) still works
+AUTHENTICATION_BACKENDS = [
+    'base.backends.EmailBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Seconds a user's patient/volunteer profiles stay cached (see base.profiles)
+PROFILE_CACHE_TIMEOUT = 300
+
+# Request metrics, served in Prometheus format at /metrics (see base.metrics).
+# Each worker process writes its totals to METRICS_DIR this often, so a
+# scrape adds up every worker on the host. Keep it outside the source tree,
+# e.g. /run/nigeriasafe/metrics; unset, each process reports only its own.
+METRICS_DIR = os.environ.get('NIGERIASAFE_METRICS_DIR') or None
+METRICS_FLUSH_SECONDS = 5
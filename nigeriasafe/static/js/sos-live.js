@@ -0,0 +1,109 @@
+// sos-live.js: keeps an SOS alert list current from the /sos-monitor/stream/
+// Server-Sent Events feed. The list element carries data-live-feed (the
+// stream URL) and data-live-mode: "cards" adds new alerts to the top of the
+// list, "notice" only announces them (used on filtered or older pages).
+(function () {
+  const list = document.querySelector("[data-live-feed]");
+  if (!list || !window.EventSource) return;
+
+  const mode = list.dataset.liveMode || "notice";
+  let newAlerts = 0;
+  let notice = null;
+
+  function showNotice(text) {
+    if (!notice) {
+      notice = document.createElement("a");
+      notice.href = window.location.href;
+      notice.className = "monitor-btn monitor-btn-primary live-notice";
+      list.parentNode.insertBefore(notice, list);
+    }
+    notice.textContent = text;
+  }
+
+  function updateCard(card, data) {
+    const status = card.querySelector("[data-live-status]");
+    if (status) {
+      status.textContent = data.status_display;
+      status.classList.remove("status-pending", "status-acknowledged", "status-resolved");
+      if (status.classList.contains("status-badge")) {
+        status.classList.add("status-" + data.status);
+      } else {
+        status.classList.toggle("status-critical", data.status === "pending");
+      }
+    }
+    const repeats = card.querySelector("[data-live-repeats]");
+    if (repeats && data.repeat_count) {
+      repeats.textContent = "Pressed " + (data.repeat_count + 1) + " times";
+    }
+    ["status-pending", "status-acknowledged", "status-resolved"].forEach(function (cls) {
+      if (card.classList.contains(cls)) {
+        card.classList.remove(cls);
+        card.classList.add("status-" + data.status);
+      }
+    });
+  }
+
+  function buildCard(data) {
+    const card = document.createElement("div");
+    card.className = "alert-card";
+    card.dataset.alertId = data.id;
+
+    const header = document.createElement("div");
+    header.className = "alert-card-header";
+    const status = document.createElement("span");
+    status.className = "alert-status" + (data.status === "pending" ? " status-critical" : "");
+    status.setAttribute("data-live-status", "");
+    status.textContent = data.status_display;
+    const when = document.createElement("small");
+    when.style.cssText = "color: #999; font-weight: 600;";
+    when.textContent = "just now";
+    const repeats = document.createElement("small");
+    repeats.style.cssText = "color: #c0392b; font-weight: 600;";
+    repeats.setAttribute("data-live-repeats", "");
+    header.append(status, when, repeats);
+
+    const body = document.createElement("div");
+    body.className = "alert-card-body";
+    const title = document.createElement("h3");
+    title.style.cssText = "font-size: 18px; margin-bottom: 15px; color: #333;";
+    title.textContent = data.patient
+      ? data.patient + (data.mrn ? " (MRN: " + data.mrn + ")" : "")
+      : "Anonymous User";
+    const map = document.createElement("a");
+    map.href = "https://www.google.com/maps/search/?api=1&query=" + data.latitude + "," + data.longitude;
+    map.target = "_blank";
+    map.textContent = "View Location on Map (" + data.latitude + ", " + data.longitude + ")";
+    body.append(title, map);
+    if (data.message) {
+      const note = document.createElement("div");
+      note.style.cssText = "background: #fff; border: 1px solid #eee; padding: 12px; border-radius: 8px; font-size: 14px; color: #555; margin-top: 10px;";
+      note.textContent = "Note: " + data.message;
+      body.append(note);
+    }
+
+    card.append(header, body);
+    return card;
+  }
+
+  const source = new EventSource(list.dataset.liveFeed);
+  source.addEventListener("sos", function (ev) {
+    const data = JSON.parse(ev.data);
+    if (data.type === "reset") {
+      showNotice("Missed some updates. Click to reload.");
+      return;
+    }
+    const card = list.querySelector('[data-alert-id="' + data.id + '"]');
+    if (card) {
+      updateCard(card, data);
+    } else if (data.type === "created") {
+      if (mode === "cards") {
+        const empty = list.querySelector("[data-live-empty]");
+        if (empty) empty.remove();
+        list.prepend(buildCard(data));
+      } else {
+        newAlerts += 1;
+        showNotice(newAlerts + " new SOS alert" + (newAlerts > 1 ? "s" : "") + ". Click to load.");
+      }
+    }
+  });
+})();
@@ -0,0 +1,109 @@
+// sos-queue.js: SOS alerts waiting for a connection, kept in IndexedDB.
+// Loaded by the pages (before sos.js) and by the service worker, which both
+// call SOSQueue.flush() to upload the queue to /api/sos-alert/batch/.
+(function (scope) {
+  const DB_NAME = "nigeriasafe";
+  const STORE = "sos-queue";
+  const BATCH_URL = "/api/sos-alert/batch/";
+  // Alerts per upload; the server accepts up to SOS_BATCH_MAX_ALERTS
+  const BATCH_SIZE = 50;
+
+  let opening = null;
+
+  function open() {
+    if (!opening) {
+      opening = new Promise(function (resolve, reject) {
+        const req = indexedDB.open(DB_NAME, 1);
+        req.onupgradeneeded = function () {
+          req.result.createObjectStore(STORE, { keyPath: "id", autoIncrement: true });
+        };
+        req.onsuccess = function () {
+          resolve(req.result);
+        };
+        req.onerror = function () {
+          opening = null;
+          reject(req.error);
+        };
+      });
+    }
+    return opening;
+  }
+
+  async function transact(mode, work) {
+    const db = await open();
+    return new Promise(function (resolve, reject) {
+      const tx = db.transaction(STORE, mode);
+      const result = work(tx.objectStore(STORE));
+      tx.oncomplete = function () {
+        resolve(result && "result" in result ? result.result : undefined);
+      };
+      tx.onerror = tx.onabort = function () {
+        reject(tx.error);
+      };
+    });
+  }
+
+  function add(alert) {
+    return transact("readwrite", function (store) {
+      return store.add({ alert: alert });
+    });
+  }
+
+  function all() {
+    return transact("readonly", function (store) {
+      return store.getAll();
+    });
+  }
+
+  function remove(ids) {
+    return transact("readwrite", function (store) {
+      ids.forEach(function (id) {
+        store.delete(id);
+      });
+    });
+  }
+
+  // Same batch, same key: if an upload's response was lost, the retry gets
+  // the stored response instead of inserting the alerts twice.
+  async function idempotencyKey(body) {
+    if (!scope.crypto || !crypto.subtle) return null;
+    const digest = await crypto.subtle.digest("SHA-256", new TextEncoder().encode(body));
+    const hex = Array.from(new Uint8Array(digest), function (b) {
+      return b.toString(16).padStart(2, "0");
+    }).join("");
+    return "sos-batch-" + hex.slice(0, 40);
+  }
+
+  async function upload(entries) {
+    const body = JSON.stringify({
+      alerts: entries.map(function (entry) {
+        return entry.alert;
+      }),
+    });
+    const headers = { "Content-Type": "application/json" };
+    const key = await idempotencyKey(body);
+    if (key) headers["Idempotency-Key"] = key;
+    const resp = await fetch(BATCH_URL, { method: "POST", headers: headers, body: body });
+    // 4xx means the alerts themselves were rejected; retrying cannot help
+    if (resp.status >= 500 || resp.status === 409) throw new Error("SOS upload failed: " + resp.status);
+    await remove(entries.map(function (entry) {
+      return entry.id;
+    }));
+  }
+
+  // Upload everything queued; resolves to the number of alerts sent. The
+  // lock stops a page and the worker from uploading the same alerts at once.
+  function flush() {
+    async function run() {
+      const entries = await all();
+      for (let i = 0; i < entries.length; i += BATCH_SIZE) {
+        await upload(entries.slice(i, i + BATCH_SIZE));
+      }
+      return entries.length;
+    }
+    const locks = scope.navigator && navigator.locks;
+    return locks ? locks.request(DB_NAME + "-" + STORE, run) : run();
+  }
+
+  scope.SOSQueue = { add: add, all: all, flush: flush };
+})(self);
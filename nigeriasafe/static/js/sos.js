@@ -1,5 +1,19 @@
 // sos.js: attaches to .sos-button and posts geolocation to /api/sos-alert/
+// A failed POST is retried with backoff under the same Idempotency-Key, so a
+// request that did reach the server is not repeated. If the device is still
+// offline, the alert is queued in IndexedDB (sos-queue.js). The service
+// worker uploads it by Background Sync as soon as coverage returns, and this
+// page does too on its "online" event.
 (function () {
+  // Alerts queued in localStorage by earlier versions of this script
+  const LEGACY_QUEUE_KEY = "nigeriasafe-sos-queue";
+  const DEVICE_KEY = "nigeriasafe-device-id";
+  const SYNC_TAG = "sos-queue";
+  // Milliseconds before each retry, before jitter
+  const RETRY_DELAYS = [1000, 2000, 4000, 8000];
+  // Answers worth retrying: a retry still in flight, or a gateway hiccup
+  const RETRY_STATUSES = [409, 502, 503, 504];
+
   function notify(msg) {
     try {
       alert(msg);
@@ -8,22 +22,164 @@
     }
   }
 
-  async function sendAlert(lat, lon, message) {
+  function randomId() {
+    return window.crypto && crypto.randomUUID
+      ? crypto.randomUUID()
+      : Date.now().toString(36) + Math.random().toString(36).slice(2);
+  }
+
+  function sleep(ms) {
+    return new Promise(function (resolve) {
+      setTimeout(resolve, ms);
+    });
+  }
+
+  // POST JSON (or a string, as text/plain), retrying network errors and RETRY_STATUSES with backoff.
+  // Every attempt carries the same body and Idempotency-Key, so the server
+  // answers a retry with the first attempt's response. Throws once the
+  // retries run out, or at once when the device is offline.
+  async function postWithRetry(url, payload, headers) {
+    const init = {
+      method: "POST",
+      headers: Object.assign(
+        {
+          "Content-Type": typeof payload === "string" ? "text/plain" : "application/json",
+          "Idempotency-Key": randomId(),
+        },
+        headers
+      ),
+      body: typeof payload === "string" ? payload : JSON.stringify(payload),
+    };
+    for (let attempt = 0; ; attempt++) {
+      const last = attempt >= RETRY_DELAYS.length;
+      try {
+        const resp = await fetch(url, init);
+        if (last || RETRY_STATUSES.indexOf(resp.status) === -1) return resp;
+      } catch (e) {
+        if (last || !navigator.onLine) throw e;
+      }
+      await sleep(RETRY_DELAYS[attempt] * (0.5 + Math.random()));
+    }
+  }
+  // Also used by the emergency email button on the home page
+  window.sosPost = postWithRetry;
+
+  // A random id kept on this device, so repeat presses from an anonymous
+  // visitor update their open alert instead of raising new ones.
+  function deviceId() {
     try {
-      const payload = { latitude: lat, longitude: lon };
-      if (message) payload.message = message;
+      let id = localStorage.getItem(DEVICE_KEY);
+      if (!id) {
+        id = randomId();
+        localStorage.setItem(DEVICE_KEY, id);
+      }
+      return id;
+    } catch (e) {
+      return null;
+    }
+  }
 
-      const resp = await fetch("/api/sos-alert/", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(payload),
-      });
-      const j = await resp.json().catch(() => ({}));
-      if (resp.ok) notify("SOS sent — help is being notified.");
+  async function requestSync() {
+    if (!("serviceWorker" in navigator)) return;
+    const reg = await navigator.serviceWorker.getRegistration();
+    if (reg && reg.sync) await reg.sync.register(SYNC_TAG);
+  }
+
+  async function queueAlert(payload) {
+    await SOSQueue.add(Object.assign({ client_timestamp: new Date().toISOString() }, payload));
+    requestSync().catch(console.error);
+  }
+
+  async function flushQueue() {
+    if (!navigator.onLine) return;
+    try {
+      const sent = await SOSQueue.flush();
+      if (sent) notify("Your saved SOS alerts have been sent.");
+    } catch (e) {
+      console.error(e);
+    }
+  }
+
+  async function migrateLegacyQueue() {
+    let legacy;
+    try {
+      legacy = JSON.parse(localStorage.getItem(LEGACY_QUEUE_KEY)) || [];
+    } catch (e) {
+      return;
+    }
+    for (const payload of legacy) await SOSQueue.add(payload);
+    localStorage.removeItem(LEGACY_QUEUE_KEY);
+  }
+
+  function registerServiceWorker() {
+    const url = document.body.dataset.serviceWorker;
+    if (!("serviceWorker" in navigator) || !url) return;
+    navigator.serviceWorker.register(url).catch(console.error);
+    navigator.serviceWorker.ready.then(function (reg) {
+      // Tells the worker whether cached guidance pages are right for this visitor
+      reg.active.postMessage({ type: "session", signedIn: document.body.dataset.signedIn === "1" });
+    });
+    navigator.serviceWorker.addEventListener("message", function (event) {
+      if (event.data && event.data.type === "sos-sent") notify("Your saved SOS alerts have been sent.");
+    });
+  }
+
+  const CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ";
+
+  function base32(value, width) {
+    let out = "";
+    for (let i = 0; i < width; i++) {
+      out = CROCKFORD[value % 32] + out;
+      value = Math.floor(value / 32);
+    }
+    return out;
+  }
+
+  // The compact text form of an alert (see base/wire.py): about a third
+  // of the JSON request and a tenth of the JSON response.
+  function encodeCompact(payload) {
+    const lat = Math.round(payload.latitude * 1e6) + 90e6;
+    const lon = Math.round(payload.longitude * 1e6) + 180e6;
+    const seconds = Math.floor(Date.now() / 1000);
+    const tail = ["", payload.device_id || "", payload.message || ""].join("*").replace(/\*+$/, "");
+    return "1" + base32(lat, 6) + base32(lon, 6) + base32(seconds, 7) + tail;
+  }
+
+  // "OK <id>", "OK <id> R<repeats>" or "ERR <message>", as the JSON reply would say it
+  function decodeCompactReply(text) {
+    const match = /^OK (\d+)( R(\d+))?/.exec(text);
+    if (match) return { id: +match[1], coalesced: !!match[2] };
+    return { message: text.replace(/^ERR /, "") };
+  }
+
+  function slowConnection() {
+    const connection = navigator.connection;
+    return !!connection && /2g/.test(connection.effectiveType || "");
+  }
+
+  async function sendAlert(lat, lon, message) {
+    const payload = { latitude: lat, longitude: lon };
+    if (message) payload.message = message;
+    const device = deviceId();
+    if (device) payload.device_id = device;
+    try {
+      const compact = slowConnection();
+      const resp = await postWithRetry("/api/sos-alert/", compact ? encodeCompact(payload) : payload);
+      const j = compact
+        ? decodeCompactReply(await resp.text().catch(() => ""))
+        : await resp.json().catch(() => ({}));
+      if (resp.ok && j.coalesced) notify("SOS already received — help is on the way. Your location was updated.");
+      else if (resp.ok) notify("SOS sent — help is being notified.");
       else notify("Failed to send SOS: " + (j.message || resp.statusText));
     } catch (e) {
-      notify("Network error sending SOS.");
       console.error(e);
+      try {
+        await queueAlert(payload);
+        notify("No connection. Your SOS is saved and will be sent as soon as you are back online.");
+      } catch (err) {
+        console.error(err);
+        notify("Network error sending SOS.");
+      }
     }
   }
 
@@ -32,11 +188,7 @@
       const payload = { location_description: locationDescription };
       if (message) payload.message = message;
 
-      const resp = await fetch("/api/sos-alert/", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(payload),
-      });
+      const resp = await postWithRetry("/api/sos-alert/", payload);
       const j = await resp.json().catch(() => ({}));
       if (resp.ok) notify("SOS sent — help is being notified.");
       else notify("Failed to send SOS: " + (j.message || resp.statusText));
@@ -199,7 +351,11 @@
     openModal();
   }
 
+  window.addEventListener("online", flushQueue);
+
   document.addEventListener("DOMContentLoaded", function () {
+    registerServiceWorker();
+    migrateLegacyQueue().catch(console.error).then(flushQueue);
     document
       .querySelectorAll(".sos-button, .phone-sos-btn")
       .forEach(function (el) {
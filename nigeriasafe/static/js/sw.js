@@ -0,0 +1,137 @@
+// sw.js: the offline service worker. Served at /sw.js by
+// base.views.service_worker, which defines OFFLINE_CONFIG above this line
+// (see base/offline.py).
+//
+// - Guidance pages, CSS and JS are precached into a cache named after the
+//   deploy's version; older versions are deleted on activate.
+// - Anonymous visitors get guidance pages straight from the cache. Signed-in
+//   users get them from the network, because the navigation bar shows who
+//   is signed in; the cached copy is their offline fallback.
+// - Other pages come from the network; offline, they fall back to a cached
+//   copy, else the home page with its SOS button.
+// - Queued SOS alerts (sos-queue.js) are uploaded on Background Sync, when
+//   the worker starts, and when a page asks.
+importScripts(OFFLINE_CONFIG.queueScript);
+
+const PREFIX = "nigeriasafe-";
+const CACHE = PREFIX + OFFLINE_CONFIG.version;
+const STATE_CACHE = PREFIX + "state";
+const SESSION_KEY = "/__offline/signed-in";
+const SYNC_TAG = "sos-queue";
+const PAGES = new Set(OFFLINE_CONFIG.pages);
+const CDN_ORIGIN = "https://cdnjs.cloudflare.com";
+
+let signedIn = null;
+
+async function isSignedIn() {
+  if (signedIn === null) {
+    const saved = await caches.match(SESSION_KEY, { cacheName: STATE_CACHE });
+    // Unknown is treated as signed in: a live page is never wrong
+    signedIn = saved ? (await saved.text()) === "1" : true;
+  }
+  return signedIn;
+}
+
+async function setSignedIn(value) {
+  signedIn = value;
+  const cache = await caches.open(STATE_CACHE);
+  await cache.put(SESSION_KEY, new Response(value ? "1" : "0"));
+}
+
+async function precache() {
+  const cache = await caches.open(CACHE);
+  // One missing page must not stop the rest from being cached
+  await Promise.all(OFFLINE_CONFIG.precache.map(async function (url) {
+    try {
+      // The anonymous copy: the pre-rendered one, and the same for everyone
+      const resp = await fetch(new Request(url, { credentials: "omit", cache: "no-cache" }));
+      if (resp.ok) await cache.put(url, resp);
+    } catch (e) {
+      console.error(e);
+    }
+  }));
+}
+
+self.addEventListener("install", function (event) {
+  event.waitUntil(precache().then(function () {
+    return self.skipWaiting();
+  }));
+});
+
+self.addEventListener("activate", function (event) {
+  event.waitUntil((async function () {
+    const names = await caches.keys();
+    await Promise.all(names.filter(function (name) {
+      return name.startsWith(PREFIX) && name !== CACHE && name !== STATE_CACHE;
+    }).map(function (name) {
+      return caches.delete(name);
+    }));
+    await self.clients.claim();
+    await flushQueue().catch(console.error);
+  })());
+});
+
+async function fromCache(request, key) {
+  return caches.match(key || request, { cacheName: CACHE });
+}
+
+async function cacheFirst(request, key) {
+  const cached = await fromCache(request, key);
+  if (cached) return cached;
+  const resp = await fetch(request);
+  if (resp.ok || resp.type === "opaque") {
+    const copy = resp.clone();
+    caches.open(CACHE).then(function (cache) {
+      return cache.put(key || request, copy);
+    });
+  }
+  return resp;
+}
+
+async function networkFirst(request, key) {
+  try {
+    return await fetch(request);
+  } catch (e) {
+    return (await fromCache(request, key)) || (await fromCache(request, OFFLINE_CONFIG.fallback)) || Response.error();
+  }
+}
+
+async function navigate(request, path) {
+  if (PAGES.has(path) && !(await isSignedIn())) return cacheFirst(request, path);
+  return networkFirst(request, path);
+}
+
+self.addEventListener("fetch", function (event) {
+  const request = event.request;
+  if (request.method !== "GET") return;
+  const url = new URL(request.url);
+  if (url.origin === self.location.origin) {
+    if (request.mode === "navigate") {
+      event.respondWith(navigate(request, url.pathname));
+    } else if (url.pathname.startsWith(OFFLINE_CONFIG.staticUrl) || url.pathname.startsWith("/img/")) {
+      // Kept until the next version, which any change to a precached file brings
+      event.respondWith(cacheFirst(request, url.pathname));
+    }
+  } else if (url.origin === CDN_ORIGIN) {
+    event.respondWith(cacheFirst(request));
+  }
+});
+
+async function flushQueue() {
+  const sent = await SOSQueue.flush();
+  if (!sent) return;
+  const windows = await self.clients.matchAll({ type: "window" });
+  windows.forEach(function (client) {
+    client.postMessage({ type: "sos-sent", count: sent });
+  });
+}
+
+self.addEventListener("sync", function (event) {
+  if (event.tag === SYNC_TAG) event.waitUntil(flushQueue());
+});
+
+self.addEventListener("message", function (event) {
+  const data = event.data || {};
+  if (data.type === "session") event.waitUntil(setSignedIn(!!data.signedIn));
+  else if (data.type === "flush") event.waitUntil(flushQueue().catch(console.error));
+});